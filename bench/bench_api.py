@@ -0,0 +1,76 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+__author__ = 'Gennady Kovalev <gik@bigur.ru>'
+__copyright__ = '(c) 2015-2016 Business group for development management'
+__licence__ = 'GPL'
+
+# Benchmark of the read API on a synthetic database: latest readings from
+# the database, from the cache and over HTTP. Usage: bench_api.py [ROWS]
+# [PATH]
+
+import os
+import sys
+import time
+import random
+import sqlite3
+import urllib2
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), '..'))
+
+import mercury.storage as storage
+import mercury.api as api
+
+import bench_schema
+
+
+def measure(title, func, number):
+    started = time.time()
+    for i in xrange(number):
+        func()
+    elapsed = time.time() - started
+    print('{: <35} {: >12.1f} us/query'.format(title,
+                                               elapsed / number * 1000000))
+
+
+def main():
+    rows = int(sys.argv[1]) if len(sys.argv) > 1 else 500000
+    path = sys.argv[2] if len(sys.argv) > 2 else 'bench_api.db'
+    if os.path.exists(path):
+        os.unlink(path)
+
+    db = sqlite3.connect(path)
+    bench_schema.populate(db, rows)
+    db.close()
+    db = storage.connect(path)
+
+    rnd = random.Random(1)
+    cache = api.LatestReadings()
+    server = api.Server(path, ('127.0.0.1', 0), cache)
+    server.start()
+    url = 'http://{}:{}'.format(*server.address)
+
+    def load(hub):
+        return db.execute(api.SQL_SELECT_LATEST, (hub,)).fetchall()
+
+    try:
+        measure('hub from database',
+                lambda: load(rnd.choice(bench_schema.HUBS)), 20)
+        measure('hub from cache',
+                lambda: cache.get(rnd.choice(bench_schema.HUBS), load), 1000)
+        measure('counter from cache',
+                lambda: cache.get(rnd.choice(bench_schema.HUBS), load,
+                                  rnd.randrange(bench_schema.COUNTERS)),
+                10000)
+        measure('counter over http',
+                lambda: urllib2.urlopen('{}/latest?hub={}&counter={}'.format(
+                            url, rnd.choice(bench_schema.HUBS),
+                            rnd.randrange(bench_schema.COUNTERS))).read(),
+                500)
+    finally:
+        server.stop()
+        db.close()
+        os.unlink(path)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,117 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+__author__ = 'Gennady Kovalev <gik@bigur.ru>'
+__copyright__ = '(c) 2015-2016 Business group for development management'
+__licence__ = 'GPL'
+
+# Benchmark of the shared bus on the hub emulator: throughput of single
+# commands against batches, and latency of an interactive command while
+# bulk downloads hold the bus, with and without priority. Usage:
+# bench_bus.py [BULK THREADS] [BYTE DELAY]
+
+import os
+import sys
+import time
+import threading
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), '..'))
+
+import mercury
+import mercury.command as command
+import mercury.emulator as emulator
+
+
+def best(func, runs=5):
+    # The best run, others are slowed down by the rest of the system
+    result = None
+    for i in xrange(runs):
+        started = time.time()
+        func()
+        elapsed = time.time() - started
+        result = elapsed if result is None else min(result, elapsed)
+    return result
+
+
+def throughput(path, counters):
+    hub = mercury.Hub(path, 0x2f01)
+
+    def single():
+        for counter in xrange(counters):
+            hub.execute(command.GetHistory(counter))
+
+    def batch():
+        for result in hub.execute_many(command.GetHistory(x)
+                                       for x in xrange(counters)):
+            pass
+
+    print('{: <35} {: >10.1f} cmd/s'.format('execute',
+                                             counters / best(single)))
+    print('{: <35} {: >10.1f} cmd/s'.format('execute_many',
+                                             counters / best(batch)))
+
+
+def contention(path, threads, counters, priority):
+    # Bulk threads download histories in a loop, the interactive one asks
+    # config every 20 ms
+    stop = threading.Event()
+    done = [0]
+
+    def bulk():
+        hub = mercury.Hub(path, 0x2f01)
+        while not stop.is_set():
+            for result in hub.execute_many(command.GetHistory(x)
+                                           for x in xrange(counters)):
+                done[0] += 1
+                if stop.is_set():
+                    break
+
+    workers = [threading.Thread(target=bulk) for i in xrange(threads)]
+    for worker in workers:
+        worker.start()
+
+    hub = mercury.Hub(path, 0x2f01)
+    latencies = []
+    started = time.time()
+    try:
+        time.sleep(0.1)
+        for i in xrange(100):
+            begin = time.time()
+            hub.execute(command.GetConfig(), priority)
+            latencies.append(time.time() - begin)
+            time.sleep(0.02)
+    finally:
+        stop.set()
+        for worker in workers:
+            worker.join()
+    elapsed = time.time() - started
+
+    latencies.sort()
+    return (latencies[len(latencies) // 2],
+            latencies[int(len(latencies) * 0.99)], done[0] / elapsed)
+
+
+def main():
+    threads = int(sys.argv[1]) if len(sys.argv) > 1 else 4
+    byte_delay = float(sys.argv[2]) if len(sys.argv) > 2 else 0.0001
+
+    hubs = emulator.Emulator(0x2f01, capacity=256, meters=256,
+                             byte_delay=byte_delay, seed=1)
+    path = hubs.start()
+    try:
+        throughput(path, 256)
+        print('')
+        print('{: <24} {: >10} {: >10} {: >12}'.format(
+                    '{} bulk threads'.format(threads), 'p50, ms', 'p99, ms',
+                    'bulk cmd/s'))
+        for title, priority in [('same priority', command.PRIORITY_BULK),
+                                ('interactive priority',
+                                 command.PRIORITY_INTERACTIVE)]:
+            median, worst, rate = contention(path, threads, 256, priority)
+            print('{: <24} {: >10.1f} {: >10.1f} {: >12.1f}'.format(
+                        title, median * 1000, worst * 1000, rate))
+    finally:
+        hubs.stop()
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,93 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+__author__ = 'Gennady Kovalev <gik@bigur.ru>'
+__copyright__ = '(c) 2015-2016 Business group for development management'
+__licence__ = 'GPL'
+
+# Micro-benchmark of request frame encoding: bit-by-bit CRC24 and
+# property based frame assembly against table CRC24 and cached frames.
+
+import os
+import sys
+import struct
+import timeit
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), '..'))
+
+import mercury.command as command
+
+
+def legacy_crc24(octets):
+    poly = 0x01864cfb
+    crc = 0x00b704ce
+    for octet in octets:
+        crc ^= (ord(octet) << 16)
+        for i in xrange(8):
+            crc <<= 1
+            if crc & 0x1000000: crc ^= poly
+    return crc & 0xffffff
+
+
+def legacy_checksum(octets):
+    s = 0
+    for octet in octets:
+        s += ord(octet)
+    s -= 1
+    return s & 0xff
+
+
+def legacy_request(source, destination, code, data):
+    payload = struct.pack('<B{}s'.format(len(data)), code, data)
+    length = struct.pack('<B', len(payload))
+    crc = struct.pack('<I', legacy_crc24(
+                struct.pack('<HHs', source, destination, length)))[:-1]
+    return struct.pack('<3sHHs{}ss'.format(len(payload)),
+                       crc, source, destination, length, payload,
+                       struct.pack('<B', legacy_checksum(payload)))
+
+
+def poll_cycle_legacy(counters):
+    for counter in xrange(counters):
+        legacy_request(0xffff, 0x2f01, 0x85, struct.pack('<H', counter))
+
+
+def poll_cycle(counters):
+    for counter in xrange(counters):
+        cmd = command.GetHistory(counter)
+        cmd.source = 0xffff
+        cmd.destination = 0x2f01
+        cmd.request
+
+
+def main():
+    counters = 1024
+    repeat = 20
+
+    for counter in xrange(counters):
+        cmd = command.GetHistory(counter)
+        cmd.source = 0xffff
+        cmd.destination = 0x2f01
+        assert cmd.request == legacy_request(0xffff, 0x2f01, 0x85,
+                                             struct.pack('<H', counter))
+
+    data = os.urandom(64)
+    assert command.crc24(data) == legacy_crc24(data)
+
+    results = [
+        ('crc24, bit loop (64 bytes)',
+                lambda: legacy_crc24(data), 10000),
+        ('crc24, table (64 bytes)',
+                lambda: command.crc24(data), 10000),
+        ('poll cycle, legacy encoding ({} counters)'.format(counters),
+                lambda: poll_cycle_legacy(counters), repeat),
+        ('poll cycle, cached frames ({} counters)'.format(counters),
+                lambda: poll_cycle(counters), repeat),
+    ]
+    for title, func, number in results:
+        elapsed = min(timeit.repeat(func, number=number, repeat=3))
+        print('{: <45} {: >10.2f} us/op'.format(title,
+                                                elapsed / number * 1e6))
+
+
+if __name__ == '__main__':
+    main()
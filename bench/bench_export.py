@@ -0,0 +1,71 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+__author__ = 'Gennady Kovalev <gik@bigur.ru>'
+__copyright__ = '(c) 2015-2016 Business group for development management'
+__licence__ = 'GPL'
+
+# Benchmark of bulk export on a synthetic database. Every format is
+# exported in a child process, so its peak memory is measured alone.
+# Usage: bench_export.py [ROWS] [PATH]
+
+import os
+import sys
+import time
+import sqlite3
+import resource
+import tempfile
+import subprocess
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), '..'))
+
+import mercury.storage as storage
+import mercury.export as export
+
+import bench_schema
+
+
+def run(frmt, dbase, path):
+    db = storage.connect(dbase)
+    started = time.time()
+    try:
+        with open(path, 'wb') as fh:
+            count = export.export(db, fh, frmt)
+    except export.ExportError as e:
+        print('{: <8} {}'.format(frmt, e))
+        return
+    elapsed = time.time() - started
+    print('{: <8} {: >9d} {: >9.2f} {: >12d} {: >9d}'.format(
+            frmt, count, elapsed, os.path.getsize(path),
+            resource.getrusage(resource.RUSAGE_SELF).ru_maxrss // 1024))
+
+
+def main():
+    if len(sys.argv) > 1 and sys.argv[1] == '--run':
+        return run(*sys.argv[2:])
+
+    rows = int(sys.argv[1]) if len(sys.argv) > 1 else 1000000
+    path = sys.argv[2] if len(sys.argv) > 2 else 'bench_export.db'
+    if os.path.exists(path):
+        os.unlink(path)
+    db = sqlite3.connect(path)
+    bench_schema.populate(db, rows)
+    db.close()
+    storage.connect(path).close()
+
+    print('{: <8} {: >9} {: >9} {: >12} {: >9}'.format(
+            'format', 'rows', 'time, s', 'size', 'rss, MB'))
+    workdir = tempfile.mkdtemp()
+    try:
+        for frmt in sorted(export.FORMATS):
+            output = os.path.join(workdir, 'export.' + frmt)
+            subprocess.check_call([sys.executable, __file__, '--run', frmt,
+                                   path, output])
+            if os.path.exists(output):
+                os.unlink(output)
+    finally:
+        os.rmdir(workdir)
+        os.unlink(path)
+
+
+if __name__ == '__main__':
+    main()
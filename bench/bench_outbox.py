@@ -0,0 +1,121 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+__author__ = 'Gennady Kovalev <gik@bigur.ru>'
+__copyright__ = '(c) 2015-2016 Business group for development management'
+__licence__ = 'GPL'
+
+# Delivery of outbox through portal failures. Readings are queued in
+# batches, the worker sends them to the portal stub while it refuses
+# sessions, fails documents, drops replies and goes down. Every reading
+# must reach the portal, dropped replies may only cause whole duplicate
+# documents.
+
+import os
+import sys
+import time
+import shutil
+import logging
+import argparse
+import datetime
+import tempfile
+
+ROOT = os.path.join(os.path.dirname(os.path.abspath(__file__)), '..')
+sys.path.insert(0, ROOT)
+
+import mercury.storage as storage
+import mercury.upload as upload
+import mercury.outbox as outbox
+import portal_stub
+
+
+SQL_INSERT_READING = '''\
+INSERT INTO
+  data (hub, counter, level, type, date, value)
+VALUES
+  (?, ?, 0, 1, ?, ?)'''
+
+
+def add_readings(db, count, start):
+    date = datetime.datetime(2016, 1, 1)
+    db.executemany(SQL_INSERT_READING,
+                   ((1, x % 256, date + datetime.timedelta(minutes=x), x)
+                    for x in xrange(start, start + count)))
+    db.commit()
+
+
+def wait(condition, timeout):
+    deadline = time.time() + timeout
+    while not condition():
+        if time.time() > deadline:
+            return False
+        time.sleep(0.05)
+    return True
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument('--readings', type=int, default=10000)
+    parser.add_argument('--page-size', type=int, default=500)
+    args = parser.parse_args()
+
+    logging.getLogger('energo').addHandler(logging.NullHandler())
+
+    directory = tempfile.mkdtemp()
+    stub = portal_stub.Portal()
+    url = stub.start()
+    try:
+        path = os.path.join(directory, 'mercury.db')
+        db = storage.connect(path)
+        worker = outbox.Worker(path,
+                               lambda: upload.Portal(url, 'login', 'secret',
+                                                     True),
+                               interval=0.5, backoff=0.1, max_backoff=0.4)
+        worker.start()
+
+        scenarios = [
+            ('clean', {}),
+            ('fail_auth', {'fail_auth': 3}),
+            ('fail_documents', {'fail_documents': 5}),
+            ('drop_documents', {'drop_documents': 2}),
+            ('outage', {'outage': True}),
+        ]
+        part = args.readings // len(scenarios)
+        added = 0
+        for name, failures in scenarios:
+            for key, value in failures.iteritems():
+                setattr(stub, key, value)
+            started = time.time()
+            add_readings(db, part, added)
+            added += part
+            outbox.fill(db, args.page_size)
+            worker.wake()
+            if stub.outage:
+                time.sleep(1)
+                count, readings = outbox.backlog(db)
+                print '{:16} backlog {} batches, {} readings'.format(
+                                                name, count, readings)
+                stub.outage = False
+            ok = wait(lambda: outbox.backlog(db)[0] == 0, 30)
+            print '{:16} {:6.2f}s {}'.format(name, time.time() - started,
+                                            'ok' if ok else 'STUCK')
+
+        worker.stop()
+        worker.join()
+
+        values = []
+        for document in stub.documents:
+            values.extend(int(x.split('<')[0])
+                          for x in document.split('">')[1:])
+        unique = set(values)
+        print 'readings {}, delivered {}, duplicates {}, lost {}'.format(
+                        added, len(unique), len(values) - len(unique),
+                        len(set(xrange(added)) - unique))
+        print 'documents {}, sessions {}'.format(len(stub.documents),
+                                                 stub.sessions)
+    finally:
+        stub.stop()
+        shutil.rmtree(directory)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,183 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+__author__ = 'Gennady Kovalev <gik@bigur.ru>'
+__copyright__ = '(c) 2015-2016 Business group for development management'
+__licence__ = 'GPL'
+
+# End-to-end benchmark of poll cycles. The hub emulator runs in a child
+# process on a pseudo-terminal, the command line tool runs in this process
+# so commands, CPU time and database time are measured here.
+
+import os
+import sys
+import time
+import runpy
+import sqlite3
+import argparse
+import tempfile
+import subprocess
+
+ROOT = os.path.join(os.path.dirname(os.path.abspath(__file__)), '..')
+sys.path.insert(0, ROOT)
+
+import mercury
+import portal_stub
+
+
+CLI = os.path.join(ROOT, 'bin', 'mercury_cli')
+
+
+class Counters(object):
+
+    def __init__(self):
+        self.commands = 0
+        self.db_time = 0
+
+counters = Counters()
+
+
+class TimedCursor(sqlite3.Cursor):
+
+    def execute(self, *args):
+        started = time.time()
+        try:
+            return super(TimedCursor, self).execute(*args)
+        finally:
+            counters.db_time += time.time() - started
+
+    def executemany(self, *args):
+        started = time.time()
+        try:
+            return super(TimedCursor, self).executemany(*args)
+        finally:
+            counters.db_time += time.time() - started
+
+
+class TimedConnection(sqlite3.Connection):
+
+    def cursor(self, factory=TimedCursor):
+        return super(TimedConnection, self).cursor(factory)
+
+    def execute(self, *args):
+        return self.cursor().execute(*args)
+
+    def commit(self):
+        started = time.time()
+        try:
+            return super(TimedConnection, self).commit()
+        finally:
+            counters.db_time += time.time() - started
+
+
+def instrument():
+    connect = sqlite3.connect
+
+    def timed_connect(*args, **kwargs):
+        kwargs.setdefault('factory', TimedConnection)
+        return connect(*args, **kwargs)
+    sqlite3.connect = timed_connect
+
+    # Single and batched commands go through _run
+    run = mercury.Hub._run
+
+    def counted_run(self, cmd, *args):
+        counters.commands += 1
+        return run(self, cmd, *args)
+    mercury.Hub._run = counted_run
+
+
+def start_emulator(args):
+    cmd = [sys.executable, '-m', 'mercury.emulator',
+           '--address', hex(args.address),
+           '--capacity', str(args.capacity),
+           '--meters', str(args.meters),
+           '--history', str(args.history),
+           '--byte-delay', str(args.byte_delay),
+           '--noise', str(args.noise),
+           '--drop', str(args.drop),
+           '--seed', '1']
+    process = subprocess.Popen(cmd, cwd=ROOT, stdout=subprocess.PIPE,
+                               env=dict(os.environ, PYTHONPATH=ROOT))
+    device = process.stdout.readline().strip()
+    return process, device
+
+
+def run_cli(argv):
+    counters.commands = 0
+    counters.db_time = 0
+    stdout = sys.stdout
+    sys.argv = [CLI] + argv
+    sys.stdout = open(os.devnull, 'w')
+    cpu = sum(os.times()[:2])
+    started = time.time()
+    try:
+        runpy.run_path(CLI, run_name='__main__')
+    except SystemExit as e:
+        if e.code:
+            raise RuntimeError('{} failed with {}'.format(argv, e.code))
+    finally:
+        sys.stdout.close()
+        sys.stdout = stdout
+    return (time.time() - started, sum(os.times()[:2]) - cpu,
+            counters.commands, counters.db_time)
+
+
+def report(title, result):
+    wall, cpu, commands, db_time = result
+    print('{: <32} {: >8d} {: >9.3f} {: >9.3f} {: >9.1f} {: >9.3f}'.format(
+            title, commands, wall, cpu, commands / wall if wall else 0,
+            db_time))
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--address', type=lambda x: int(x, 16),
+                        default=0x2f01)
+    parser.add_argument('--capacity', type=int, default=1024)
+    parser.add_argument('--meters', type=int, default=100)
+    parser.add_argument('--history', type=int, default=12)
+    parser.add_argument('--byte-delay', type=float, default=0)
+    parser.add_argument('--noise', type=float, default=0)
+    parser.add_argument('--drop', type=float, default=0)
+    args = parser.parse_args()
+
+    instrument()
+    process, device = start_emulator(args)
+    portal = portal_stub.Portal()
+    url = portal.start()
+    workdir = tempfile.mkdtemp()
+    dbase = os.path.join(workdir, 'bench.db')
+    credentials = os.path.join(workdir, 'credentials.txt')
+    with open(credentials, 'w') as fh:
+        fh.write('login\npassword\n')
+
+    common = ['--device', device, '--address', hex(args.address),
+              '--dbase', dbase, '--timeout', '2']
+    try:
+        print('{: <32} {: >8} {: >9} {: >9} {: >9} {: >9}'.format(
+                'scenario', 'commands', 'wall, s', 'cpu, s', 'cmd/s',
+                'db, s'))
+        report('print last-readings',
+               run_cli(['print', 'last-readings'] + common))
+        report('poll, first',
+               run_cli(['poll'] + common))
+        report('poll, steady',
+               run_cli(['poll'] + common))
+        report('poll, full',
+               run_cli(['poll', '--full-sweep', '--full-resync'] + common))
+        report('upload, all',
+               run_cli(['upload', '--dbase', dbase, '--all', '--url', url,
+                        '--credentials', credentials]))
+        print('{} readings uploaded in {} documents'.format(
+                portal.readings, len(portal.documents)))
+    finally:
+        portal.stop()
+        process.terminate()
+        process.wait()
+        for name in os.listdir(workdir):
+            os.unlink(os.path.join(workdir, name))
+        os.rmdir(workdir)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,125 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+__author__ = 'Gennady Kovalev <gik@bigur.ru>'
+__copyright__ = '(c) 2015-2016 Business group for development management'
+__licence__ = 'GPL'
+
+# Benchmark of report queries on a synthetic database: monthly values
+# from data table against the rollup. Pages rendered both ways must be
+# the same and the rollup window must be read from its covering index.
+# Usage: bench_report.py [ROWS] [PATH]
+
+import os
+import sys
+import time
+import sqlite3
+import datetime
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), '..'))
+
+import mercury.storage as storage
+import mercury.report as report
+
+import bench_schema
+
+
+SQL_MONTHLY_VALUES_DATA = '''\
+SELECT
+  counter,
+  strftime('%Y-%m', date) AS month,
+  MAX(CASE WHEN type > 0 THEN date END),
+  value
+FROM data
+WHERE
+  date >= ? AND
+  date < ?
+GROUP BY counter, month'''
+
+
+def data_values(db, months):
+    # Report values computed from data as before rollups, the month before
+    # the window is read for consumption of the oldest month
+    window = report.report_months(len(months) + 1, months[0])
+    end = storage.month_start(months[0] + datetime.timedelta(days=31))
+    index = dict((x.strftime('%Y-%m'), x) for x in window)
+    empty = dict((x, (None, None)) for x in window)
+    found = {}
+    for counter, month, date, value in db.execute(
+                SQL_MONTHLY_VALUES_DATA, (min(window), end)):
+        if counter not in found:
+            found[counter] = dict(empty)
+        if date is not None:
+            date = datetime.datetime.strptime(date, '%Y-%m-%d %H:%M:%S')
+            found[counter][index[month]] = (date, value)
+
+    values = {}
+    for counter, series in found.iteritems():
+        values[counter] = {}
+        for month, prev in zip(window, window[1:]):
+            date, value = series[month]
+            values[counter][month] = (date, value, storage.consumption(
+                                                    value, series[prev][1]))
+    return values
+
+
+def measure(title, func, number=5):
+    started = time.time()
+    for i in xrange(number):
+        result = func()
+    elapsed = time.time() - started
+    print('{: <35} {: >12.3f} ms/query'.format(title,
+                                               elapsed / number * 1000))
+    return result
+
+
+def main():
+    rows = int(sys.argv[1]) if len(sys.argv) > 1 else 2000000
+    path = sys.argv[2] if len(sys.argv) > 2 else 'bench_report.db'
+    if os.path.exists(path):
+        os.unlink(path)
+
+    db = sqlite3.connect(path)
+    per_series = bench_schema.populate(db, rows)
+    db.close()
+
+    started = time.time()
+    db = storage.connect(path)
+    print('Migrated {} rows in {:.1f}s'.format(
+                        db.execute('SELECT COUNT(*) FROM data').fetchone()[0],
+                        time.time() - started))
+    print('Rollup rows: {}'.format(
+                        db.execute('SELECT COUNT(*) FROM rollup').fetchone()[0]))
+
+    today = (bench_schema.START +
+             datetime.timedelta(weeks=per_series)).date()
+    months = report.report_months(6, today)
+
+    plan = ' '.join(x[-1] for x in db.execute(
+                        'EXPLAIN QUERY PLAN ' + report.SQL_MONTHLY_VALUES,
+                        (min(months).strftime('%Y-%m'),
+                         max(months).strftime('%Y-%m'))))
+    print('Rollup plan: {}'.format(plan))
+
+    raw = measure('monthly values from data',
+                  lambda: data_values(db, months))
+    values = measure('monthly values from rollup',
+                     lambda: report.monthly_values(db, months))
+    print('Counters: {} / {}'.format(len(raw), len(values)))
+
+    now = datetime.datetime.combine(today, datetime.time(12))
+    same = report.render_html(raw, months, now) == \
+        report.render_html(values, months, now)
+    covering = 'COVERING INDEX rollup_window' in plan and \
+        'TEMP B-TREE' not in plan
+    print('Pages are {}, window is {}read from covering index'.format(
+                    'the same' if same else 'DIFFERENT',
+                    '' if covering else 'NOT '))
+    measure('rebuild rollups', lambda: storage.rebuild_rollups(db), 1)
+
+    db.close()
+    os.unlink(path)
+    return 0 if same and covering else 1
+
+
+if __name__ == '__main__':
+    sys.exit(main())
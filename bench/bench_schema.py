@@ -0,0 +1,170 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+__author__ = 'Gennady Kovalev <gik@bigur.ru>'
+__copyright__ = '(c) 2015-2016 Business group for development management'
+__licence__ = 'GPL'
+
+# Benchmark of data table lookups on a synthetic database, before and
+# after schema migration. Usage: bench_schema.py [ROWS] [PATH]
+
+import os
+import sys
+import time
+import random
+import sqlite3
+import datetime
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), '..'))
+
+import mercury.storage as storage
+
+
+SQL_SEARCH_MONTH_RECORD = '''\
+SELECT
+  hub, counter, date, value
+FROM data
+WHERE
+  hub = ? AND
+  counter = ? AND
+  type = ? AND
+  date >= ? AND
+  date < ? AND
+  value = ?
+ORDER BY date DESC
+LIMIT 1'''
+
+SQL_GET_LAST_VALUE = '''\
+SELECT
+  date, value
+FROM
+  data
+WHERE
+  counter = ? AND
+  type > 0 AND
+  date >= ? AND
+  date < ?
+ORDER BY date DESC
+LIMIT 1;
+'''
+
+SQL_UPLOAD_SELECT = '''\
+SELECT
+    hub, counter, type, date, value, level
+FROM data
+WHERE exported=0
+ORDER BY date
+LIMIT 100'''
+
+SQL_UPLOAD_MARK_EXPORTED = '''\
+UPDATE data
+SET exported=1
+WHERE
+  hub=? AND
+  counter=? AND
+  type=? AND
+  date=? AND
+  value=?
+'''
+
+HUBS = [0x2f01, 0x2f02, 0x2f03, 0x2f04]
+COUNTERS = 512
+TYPES = [1, 2]
+START = datetime.datetime(2010, 1, 1)
+
+
+def populate(db, rows):
+    per_series = rows // (len(HUBS) * COUNTERS * len(TYPES))
+
+    def generate():
+        for hub in HUBS:
+            for counter in xrange(COUNTERS):
+                for dtype in TYPES:
+                    for i in xrange(per_series):
+                        date = START + datetime.timedelta(weeks=i)
+                        exported = i < per_series - 1
+                        yield (hub, counter, 1, dtype, date, i * 10, exported)
+
+    db.execute(storage.SQL_CREATE_TABLE)
+    db.executemany('INSERT INTO data (hub, counter, level, type, date, '
+                   'value, exported) VALUES (?, ?, ?, ?, ?, ?, ?)',
+                   generate())
+    db.commit()
+    return per_series
+
+
+def measure(title, func, number):
+    started = time.time()
+    for i in xrange(number):
+        func()
+    elapsed = time.time() - started
+    print('{: <35} {: >12.3f} ms/query'.format(title,
+                                               elapsed / number * 1000))
+
+
+def run_queries(db, per_series):
+    rnd = random.Random(1)
+    c = db.cursor()
+
+    def search_month_record():
+        i = rnd.randrange(per_series)
+        date = START + datetime.timedelta(weeks=i)
+        c.execute(SQL_SEARCH_MONTH_RECORD,
+                  (rnd.choice(HUBS), rnd.randrange(COUNTERS), 1,
+                   storage.month_start(date),
+                   storage.month_start(date) + datetime.timedelta(days=31),
+                   i * 10))
+        c.fetchall()
+
+    def get_last_value():
+        date = START + datetime.timedelta(weeks=rnd.randrange(per_series))
+        c.execute(SQL_GET_LAST_VALUE,
+                  (rnd.randrange(COUNTERS), storage.month_start(date),
+                   storage.month_start(date) + datetime.timedelta(days=31)))
+        c.fetchall()
+
+    def upload_select():
+        c.execute(SQL_UPLOAD_SELECT)
+        c.fetchall()
+
+    def mark_exported():
+        i = per_series - 1
+        c.execute(SQL_UPLOAD_MARK_EXPORTED,
+                  (rnd.choice(HUBS), rnd.randrange(COUNTERS), 1,
+                   START + datetime.timedelta(weeks=i), i * 10))
+
+    measure('search month record', search_month_record, 20)
+    measure('get last value', get_last_value, 20)
+    measure('upload select', upload_select, 20)
+    measure('mark exported', mark_exported, 20)
+    db.rollback()
+
+
+def main():
+    rows = int(sys.argv[1]) if len(sys.argv) > 1 else 2000000
+    path = sys.argv[2] if len(sys.argv) > 2 else 'bench_schema.db'
+    if os.path.exists(path):
+        os.unlink(path)
+
+    db = sqlite3.connect(path)
+    started = time.time()
+    per_series = populate(db, rows)
+    count = db.execute('SELECT COUNT(*) FROM data').fetchone()[0]
+    print('Populated {} rows in {:.1f}s'.format(count, time.time() - started))
+
+    print('\nSchema version {}'.format(storage.schema_version(db)))
+    run_queries(db, per_series)
+    db.close()
+
+    started = time.time()
+    db = storage.connect(path)
+    print('\nMigrated in {:.1f}s'.format(time.time() - started))
+
+    print('\nSchema version {}'.format(storage.schema_version(db)))
+    run_queries(db, per_series)
+    db.close()
+
+    os.unlink(path)
+
+
+if __name__ == '__main__':
+    main()
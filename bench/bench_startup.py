@@ -0,0 +1,83 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+__author__ = 'Gennady Kovalev <gik@bigur.ru>'
+__copyright__ = '(c) 2015-2016 Business group for development management'
+__licence__ = 'GPL'
+
+# Startup time of every subcommand: interpreter start, argument parsing
+# and imports of the subcommand module, the command itself is not run.
+# The package is copied and compiled first, as it is when installed.
+# "all" imports every subcommand, as the flat script did.
+# Usage: bench_startup.py [RUNS]
+
+import os
+import sys
+import time
+import shutil
+import tempfile
+import compileall
+import subprocess
+
+ROOT = os.path.join(os.path.dirname(os.path.abspath(__file__)), '..')
+
+SCRIPT = '''\
+import sys
+from mercury import cli
+if sys.argv[1] == 'all':
+    for name, _ in cli.COMMANDS:
+        cli.load(name)
+else:
+    args = cli.make_parser().parse_args(sys.argv[1:])
+    cli.load(args.command)
+'''
+
+COMMANDS = [
+    ['print', 'address'],
+    ['print', 'hubs'],
+    ['config'],
+    ['poll'],
+    ['report', 'report.html'],
+    ['upload'],
+    ['export', 'readings.csv'],
+    ['retention'],
+    ['discover'],
+    ['daemon', 'mercury.ini'],
+    ['serve', '8180'],
+    ['all'],
+]
+
+
+def measure(argv, runs, cwd):
+    # The best run, others are slowed down by the rest of the system
+    best = None
+    for i in xrange(runs):
+        started = time.time()
+        subprocess.check_call(argv, cwd=cwd)
+        elapsed = time.time() - started
+        best = elapsed if best is None else min(best, elapsed)
+    return best
+
+
+def main():
+    runs = int(sys.argv[1]) if len(sys.argv) > 1 else 20
+    workdir = tempfile.mkdtemp()
+    try:
+        shutil.copytree(os.path.join(ROOT, 'mercury'),
+                        os.path.join(workdir, 'mercury'))
+        compileall.compile_dir(os.path.join(workdir, 'mercury'), quiet=True)
+
+        interpreter = measure([sys.executable, '-c', 'pass'], runs, workdir)
+        print('{: <24} {: >8.1f} ms'.format('interpreter',
+                                            interpreter * 1000))
+        for command in COMMANDS:
+            elapsed = measure([sys.executable, '-c', SCRIPT] + command, runs,
+                              workdir)
+            print('{: <24} {: >8.1f} ms {: >+8.1f} ms'.format(
+                        ' '.join(command), elapsed * 1000,
+                        (elapsed - interpreter) * 1000))
+    finally:
+        shutil.rmtree(workdir)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,109 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+__author__ = 'Gennady Kovalev <gik@bigur.ru>'
+__copyright__ = '(c) 2015-2016 Business group for development management'
+__licence__ = 'GPL'
+
+# Bulk upload against the portal stub: the backlog is packed into pages,
+# all pages are sent gzipped within one session which is closed at the
+# end, and upload interrupted by a failed page resumes from it without
+# duplicates.
+
+import os
+import sys
+import time
+import shutil
+import logging
+import argparse
+import datetime
+import tempfile
+
+ROOT = os.path.join(os.path.dirname(os.path.abspath(__file__)), '..')
+sys.path.insert(0, ROOT)
+
+import mercury.storage as storage
+import mercury.upload as upload
+import mercury.outbox as outbox
+import portal_stub
+
+
+SQL_INSERT_READING = '''\
+INSERT INTO
+  data (hub, counter, level, type, date, value)
+VALUES
+  (?, ?, 0, 1, ?, ?)'''
+
+
+def add_readings(db, count):
+    date = datetime.datetime(2016, 1, 1)
+    db.executemany(SQL_INSERT_READING,
+                   ((1, x % 256, date + datetime.timedelta(minutes=x), x)
+                    for x in xrange(count)))
+    db.commit()
+
+
+def delivered(stub):
+    values = []
+    for document in stub.documents:
+        values.extend(int(x.split('<')[0])
+                      for x in document.split('">')[1:])
+    return values
+
+
+def check(title, ok):
+    print '{: <40} {}'.format(title, 'ok' if ok else 'FAILED')
+    return ok
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument('--readings', type=int, default=10000)
+    parser.add_argument('--page-size', type=int, default=500)
+    args = parser.parse_args()
+
+    logging.getLogger('energo').addHandler(logging.NullHandler())
+
+    directory = tempfile.mkdtemp()
+    stub = portal_stub.Portal()
+    url = stub.start()
+    try:
+        db = storage.connect(os.path.join(directory, 'mercury.db'))
+        add_readings(db, args.readings)
+        pages = -(-args.readings // args.page_size)
+
+        started = time.time()
+        outbox.fill(db, args.page_size)
+        stub.fail_documents = 1
+        stub.fail_documents_after = pages // 2
+        try:
+            with upload.Portal(url, 'login', 'secret', True) as portal:
+                first = outbox.send(db, portal, backoff=0)
+        except upload.UploadError:
+            first = None
+        with upload.Portal(url, 'login', 'secret', True) as portal:
+            second = outbox.send(db, portal, backoff=0)
+        elapsed = time.time() - started
+
+        values = delivered(stub)
+        results = [
+            check('{} pages'.format(pages),
+                  len(stub.documents) == pages),
+            check('failed page interrupts upload', first is None),
+            check('upload resumes from failed page',
+                  second == pages - pages // 2),
+            check('no duplicates, no losses',
+                  sorted(values) == range(args.readings)),
+            check('gzipped documents', stub.gzipped == pages),
+            check('one session per upload', stub.sessions == 2),
+            check('sessions are closed', stub.closed == 2),
+        ]
+        print '{} readings in {:.2f}s, {:.0f} readings/s'.format(
+                args.readings, elapsed, args.readings / elapsed)
+    finally:
+        stub.stop()
+        shutil.rmtree(directory)
+    return 0 if all(results) else 1
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,106 @@
+# -*- coding: utf-8 -*-
+__author__ = 'Gennady Kovalev <gik@bigur.ru>'
+__copyright__ = '(c) 2015-2016 Business group for development management'
+__licence__ = 'GPL'
+
+# Local stand-in for the office portal: session, documents and session
+# close endpoints. Failures are configured with attributes of Portal.
+
+import gzip
+import json
+import time
+import threading
+import StringIO
+import BaseHTTPServer
+
+
+class Handler(BaseHTTPServer.BaseHTTPRequestHandler):
+
+    def log_message(self, *args):
+        pass
+
+    def _read_body(self):
+        length = int(self.headers.get('Content-Length', 0))
+        body = self.rfile.read(length)
+        if self.headers.get('Content-Encoding') == 'gzip':
+            body = gzip.GzipFile(fileobj=StringIO.StringIO(body)).read()
+        return body
+
+    def _respond(self, code, body=''):
+        self.send_response(code)
+        self.send_header('Content-Length', str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def _accept(self, body):
+        portal = self.server.portal
+        portal.documents.append(body)
+        if self.headers.get('Content-Encoding') == 'gzip':
+            portal.gzipped += 1
+
+    def do_POST(self):
+        portal = self.server.portal
+        body = self._read_body()
+        if portal.delay:
+            time.sleep(portal.delay)
+        if portal.outage:
+            return self._respond(503)
+
+        if self.path.endswith('/auth'):
+            if portal.fail_auth:
+                portal.fail_auth -= 1
+                return self._respond(403)
+            portal.sessions += 1
+            return self._respond(200, json.dumps({'sid': 'stub'}))
+
+        if self.path.endswith('/documents'):
+            if portal.fail_documents and \
+                    len(portal.documents) >= portal.fail_documents_after:
+                portal.fail_documents -= 1
+                return self._respond(500)
+            if portal.drop_documents:
+                # Document is accepted but connection is lost before reply
+                portal.drop_documents -= 1
+                self._accept(body)
+                self.close_connection = 1
+                return
+            self._accept(body)
+            return self._respond(200)
+
+        self._respond(404)
+
+    def do_DELETE(self):
+        self.server.portal.closed += 1
+        self._respond(200)
+
+
+class Portal(object):
+
+    def __init__(self):
+        self.fail_auth = 0
+        self.fail_documents = 0
+        self.fail_documents_after = 0
+        self.drop_documents = 0
+        self.delay = 0
+        self.outage = False
+        self.sessions = 0
+        self.closed = 0
+        self.gzipped = 0
+        self.documents = []
+        self._server = None
+
+    @property
+    def readings(self):
+        return sum(x.count('<Reading ') for x in self.documents)
+
+    def start(self):
+        self._server = BaseHTTPServer.HTTPServer(('127.0.0.1', 0), Handler)
+        self._server.portal = self
+        thread = threading.Thread(target=self._server.serve_forever)
+        thread.daemon = True
+        thread.start()
+        return 'http://127.0.0.1:{}/'.format(self._server.server_port)
+
+    def stop(self):
+        self._server.shutdown()
+        self._server.server_close()
@@ -2,4 +2,4 @@ __author__ = 'Gennady Kovalev <gik@bigur.ru>'
 __copyright__ = '(c) 2015-2016 Business group for development management'
 __licence__ = 'GPL'
 
-from .hub import Hub, OperationalError
+from .hub import Hub, OperationalError, NoResponseError, UnavailableError
@@ -0,0 +1,522 @@
+__author__ = 'Gennady Kovalev <gik@bigur.ru>'
+__copyright__ = '(c) 2015-2016 Business group for development management'
+__licence__ = 'GPL'
+
+# Event loop based transport. One loop multiplexes any number of serial
+# ports, so hubs on different devices are polled at the same time:
+#
+#     loop = aio.get_event_loop()
+#
+#     def poll(hub):
+#         config = yield hub.execute(command.GetConfig())
+#         raise aio.Return(config)
+#
+#     results = loop.run_until_complete(aio.gather(
+#             [poll(aio.AsyncHub(dev, 0x2fff)) for dev in devices]))
+#
+# The API mirrors asyncio (add_reader/add_writer, futures, tasks), but
+# coroutines are plain generators which return values with Return, since
+# we are running on python 2.
+
+import time
+import heapq
+import errno
+import select
+import types
+import logging
+import collections
+
+from . import serial
+from . import command
+from . import device as _device
+from .hub import Hub, OperationalError, NoResponseError
+
+
+logger = logging.getLogger('energo.aio')
+
+
+class Return(Exception):
+
+    def __init__(self, value=None):
+        super(Return, self).__init__(value)
+        self.value = value
+
+
+class Handle(object):
+
+    def __init__(self, callback, args):
+        self._callback = callback
+        self._args = args
+        self._cancelled = False
+
+    def cancel(self):
+        self._cancelled = True
+
+    def _run(self):
+        if not self._cancelled:
+            self._callback(*self._args)
+
+
+class TimerHandle(Handle):
+
+    def __init__(self, when, callback, args):
+        super(TimerHandle, self).__init__(callback, args)
+        self._when = when
+
+    def __lt__(self, other):
+        return self._when < other._when
+
+
+class Loop(object):
+
+    def __init__(self):
+        self._readers = {}
+        self._writers = {}
+        self._ready = collections.deque()
+        self._timers = []
+        self._stopping = False
+
+    def time(self):
+        return time.time()
+
+    def add_reader(self, fd, callback, *args):
+        self._readers[fd] = Handle(callback, args)
+
+    def remove_reader(self, fd):
+        return self._readers.pop(fd, None) is not None
+
+    def add_writer(self, fd, callback, *args):
+        self._writers[fd] = Handle(callback, args)
+
+    def remove_writer(self, fd):
+        return self._writers.pop(fd, None) is not None
+
+    def call_soon(self, callback, *args):
+        handle = Handle(callback, args)
+        self._ready.append(handle)
+        return handle
+
+    def call_later(self, delay, callback, *args):
+        handle = TimerHandle(self.time() + delay, callback, args)
+        heapq.heappush(self._timers, handle)
+        return handle
+
+    def stop(self):
+        self._stopping = True
+
+    def run_forever(self):
+        self._stopping = False
+        while not self._stopping:
+            self._run_once()
+
+    def run_until_complete(self, future):
+        future = ensure_future(future, self)
+        future.add_done_callback(lambda f: self.stop())
+        while not future.done():
+            self.run_forever()
+        return future.result()
+
+    def _run_once(self):
+        while self._timers and self._timers[0]._cancelled:
+            heapq.heappop(self._timers)
+
+        if self._ready or self._stopping:
+            timeout = 0
+        elif self._timers:
+            timeout = max(0, self._timers[0]._when - self.time())
+        else:
+            timeout = None
+
+        if self._readers or self._writers:
+            try:
+                readable, writable, _ = select.select(
+                        self._readers.keys(), self._writers.keys(), [],
+                        timeout)
+            except select.error as e:
+                if e.args[0] != errno.EINTR:
+                    raise
+                readable, writable = [], []
+            for fd in readable:
+                if fd in self._readers:
+                    self._ready.append(self._readers[fd])
+            for fd in writable:
+                if fd in self._writers:
+                    self._ready.append(self._writers[fd])
+        elif timeout:
+            time.sleep(timeout)
+
+        now = self.time()
+        while self._timers and self._timers[0]._when <= now:
+            self._ready.append(heapq.heappop(self._timers))
+
+        for i in xrange(len(self._ready)):
+            self._ready.popleft()._run()
+
+
+_default_loop = None
+
+def get_event_loop():
+    global _default_loop
+    if _default_loop is None:
+        _default_loop = Loop()
+    return _default_loop
+
+
+class Future(object):
+
+    def __init__(self, loop=None):
+        self._loop = loop or get_event_loop()
+        self._done = False
+        self._result = None
+        self._exception = None
+        self._callbacks = []
+
+    def done(self):
+        return self._done
+
+    def result(self):
+        assert self._done, 'result is not ready'
+        if self._exception is not None:
+            raise self._exception
+        return self._result
+
+    def exception(self):
+        assert self._done, 'result is not ready'
+        return self._exception
+
+    def set_result(self, result):
+        assert not self._done, 'result is already set'
+        self._result = result
+        self._finish()
+
+    def set_exception(self, exception):
+        assert not self._done, 'result is already set'
+        self._exception = exception
+        self._finish()
+
+    def add_done_callback(self, callback):
+        if self._done:
+            self._loop.call_soon(callback, self)
+        else:
+            self._callbacks.append(callback)
+
+    def _finish(self):
+        self._done = True
+        callbacks, self._callbacks = self._callbacks, []
+        for callback in callbacks:
+            self._loop.call_soon(callback, self)
+
+
+class Task(Future):
+
+    def __init__(self, coro, loop=None):
+        super(Task, self).__init__(loop)
+        self._coro = coro
+        self._loop.call_soon(self._step, None, None)
+
+    def _step(self, value, exception):
+        try:
+            if exception is not None:
+                future = self._coro.throw(exception)
+            else:
+                future = self._coro.send(value)
+        except StopIteration:
+            self.set_result(None)
+        except Return as e:
+            self.set_result(e.value)
+        except Exception as e:
+            self.set_exception(e)
+        else:
+            ensure_future(future, self._loop).add_done_callback(self._wakeup)
+
+    def _wakeup(self, future):
+        try:
+            value = future.result()
+        except Exception as e:
+            self._step(None, e)
+        else:
+            self._step(value, None)
+
+
+def ensure_future(obj, loop=None):
+    if isinstance(obj, Future):
+        return obj
+    elif isinstance(obj, types.GeneratorType):
+        return Task(obj, loop)
+    elif isinstance(obj, (list, tuple)):
+        return gather(obj, loop=loop)
+    raise TypeError('future or coroutine is required')
+
+
+def gather(futures, loop=None, return_exceptions=False):
+    loop = loop or get_event_loop()
+    futures = [ensure_future(x, loop) for x in futures]
+    result = Future(loop)
+    pending = [len(futures)]
+
+    def done(future):
+        if result.done():
+            return
+        if not return_exceptions and future.exception() is not None:
+            result.set_exception(future.exception())
+            return
+        pending[0] -= 1
+        if not pending[0]:
+            result.set_result([x.exception() or x._result for x in futures])
+
+    if not futures:
+        result.set_result([])
+    for future in futures:
+        future.add_done_callback(done)
+    return result
+
+
+def sleep(delay, loop=None):
+    loop = loop or get_event_loop()
+    future = Future(loop)
+    loop.call_later(delay, future.set_result, None)
+    return future
+
+
+class Lock(object):
+
+    def __init__(self, loop=None):
+        self._loop = loop or get_event_loop()
+        self._locked = False
+        self._waiters = collections.deque()
+
+    def locked(self):
+        return self._locked
+
+    def acquire(self):
+        future = Future(self._loop)
+        if not self._locked:
+            self._locked = True
+            future.set_result(True)
+        else:
+            self._waiters.append(future)
+        return future
+
+    def release(self):
+        assert self._locked, 'lock is not acquired'
+        if self._waiters:
+            self._waiters.popleft().set_result(True)
+        else:
+            self._locked = False
+
+
+class AsyncChannel(_device.Channel):
+
+    # Channel of the shared device for the event loop. The bus is polled
+    # instead of waited for and frames are pumped when the port becomes
+    # readable, so asynchronous hubs are arbitrated with threads and other
+    # processes as any other hub.
+    __poll__ = 0.005
+
+    def __init__(self, device, hub, timeout=None, loop=None):
+        super(AsyncChannel, self).__init__(device, hub, timeout)
+        self._loop = loop or get_event_loop()
+
+    def _readable(self, timeout):
+        # Future done when the port is readable or after timeout
+        future = Future(self._loop)
+        fd = self._device.fileno()
+
+        def finish():
+            self._loop.remove_reader(fd)
+            timer.cancel()
+            if not future.done():
+                future.set_result(None)
+
+        timer = self._loop.call_later(timeout, finish)
+        self._loop.add_reader(fd, finish)
+        return future
+
+    def write_async(self, octets):
+        return Task(self._write(octets), self._loop)
+
+    def _acquire(self):
+        # Waits for its turn in the queue of the bus without blocking
+        ticket = self._device.request(self._hub.priority)
+        try:
+            while not self._device.try_acquire(self, ticket):
+                yield sleep(self.__poll__, self._loop)
+        except BaseException:
+            self._device.cancel(ticket)
+            raise
+
+    def _write(self, octets):
+        self._finish()
+        yield Task(self._acquire(), self._loop)
+        self._holding = True
+        try:
+            result = self._device.write(octets, self.__timeout__)
+        except serial.SerialError:
+            self._finish()
+            raise
+        raise Return(result)
+
+    def read_some_async(self, size=256, timeout=None):
+        if timeout is None:
+            timeout = self.__timeout__
+        return Task(self._read(max(timeout, 0)), self._loop)
+
+    def _read(self, timeout):
+        if not self._holding:
+            # Routed frames only, the port is read while holding the bus
+            frame = self._device.take(self._hub.address)
+            raise Return(frame.octets if frame is not None else '')
+        deadline = self._loop.time() + timeout
+        try:
+            while True:
+                frame = self._device.take(self._hub.address, self)
+                if frame is not None:
+                    raise Return(frame.octets)
+                timeleft = deadline - self._loop.time()
+                if timeleft <= 0:
+                    raise Return('')
+                yield self._readable(timeleft)
+                self._device._pump(0)
+        finally:
+            self._finish()
+
+
+class BlockingTransport(object):
+
+    # Transport without event loop support, e.g. replay, its calls block
+    # the loop
+    def __init__(self, transport, loop=None):
+        self._transport = transport
+        self._loop = loop or get_event_loop()
+
+    def __getattr__(self, name):
+        return getattr(self._transport, name)
+
+    def _call(self, method, *args):
+        future = Future(self._loop)
+        try:
+            future.set_result(method(*args))
+        except serial.SerialError as e:
+            future.set_exception(e)
+        return future
+
+    def write_async(self, octets):
+        return self._call(self._transport.write, octets)
+
+    def read_some_async(self, size=256, timeout=None):
+        return self._call(self._transport.read_some, size, timeout)
+
+
+class AsyncHub(Hub):
+
+    def __init__(self, device, address, loop=None, **kwargs):
+        super(AsyncHub, self).__init__(device, address, **kwargs)
+        self._loop = loop or get_event_loop()
+        if isinstance(self._serial, _device.Channel):
+            self._serial = AsyncChannel(self._serial.device, self,
+                                        self._serial.__timeout__, self._loop)
+        else:
+            self._serial = BlockingTransport(self._serial, self._loop)
+        self._lock = Lock(self._loop)
+
+    def execute(self, cmd, priority=None):
+        return Task(self._execute(cmd, priority), self._loop)
+
+    def execute_many(self, commands, priority=None, errors=False):
+        # Task with the list of results, commands run in order under the
+        # hub lock as in Hub.execute_many
+        return Task(self._execute_many(commands, priority, errors),
+                    self._loop)
+
+    def _execute(self, cmd, priority):
+        yield self._lock.acquire()
+        try:
+            result = yield self._run(cmd, priority, False)
+        finally:
+            self._lock.release()
+        raise Return(result)
+
+    def _execute_many(self, commands, priority, errors):
+        results = []
+        yield self._lock.acquire()
+        try:
+            clean = False
+            for cmd in commands:
+                try:
+                    result = yield self._run(cmd, priority, clean)
+                except NoResponseError as e:
+                    if not errors:
+                        raise
+                    clean = False
+                    results.append(e)
+                else:
+                    clean = True
+                    results.append(result)
+        finally:
+            self._lock.release()
+        raise Return(results)
+
+    def _run(self, cmd, priority, clean):
+        self._check_available()
+        self._priority = cmd.priority if priority is None else priority
+        attempt = 0
+        while True:
+            timeout = self._read_timeout(cmd, attempt)
+            started = self._loop.time()
+            try:
+                result = yield self._execute_once(cmd, timeout, clean)
+            except NoResponseError as e:
+                clean = False
+                if attempt >= self._retries:
+                    self._failure()
+                    raise
+                delay = self._backoff * 2 ** attempt
+                attempt += 1
+                logger.debug('%s, retry %s in %.2fs', e, attempt, delay)
+                yield sleep(delay, self._loop)
+            except OperationalError:
+                self._failure()
+                raise
+            else:
+                self._success(cmd, self._loop.time() - started)
+                raise Return(result)
+
+    def _execute_once(self, cmd, timeout, clean=False):
+        cmd.source = self._source
+        cmd.destination = self._destination
+        if not clean:
+            self._connect()
+
+        try:
+            self._drain(cmd, clean)
+            octets = cmd.request
+            logger.debug('Send: %s', command.HexDump(octets))
+            yield self._serial.write_async(octets)
+            self._sent(octets)
+
+            tries = 5
+            deadline = self._loop.time() + timeout
+            while True:
+                frame = self._decoder.decode()
+                if frame is None:
+                    octets = yield self._serial.read_some_async(
+                            timeout=deadline - self._loop.time())
+                    if octets:
+                        self._feed(octets)
+                        continue
+                    frame = self._decoder.decode(final=True)
+                    if frame is None:
+                        raise self._no_response(cmd)
+
+                if self._accept(cmd, frame):
+                    break
+
+                tries -= 1
+                if not tries:
+                    raise OperationalError('Recieve tries limit reached')
+                deadline = self._loop.time() + timeout
+
+        except (serial.SerialError, command.CommandError) as e:
+            raise OperationalError(e)
+
+        raise Return(cmd.result)
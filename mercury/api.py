@@ -0,0 +1,257 @@
+__author__ = 'Gennady Kovalev <gik@bigur.ru>'
+__copyright__ = '(c) 2015-2016 Business group for development management'
+__licence__ = 'GPL'
+
+# Local read API over HTTP/JSON, nothing is asked from hubs:
+#
+#     GET /latest?hub=0x2f01[&counter=5]
+#     GET /readings?hub=0x2f01[&counter=5][&from=2016-01-01][&to=...]
+#                  [&limit=1000]
+#
+# Latest readings come from an in-memory cache of whole hubs. Hubs are
+# loaded from the database on first request and evicted least recently
+# used first. Inside the daemon ingestion updates the cache as it writes,
+# a standalone server reloads hubs older than ttl instead.
+
+import json
+import time
+import urlparse
+import logging
+import datetime
+import threading
+import collections
+import BaseHTTPServer
+
+from . import storage
+from . import metrics
+
+
+logger = logging.getLogger('energo.api')
+
+
+# Reading of every counter and type with max date, level and value are
+# taken from that row (sqlite's bare column rule)
+SQL_SELECT_LATEST = '''\
+SELECT
+  counter, type, MAX(date), value, level
+FROM data
+WHERE
+  hub = ?
+GROUP BY counter, type'''
+
+SQL_SELECT_READINGS = '''\
+SELECT
+  counter, type, date, value, level
+FROM data
+WHERE
+  hub = ? AND
+  {}
+  date >= ? AND
+  date < ?
+ORDER BY date, counter, type
+LIMIT ?'''
+
+class ApiError(Exception):
+    pass
+
+
+class LatestReadings(object):
+
+    # Latest (date, value, level) by hub, counter and type. Hub is complete
+    # when it was loaded from the database, ingested readings of not loaded
+    # hub are kept until the hub is loaded and merged then.
+    def __init__(self, size=65536, ttl=None):
+        self._size = size
+        self._ttl = ttl
+        self._lock = threading.Lock()
+        self._hubs = collections.OrderedDict()
+        self._count = 0
+
+    def __len__(self):
+        return self._count
+
+    def _merge(self, counters, counter, dtype, reading):
+        types = counters.setdefault(counter, {})
+        current = types.get(dtype)
+        if current is None:
+            self._count += 1
+        elif current[0] >= reading[0]:
+            return
+        types[dtype] = reading
+
+    def _size_of(self, counters):
+        return sum(len(x) for x in counters.itervalues())
+
+    def _evict(self, keep):
+        while self._count > self._size and len(self._hubs) > 1:
+            hub, entry = self._hubs.popitem(last=False)
+            if hub == keep:
+                self._hubs[hub] = entry
+                continue
+            size = self._size_of(entry[1])
+            self._count -= size
+            logger.debug('Evict hub %s, %s readings', hub, size)
+
+    def _select(self, counters, counter):
+        if counter is not None:
+            counters = {counter: counters.get(counter, {})}
+        return [((x, dtype), reading)
+                for x, types in sorted(counters.iteritems())
+                for dtype, reading in sorted(types.iteritems())]
+
+    def update(self, hub, counter, rows):
+        # Storage subscriber
+        with self._lock:
+            loaded, counters = self._hubs.pop(hub, (None, {}))
+            for _, _, level, dtype, date, value in rows:
+                self._merge(counters, counter, dtype, (date, value, level))
+            self._hubs[hub] = (loaded, counters)
+            self._evict(hub)
+
+    def get(self, hub, load, counter=None):
+        # Sorted ((counter, type), (date, value, level)) of hub or one
+        # counter, load(hub) returns (counter, type, date, value, level)
+        # rows from the database
+        with self._lock:
+            entry = self._hubs.get(hub)
+            if entry is not None and entry[0] is not None and \
+                    (self._ttl is None or time.time() - entry[0] < self._ttl):
+                self._hubs[hub] = self._hubs.pop(hub)
+                metrics.registry.inc('mercury_api_cache_total', result='hit')
+                return self._select(entry[1], counter)
+
+        metrics.registry.inc('mercury_api_cache_total', result='miss')
+        rows = load(hub)
+        with self._lock:
+            loaded, counters = self._hubs.pop(hub, (None, {}))
+            if loaded is not None:
+                # Expired, database has the latest of everything
+                self._count -= self._size_of(counters)
+                counters = {}
+            for number, dtype, date, value, level in rows:
+                self._merge(counters, number, dtype, (date, value, level))
+            self._hubs[hub] = (time.time(), counters)
+            self._evict(hub)
+            return self._select(counters, counter)
+
+    def clear(self):
+        with self._lock:
+            self._hubs.clear()
+            self._count = 0
+
+
+def _int(value, name):
+    try:
+        return int(value, 0)
+    except ValueError:
+        raise ApiError('invalid {}: {}'.format(name, value))
+
+
+def _date(value, name):
+    try:
+        return storage.parse_date(value)
+    except ValueError:
+        raise ApiError('invalid {}: {}'.format(name, value))
+
+
+def parse_address(value):
+    # 'host:port' or 'port' to listen on, host defaults to localhost
+    host, _, port = value.rpartition(':')
+    try:
+        return host or '127.0.0.1', int(port)
+    except ValueError:
+        raise ApiError('invalid address: {}'.format(value))
+
+
+def _reading(hub, counter, dtype, date, value, level):
+    return {'hub': hub, 'counter': counter, 'type': dtype, 'date': date,
+            'value': value, 'level': level}
+
+
+class Handler(BaseHTTPServer.BaseHTTPRequestHandler):
+
+    def log_message(self, frmt, *args):
+        logger.debug('%s %s', self.address_string(), frmt % args)
+
+    def _respond(self, code, document):
+        body = json.dumps(document)
+        self.send_response(code)
+        self.send_header('Content-Type', 'application/json')
+        self.send_header('Content-Length', str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def do_GET(self):
+        url = urlparse.urlparse(self.path)
+        query = dict((k, v[-1]) for k, v in
+                     urlparse.parse_qs(url.query).iteritems())
+        handler = getattr(self.server.api, 'get_' + url.path.strip('/'),
+                          None)
+        if handler is None:
+            return self._respond(404, {'error': 'not found'})
+        try:
+            with metrics.registry.timer('mercury_api_seconds',
+                                        path=url.path):
+                result = handler(query)
+        except ApiError as e:
+            return self._respond(400, {'error': str(e)})
+        self._respond(200, result)
+
+
+class Server(threading.Thread):
+
+    # Serves API in a thread with its own database connection, cache is
+    # shared with the caller
+    def __init__(self, path, address, cache, limit=1000):
+        super(Server, self).__init__()
+        self.daemon = True
+        self._path = path
+        self._cache = cache
+        self._limit = limit
+        self._db = None
+        self._httpd = BaseHTTPServer.HTTPServer(address, Handler)
+        self._httpd.api = self
+        self.address = self._httpd.server_address
+
+    def _load(self, hub):
+        return self._db.execute(SQL_SELECT_LATEST, (hub,)).fetchall()
+
+    def get_latest(self, query):
+        if 'hub' not in query:
+            raise ApiError('hub is required')
+        hub = _int(query['hub'], 'hub')
+        counter = None
+        if 'counter' in query:
+            counter = _int(query['counter'], 'counter')
+        return [_reading(hub, counter, dtype, *reading) for
+                (counter, dtype), reading in
+                self._cache.get(hub, self._load, counter)]
+
+    def get_readings(self, query):
+        if 'hub' not in query:
+            raise ApiError('hub is required')
+        params = [_int(query['hub'], 'hub')]
+        counter = ''
+        if 'counter' in query:
+            counter = 'counter = ? AND'
+            params.append(_int(query['counter'], 'counter'))
+        params.append(_date(query['from'], 'from') if 'from' in query
+                      else datetime.datetime.min)
+        params.append(_date(query['to'], 'to') if 'to' in query
+                      else datetime.datetime.max)
+        limit = _int(query.get('limit', str(self._limit)), 'limit')
+        params.append(max(0, min(limit, self._limit)))
+        rows = self._db.execute(SQL_SELECT_READINGS.format(counter), params)
+        return [_reading(params[0], *x) for x in rows]
+
+    def run(self):
+        self._db = storage.connect(self._path)
+        logger.info('Serving API on %s:%s', *self.address)
+        try:
+            self._httpd.serve_forever()
+        finally:
+            self._db.close()
+
+    def stop(self):
+        self._httpd.shutdown()
+        self._httpd.server_close()
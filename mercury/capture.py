@@ -0,0 +1,210 @@
+__author__ = 'Gennady Kovalev <gik@bigur.ru>'
+__copyright__ = '(c) 2015-2016 Business group for development management'
+__licence__ = 'GPL'
+
+# Serial traffic capture and replay. Log is a header (magic, version,
+# start time) followed by records of microseconds since previous record,
+# kind and length, then data.
+
+import time
+import struct
+import logging
+
+from . import serial
+
+
+logger = logging.getLogger('energo.capture')
+
+
+HEADER = struct.Struct('<4sBd')
+RECORD = struct.Struct('<IBH')
+
+MAGIC = 'MLOG'
+VERSION = 1
+
+TX = 0
+RX = 1
+TIMEOUT = 2
+
+
+class CaptureError(Exception):
+    pass
+
+
+class LogWriter(object):
+
+    def __init__(self, path):
+        self._fh = open(path, 'wb')
+        self._last = time.time()
+        self._fh.write(HEADER.pack(MAGIC, VERSION, self._last))
+
+    def write(self, kind, data=''):
+        now = time.time()
+        delta = min(int((now - self._last) * 1e6), 0xffffffff)
+        self._last = now
+        self._fh.write(RECORD.pack(delta, kind, len(data)))
+        self._fh.write(data)
+        self._fh.flush()
+
+    def close(self):
+        if not self._fh.closed:
+            self._fh.close()
+
+
+def read_log(path):
+    # Yields (timestamp, kind, data) records
+    with open(path, 'rb') as fh:
+        header = fh.read(HEADER.size)
+        if len(header) < HEADER.size:
+            raise CaptureError('log is too short')
+        magic, version, timestamp = HEADER.unpack(header)
+        if magic != MAGIC or version != VERSION:
+            raise CaptureError('unknown log format')
+        while True:
+            octets = fh.read(RECORD.size)
+            if not octets:
+                break
+            if len(octets) < RECORD.size:
+                raise CaptureError('truncated record')
+            delta, kind, length = RECORD.unpack(octets)
+            data = fh.read(length)
+            if len(data) < length:
+                raise CaptureError('truncated record')
+            timestamp += delta / 1e6
+            yield timestamp, kind, data
+
+
+class CaptureSerial(object):
+
+    # Wraps Serial and logs every transmitted and recieved chunk
+    def __init__(self, port, path):
+        self._port = port
+        self._log = LogWriter(path)
+
+    def __getattr__(self, name):
+        return getattr(self._port, name)
+
+    def write(self, octets, timeout=None):
+        result = self._port.write(octets, timeout)
+        self._log.write(TX, octets)
+        return result
+
+    def read(self, size=1):
+        octets = self._port.read(size)
+        self._log.write(RX if octets else TIMEOUT, octets)
+        return octets
+
+    def read_some(self, size=256, timeout=None):
+        octets = self._port.read_some(size, timeout)
+        self._log.write(RX if octets else TIMEOUT, octets)
+        return octets
+
+    def readinto(self, buffer, timeout=None):
+        n = self._port.readinto(buffer, timeout)
+        self._log.write(RX if n else TIMEOUT, buffer[:n].tobytes())
+        return n
+
+    def close(self):
+        self._port.close()
+        self._log.close()
+
+
+class ReplaySerial(object):
+
+    # Feeds recorded responses back in place of Serial. With realtime
+    # responses come after the recorded delay, otherwise at once.
+    __timeout__ = serial.Serial.__timeout__
+
+    def __init__(self, path, realtime=True, timeout=None):
+        if timeout is not None:
+            self.__timeout__ = timeout
+        self._records = list(read_log(path))
+        self._position = 0
+        self._realtime = realtime
+        self._is_open = False
+        self._pending = ''
+        self._sent_at = None
+        self._recorded_at = None
+
+    def open(self):
+        self._is_open = True
+
+    def is_open(self):
+        return self._is_open
+
+    def configure(self):
+        pass
+
+    def flush(self):
+        self._pending = ''
+
+    def close(self):
+        self._is_open = False
+
+    def write(self, octets, timeout=None):
+        if not self._is_open:
+            raise serial.SerialError('port is not open')
+
+        # Skip to the next recorded request
+        while self._position < len(self._records):
+            timestamp, kind, data = self._records[self._position]
+            self._position += 1
+            if kind == TX:
+                if data != octets:
+                    logger.warning('Request differs from recorded one')
+                self._pending = ''
+                self._sent_at = time.time()
+                self._recorded_at = timestamp
+                return len(octets)
+        raise serial.SerialError('end of replay log')
+
+    def _wait(self, timestamp, timeout):
+        # Returns False if recorded chunk doesn't arrive within timeout
+        if not self._realtime or self._sent_at is None:
+            return True
+        delay = self._sent_at + (timestamp - self._recorded_at) - time.time()
+        if delay > timeout:
+            time.sleep(max(timeout, 0))
+            return False
+        if delay > 0:
+            time.sleep(delay)
+        return True
+
+    def read_some(self, size=256, timeout=None):
+        if not self._is_open:
+            raise serial.SerialError('port is not open')
+        if timeout is None:
+            timeout = self.__timeout__
+
+        if not self._pending:
+            if self._position >= len(self._records) or \
+                    self._records[self._position][1] == TX:
+                # Nothing more was recieved for this request
+                if self._realtime:
+                    time.sleep(max(timeout, 0))
+                return ''
+
+            timestamp, kind, data = self._records[self._position]
+            if not self._wait(timestamp, timeout):
+                return ''
+            self._position += 1
+            if kind == TIMEOUT:
+                return ''
+            self._pending = data
+
+        octets, self._pending = self._pending[:size], self._pending[size:]
+        return octets
+
+    def readinto(self, buffer, timeout=None):
+        octets = self.read_some(len(buffer), timeout)
+        buffer[:len(octets)] = octets
+        return len(octets)
+
+    def read(self, size=1):
+        recieved = ''
+        while len(recieved) < size:
+            octets = self.read_some(size - len(recieved))
+            if not octets:
+                break
+            recieved += octets
+        return recieved
@@ -0,0 +1,231 @@
+__author__ = 'Gennady Kovalev <gik@bigur.ru>'
+__copyright__ = '(c) 2015-2016 Business group for development management'
+__licence__ = 'GPL'
+
+# Command line tool. Every subcommand lives in a module of this package
+# with run(parser, args), the module is imported only when its subcommand
+# is chosen, so a cron run of `mercury_cli print address` doesn't import
+# sqlite3 or ssl. Keep imports of this module to the standard minimum.
+
+import logging
+import argparse
+import importlib
+
+
+# Subcommand: module
+COMMANDS = [
+    ('poll', 'poll'),
+    ('print', 'show'),
+    ('config', 'config'),
+    ('report', 'report'),
+    ('upload', 'upload'),
+    ('export', 'export'),
+    ('retention', 'retention'),
+    ('discover', 'discover'),
+    ('daemon', 'daemon'),
+    ('serve', 'serve'),
+]
+
+
+def _common_options():
+    parser = argparse.ArgumentParser(add_help=False)
+    parser.add_argument('-v', dest='verbose', action='store_true',
+                        help='output debug information')
+    parser.add_argument('--metrics', metavar='FILE',
+                        help='write metrics in Prometheus text format to '
+                             'file')
+    return parser
+
+
+def _dbase_options():
+    parser = argparse.ArgumentParser(add_help=False)
+    parser.add_argument('--dbase', default='mercury.db', metavar='PATH',
+                        help='database to use, default mercury.db')
+    return parser
+
+
+def _hub_options():
+    parser = argparse.ArgumentParser(add_help=False)
+    parser.add_argument('--device', default='/dev/ttyUSB0', metavar='PATH',
+                        help='device to connect, default /dev/ttyUSB0')
+    parser.add_argument('--address', metavar='ADDR', nargs='*',
+                        help='device address in hex, e.g. 0x2fff')
+
+    group = parser.add_argument_group('hub options')
+    group.add_argument('--timeout', type=float, default=8,
+                       metavar='SECONDS',
+                       help='maximum response timeout, default 8')
+    group.add_argument('--min-timeout', type=float, default=0.5,
+                       metavar='SECONDS',
+                       help='minimum adaptive response timeout, default 0.5')
+    group.add_argument('--retries', type=int, default=1, metavar='NUMBER',
+                       help='resend request after timeout, default 1')
+    group.add_argument('--backoff', type=float, default=0.5,
+                       metavar='SECONDS',
+                       help='initial delay before resend, default 0.5')
+    group.add_argument('--failures', type=int, default=5, metavar='NUMBER',
+                       help='skip hub after so many failures in row, '
+                            'default 5')
+    group.add_argument('--cooldown', type=float, default=300,
+                       metavar='SECONDS',
+                       help='time to skip failed hub, default 300')
+
+    group = parser.add_argument_group('capture options')
+    group.add_argument('--capture', metavar='FILE',
+                       help='record serial traffic to file')
+    group.add_argument('--replay', metavar='FILE',
+                       help='replay recorded traffic instead of device')
+    group.add_argument('--replay-fast', action='store_true',
+                       help='replay as fast as possible, not at recorded '
+                            'speed')
+    return parser
+
+
+def make_parser():
+    common = _common_options()
+    dbase = _dbase_options()
+    hub = _hub_options()
+
+    parser = argparse.ArgumentParser(prog='mercury_cli')
+    commands = parser.add_subparsers(dest='command', metavar='COMMAND')
+
+    poll = commands.add_parser('poll', parents=[common, dbase, hub],
+                               help='download readings to database')
+    poll.add_argument('--sweep', type=int, default=32, metavar='NUMBER',
+                      help='number of unused counter slots to check per '
+                           'run, default 32')
+    poll.add_argument('--full-sweep', action='store_true',
+                      help='check all counter slots')
+    poll.add_argument('--full-resync', action='store_true',
+                      help='download history even if last reading is not '
+                           'changed')
+
+    show = commands.add_parser('print', parents=[common, dbase, hub],
+                               help='query and print hub data')
+    show.add_argument('what', choices=['address', 'config', 'readings',
+                                       'last-readings', 'hubs'],
+                      help='hub address or configuration, all readings of '
+                           'counter, last readings of all counters, hubs '
+                           'found by discovery')
+    show.add_argument('counter', type=int, nargs='?',
+                      help='counter of readings')
+
+    config = commands.add_parser('config', parents=[common, hub],
+                                 help='set hub configuration')
+    config.add_argument('--counters', type=int, metavar='NUMBER',
+                        help='capacity of network')
+    config.add_argument('--mode', metavar='MODE',
+                        choices=['Normal', 'MasterSR', 'SlaveSRT',
+                                 'SlaveSR'],
+                        help='device mode: Normal | MasterSR | SlaveSRT | '
+                             'SlaveSR')
+
+    report = commands.add_parser('report', parents=[common, dbase],
+                                 help='create html file with statistics')
+    report.add_argument('path', metavar='FILE', nargs='?',
+                        help='html file to create')
+    report.add_argument('--months', type=int, default=6, metavar='NUMBER',
+                        help='number of months in report, default 6')
+    report.add_argument('--rebuild-rollups', action='store_true',
+                        help='rebuild monthly rollups from readings first')
+
+    upload = commands.add_parser('upload', parents=[common, dbase],
+                                 help='upload readings to office')
+    upload.add_argument('--url', default='https://bigur.com/',
+                        metavar='URL', help='url to office portal')
+    upload.add_argument('--credentials', default='credentials.txt',
+                        metavar='FILE',
+                        help='file with login and password (one per line)')
+    upload.add_argument('--page-size', type=int, default=100,
+                        metavar='NUMBER',
+                        help='number of readings per request, default 100')
+    upload.add_argument('--all', action='store_true',
+                        help='upload all queued batches in one session')
+    upload.add_argument('--gzip', action='store_true',
+                        help='compress requests with gzip')
+
+    export = commands.add_parser('export', parents=[common, dbase],
+                                 help='export readings to file')
+    export.add_argument('path', metavar='FILE',
+                        help='file to create, - for standard output')
+    export.add_argument('--format', choices=['csv', 'ndjson', 'npz',
+                                             'arrow'],
+                        help='file format, default by extension or csv')
+    export.add_argument('--hub', metavar='ID',
+                        help='network id of hub, e.g. 0x2f01')
+    export.add_argument('--counter', type=int, metavar='NUMBER',
+                        help='counter of hub')
+    export.add_argument('--from', dest='since', metavar='DATE',
+                        help='first date, YYYY-MM-DD [HH:MM[:SS]]')
+    export.add_argument('--to', dest='until', metavar='DATE',
+                        help='date after the last one')
+    export.add_argument('--batch', type=int, default=1000, metavar='NUMBER',
+                        help='rows read at once, default 1000')
+
+    retention = commands.add_parser('retention', parents=[common, dbase],
+                                    help='delete or archive old readings')
+    retention.add_argument('--months', type=int, metavar='NUMBER',
+                           help='keep raw readings of so many last months')
+    retention.add_argument('--archive', metavar='DIR',
+                           help='archive deleted readings to directory')
+    retention.add_argument('--budget', type=float, metavar='SECONDS',
+                           help='stop after, default run until done')
+    retention.add_argument('--chunk', type=int, default=500,
+                           metavar='NUMBER',
+                           help='rows deleted per transaction, default 500')
+    retention.add_argument('--vacuum-pages', type=int, default=256,
+                           metavar='NUMBER',
+                           help='pages given back per step, default 256')
+    retention.add_argument('--convert', action='store_true',
+                           help='switch database to incremental vacuum, '
+                                'rewrites the whole file')
+
+    discover = commands.add_parser('discover', parents=[common, dbase],
+                                   help='find hubs on devices and save them '
+                                        'to database')
+    discover.add_argument('devices', metavar='PATH', nargs='*',
+                          default=['/dev/ttyUSB0'],
+                          help='devices to sweep in parallel, default '
+                               '/dev/ttyUSB0')
+    discover.add_argument('--range', metavar='ADDR', nargs=2,
+                          default=['0x2f01', '0x2ffe'],
+                          help='first and last address in hex, default '
+                               '0x2f01 0x2ffe')
+    discover.add_argument('--timeout', type=float, default=0.2,
+                          metavar='SECONDS',
+                          help='time to wait for answers, default 0.2')
+    discover.add_argument('--window', type=int, default=8, metavar='NUMBER',
+                          help='requests sent at once, default 8')
+
+    daemon = commands.add_parser('daemon', parents=[common],
+                                 help='run polling daemon')
+    daemon.add_argument('config', metavar='CONFIG', help='config file')
+
+    serve = commands.add_parser('serve', parents=[common, dbase],
+                                help='serve read API')
+    serve.add_argument('address', metavar='ADDR',
+                       help='[host:]port to listen on')
+    serve.add_argument('--ttl', type=float, default=60, metavar='SECONDS',
+                       help='reload cached readings after, default 60')
+
+    # Subcommands report errors with their own usage
+    for subparser in commands.choices.itervalues():
+        subparser.set_defaults(subparser=subparser)
+    return parser
+
+
+def load(command):
+    module = dict(COMMANDS)[command]
+    return importlib.import_module('.' + module, __name__)
+
+
+def main(argv=None):
+    parser = make_parser()
+    args = parser.parse_args(argv)
+
+    if args.verbose:
+        logging.basicConfig(level=logging.DEBUG, format='%(message)s')
+    else:
+        logging.basicConfig(level=logging.INFO, format='%(message)s')
+
+    return load(args.command).run(args.subparser, args) or 0
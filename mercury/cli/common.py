@@ -0,0 +1,92 @@
+__author__ = 'Gennady Kovalev <gik@bigur.ru>'
+__copyright__ = '(c) 2015-2016 Business group for development management'
+__licence__ = 'GPL'
+
+# Helpers of subcommands which talk to hubs
+
+import logging
+import contextlib
+
+from .. import hub as _hub
+from .. import device
+from .. import capture
+from .. import metrics
+
+
+logger = logging.getLogger('root')
+
+
+def addresses(parser, args):
+    if args.address is None:
+        return [0x2fff]
+    try:
+        result = [int(x.strip(), 16) for x in args.address]
+    except ValueError:
+        parser.error('invalid device address')
+    for address in result:
+        if address < 0 or address > 65535:
+            parser.error('invalid device address')
+    return result
+
+
+def check_hub_options(parser, args):
+    if args.timeout <= 0 or args.min_timeout <= 0:
+        parser.error('invalid timeout')
+    if args.retries < 0:
+        parser.error('invalid retries')
+    if args.backoff < 0 or args.cooldown < 0:
+        parser.error('invalid delay')
+    if args.failures < 1:
+        parser.error('invalid failures')
+    if args.capture and args.replay:
+        parser.error('capture and replay are mutually exclusive')
+
+
+def write_metrics(args):
+    if args.metrics:
+        metrics.write_prometheus(metrics.registry, args.metrics)
+
+
+@contextlib.contextmanager
+def hubs(parser, args):
+    # Yields Hub of every address. All hubs share one port, so traffic
+    # goes to one capture.
+    check_hub_options(parser, args)
+    result = addresses(parser, args)
+    transport = None
+    try:
+        if args.replay:
+            transport = capture.ReplaySerial(args.replay,
+                                             not args.replay_fast,
+                                             args.timeout)
+        elif args.capture:
+            # Captured port stays shared, locked as any other
+            transport = device.get_device(args.device)
+            transport.capture(args.capture)
+    except (IOError, capture.CaptureError) as e:
+        raise _hub.OperationalError(str(e))
+
+    try:
+        yield [_hub.Hub(args.device, address,
+                        timeout=args.timeout,
+                        min_timeout=args.min_timeout,
+                        retries=args.retries,
+                        backoff=args.backoff,
+                        failures=args.failures,
+                        cooldown=args.cooldown,
+                        transport=transport)
+               for address in result]
+    finally:
+        if transport is not None:
+            transport.close()
+        write_metrics(args)
+
+
+def print_config(config, title='Hub configuration:'):
+    print(title)
+    print(' Counters:             %(counters)s' % config)
+    print(' Transparent mode:     %(transparent_mode)s' % config['config'])
+    print(' Zero threshold:       %(zero_threshold)s' % config['config'])
+    print(' Mode:                 %(mode)s' % config['config'])
+    print(' Daylight saving time: %(dst)s' % config['config'])
+    print(' PLC is disabled:      %(plc_disabled)s' % config['config'])
@@ -0,0 +1,34 @@
+__author__ = 'Gennady Kovalev <gik@bigur.ru>'
+__copyright__ = '(c) 2015-2016 Business group for development management'
+__licence__ = 'GPL'
+
+import logging
+
+from .. import hub as _hub
+from .. import command
+from . import common
+
+
+logger = logging.getLogger('root')
+
+
+def run(parser, args):
+    if args.counters is not None:
+        if args.counters < 1 or args.counters > 1024:
+            parser.error('invalid counters')
+
+    try:
+        with common.hubs(parser, args) as hubs:
+            for hub in hubs:
+                config = hub.execute(command.GetConfig())
+                common.print_config(config, 'Old configuration')
+                print
+                if args.counters is not None:
+                    config['counters'] = args.counters
+                if args.mode is not None:
+                    config['config']['mode'] = args.mode
+                config = hub.execute(command.SetConfig(config))
+                common.print_config(config, 'New configuration')
+    except _hub.OperationalError as e:
+        logger.error(str(e))
+        return -1
@@ -0,0 +1,19 @@
+__author__ = 'Gennady Kovalev <gik@bigur.ru>'
+__copyright__ = '(c) 2015-2016 Business group for development management'
+__licence__ = 'GPL'
+
+import logging
+
+from .. import daemon as _daemon
+
+
+logger = logging.getLogger('root')
+
+
+def run(parser, args):
+    # Runs until SIGTERM
+    try:
+        _daemon.Daemon(args.config).run()
+    except _daemon.DaemonError as e:
+        logger.error(str(e))
+        return -1
@@ -0,0 +1,39 @@
+__author__ = 'Gennady Kovalev <gik@bigur.ru>'
+__copyright__ = '(c) 2015-2016 Business group for development management'
+__licence__ = 'GPL'
+
+import logging
+
+from .. import discovery
+from .. import storage
+
+
+logger = logging.getLogger('root')
+
+
+def run(parser, args):
+    try:
+        first, last = [int(x, 16) for x in args.range]
+    except ValueError:
+        parser.error('invalid discover range')
+    if first < 0 or last > 65535 or first > last:
+        parser.error('invalid discover range')
+    if args.timeout <= 0:
+        parser.error('invalid discover timeout')
+    if args.window < 1:
+        parser.error('invalid discover window')
+
+    try:
+        results = discovery.discover(args.devices, xrange(first, last + 1),
+                                     args.timeout, args.window)
+    except discovery.DiscoveryError as e:
+        logger.error(str(e))
+        return -1
+    db = storage.connect(args.dbase)
+    try:
+        discovery.store(db, results)
+    finally:
+        db.close()
+    for device in args.devices:
+        print('%s: %s' % (device, ' '.join(hex(x) for x, _ in
+                                            sorted(results[device])) or '-'))
@@ -0,0 +1,63 @@
+__author__ = 'Gennady Kovalev <gik@bigur.ru>'
+__copyright__ = '(c) 2015-2016 Business group for development management'
+__licence__ = 'GPL'
+
+import os
+import sys
+import logging
+
+from .. import export as _export
+from .. import storage
+from . import common
+
+
+logger = logging.getLogger('root')
+
+
+def run(parser, args):
+    frmt = args.format
+    if frmt is None:
+        frmt = os.path.splitext(args.path)[1].lstrip('.')
+        if frmt not in _export.FORMATS:
+            frmt = 'csv'
+    if args.path == '-' and frmt in ('npz', 'arrow'):
+        parser.error('{} can\'t be written to standard output'.format(frmt))
+
+    hub = None
+    if args.hub is not None:
+        try:
+            hub = int(args.hub, 0)
+        except ValueError:
+            parser.error('invalid hub')
+    try:
+        since = args.since and storage.parse_date(args.since)
+        until = args.until and storage.parse_date(args.until)
+    except ValueError as e:
+        parser.error(str(e))
+    if args.batch < 1:
+        parser.error('invalid batch')
+
+    # File appears complete or not at all
+    db = storage.connect(args.dbase)
+    try:
+        if args.path == '-':
+            _export.export(db, sys.stdout, frmt, hub, args.counter, since,
+                           until, args.batch)
+            return
+        partial = args.path + '.part'
+        try:
+            with open(partial, 'wb') as fh:
+                count = _export.export(db, fh, frmt, hub, args.counter,
+                                       since, until, args.batch)
+            os.rename(partial, args.path)
+        except:
+            if os.path.exists(partial):
+                os.unlink(partial)
+            raise
+        logger.info('Exported %s readings to %s', count, args.path)
+    except (_export.ExportError, IOError, OSError) as e:
+        logger.error(str(e))
+        return -1
+    finally:
+        db.close()
+        common.write_metrics(args)
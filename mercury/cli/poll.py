@@ -0,0 +1,32 @@
+__author__ = 'Gennady Kovalev <gik@bigur.ru>'
+__copyright__ = '(c) 2015-2016 Business group for development management'
+__licence__ = 'GPL'
+
+import logging
+
+from .. import hub as _hub
+from .. import poll as _poll
+from .. import storage
+from . import common
+
+
+logger = logging.getLogger('root')
+
+
+def run(parser, args):
+    if args.sweep < 0:
+        parser.error('invalid sweep')
+
+    try:
+        with common.hubs(parser, args) as hubs:
+            db = storage.connect(args.dbase)
+            try:
+                for hub in hubs:
+                    _poll.download_readings(hub, db, args.sweep,
+                                            args.full_sweep,
+                                            args.full_resync)
+            finally:
+                db.close()
+    except _hub.OperationalError as e:
+        logger.error(str(e))
+        return -1
@@ -0,0 +1,26 @@
+__author__ = 'Gennady Kovalev <gik@bigur.ru>'
+__copyright__ = '(c) 2015-2016 Business group for development management'
+__licence__ = 'GPL'
+
+from .. import report as _report
+from .. import storage
+from .. import metrics
+from . import common
+
+
+def run(parser, args):
+    if args.path is None and not args.rebuild_rollups:
+        parser.error('nothing to do, give a file or --rebuild-rollups')
+    if args.months < 1:
+        parser.error('invalid report months')
+
+    db = storage.connect(args.dbase)
+    try:
+        if args.rebuild_rollups:
+            with metrics.registry.timer('mercury_rollup_rebuild_seconds'):
+                storage.rebuild_rollups(db)
+        if args.path is not None:
+            _report.create_html(db, args.path, args.months)
+    finally:
+        db.close()
+        common.write_metrics(args)
@@ -0,0 +1,45 @@
+__author__ = 'Gennady Kovalev <gik@bigur.ru>'
+__copyright__ = '(c) 2015-2016 Business group for development management'
+__licence__ = 'GPL'
+
+import logging
+
+from .. import retention as _retention
+from .. import storage
+from . import common
+
+
+logger = logging.getLogger('root')
+
+
+def run(parser, args):
+    if args.months is None and not args.convert:
+        parser.error('nothing to do, give --months or --convert')
+    if args.months is not None and args.months < 1:
+        parser.error('invalid months')
+    if args.budget is not None and args.budget <= 0:
+        parser.error('invalid budget')
+    if args.chunk < 1 or args.vacuum_pages < 1:
+        parser.error('invalid chunk')
+
+    db = storage.connect(args.dbase)
+    try:
+        if args.convert and not _retention.is_incremental(db):
+            logger.info('Convert database to incremental vacuum')
+            _retention.convert(db)
+        if args.months is None:
+            return
+        if not _retention.is_incremental(db):
+            logger.warning('Database is not in incremental vacuum mode, '
+                           'freed pages are kept in file, see --convert')
+        job = _retention.Retention(db, args.months, args.archive, args.chunk,
+                                   args.vacuum_pages)
+        done = job.run(args.budget)
+        logger.info('Deleted %s readings, vacuumed %s pages%s', job.deleted,
+                    job.vacuumed, '' if done else ', not finished')
+    except (_retention.RetentionError, IOError, OSError) as e:
+        logger.error(str(e))
+        return -1
+    finally:
+        db.close()
+        common.write_metrics(args)
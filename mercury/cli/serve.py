@@ -0,0 +1,33 @@
+__author__ = 'Gennady Kovalev <gik@bigur.ru>'
+__copyright__ = '(c) 2015-2016 Business group for development management'
+__licence__ = 'GPL'
+
+import logging
+
+from .. import api
+
+
+logger = logging.getLogger('root')
+
+
+def run(parser, args):
+    # API runs until interrupted, other process polls
+    try:
+        address = api.parse_address(args.address)
+    except api.ApiError as e:
+        parser.error(str(e))
+    if args.ttl <= 0:
+        parser.error('invalid ttl')
+
+    try:
+        server = api.Server(args.dbase, address,
+                            api.LatestReadings(ttl=args.ttl))
+    except IOError as e:
+        logger.error('Can\'t serve API: %s', e)
+        return -1
+    server.start()
+    try:
+        while server.is_alive():
+            server.join(1)
+    except KeyboardInterrupt:
+        server.stop()
@@ -0,0 +1,105 @@
+__author__ = 'Gennady Kovalev <gik@bigur.ru>'
+__copyright__ = '(c) 2015-2016 Business group for development management'
+__licence__ = 'GPL'
+
+import logging
+import itertools
+
+from .. import hub as _hub
+from .. import command
+from . import common
+
+
+logger = logging.getLogger('root')
+
+
+def _date(date):
+    return '-' if date is None else date.strftime('%d.%m.%y %H:%M')
+
+
+def _value(value):
+    return '-' if value is None else str(value)
+
+
+def print_readings(hub, counter):
+    reading = hub.execute(command.GetLastPacket(counter),
+                          command.PRIORITY_INTERACTIVE)
+    if not reading:
+        print 'There is no readings for counter %s' % counter
+        return
+
+    print 'Reading for counter %s' % counter
+    print ' Date:  %s' % _date(reading['date'])
+    print ' Type:  0x%02x' % reading['type']
+    print ' Level: %s' % reading['level']
+    print ' Value: %s' % reading['value']
+    print
+
+    history = hub.execute(command.GetHistory(counter),
+                          command.PRIORITY_INTERACTIVE)
+    history = [x for x in history if x['type'] > 0]
+    history = sorted(history, key=lambda x: x['date'])
+    print 'History:'
+    print 'Date            Type Level Reading'
+    print '==============  ==== ===== ======='
+    for record in history:
+        print ('{: >14}  0x{:02x} {: >5d} {: >7s}'.format(
+                    _date(record['date']), record['type'], record['level'],
+                    _value(record['value'])))
+
+
+def print_last_readings(hub):
+    config = hub.execute(command.GetConfig(), command.PRIORITY_INTERACTIVE)
+    print 'Counter  Date            Type Level Reading'
+    print '=======  ==============  ==== ===== ======='
+    counters = range(0, config['counters'])
+    readings = hub.execute_many((command.GetLastPacket(x) for x in counters),
+                                command.PRIORITY_INTERACTIVE)
+    for counter, reading in itertools.izip(counters, readings):
+        if reading is None:
+            continue
+        print ('{: >7d}  {: >14}  0x{:02x} {: >5d} {: >7s}'.format(
+                    counter, _date(reading['date']), reading['type'],
+                    reading['level'], _value(reading['value'])))
+
+
+def print_hubs(args):
+    # Only this one needs the database
+    from .. import storage
+    db = storage.connect(args.dbase)
+    try:
+        print 'Device            Address  Network  Last seen'
+        print '================  =======  =======  ==================='
+        for device, address, network_id, _, last_seen in \
+                storage.HubCache(db).hubs():
+            print '{: <16}  {: >7}  {: >7}  {}'.format(device, hex(address),
+                                                       hex(network_id),
+                                                       last_seen[:19])
+    finally:
+        db.close()
+
+
+def run(parser, args):
+    if args.what == 'hubs':
+        return print_hubs(args)
+    if args.what == 'readings':
+        if args.counter is None:
+            parser.error('counter is required')
+        if args.counter < 0 or args.counter > 1023:
+            parser.error('invalid counter address')
+
+    try:
+        with common.hubs(parser, args) as hubs:
+            for hub in hubs:
+                if args.what == 'address':
+                    print('Hub address: %s' %
+                          hex(hub.execute(command.GetNetworkID())))
+                elif args.what == 'config':
+                    common.print_config(hub.execute(command.GetConfig()))
+                elif args.what == 'readings':
+                    print_readings(hub, args.counter)
+                else:
+                    print_last_readings(hub)
+    except _hub.OperationalError as e:
+        logger.error(str(e))
+        return -1
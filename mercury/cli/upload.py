@@ -0,0 +1,40 @@
+__author__ = 'Gennady Kovalev <gik@bigur.ru>'
+__copyright__ = '(c) 2015-2016 Business group for development management'
+__licence__ = 'GPL'
+
+import logging
+
+from .. import upload as _upload
+from .. import outbox
+from .. import storage
+from . import common
+
+
+logger = logging.getLogger('root')
+
+
+def run(parser, args):
+    if args.page_size < 1:
+        parser.error('invalid upload page size')
+
+    try:
+        login, password = _upload.load_credentials(args.credentials)
+    except _upload.UploadError as e:
+        logger.error(str(e))
+        return -1
+
+    # New readings go to outbox first, then due batches are sent
+    db = storage.connect(args.dbase)
+    limit = None if args.all else 1
+    try:
+        outbox.fill(db, args.page_size)
+        with _upload.Portal(args.url, login, password, args.gzip) as portal:
+            sent = outbox.send(db, portal, limit)
+        if not sent:
+            logger.debug('No data, exiting')
+    except _upload.UploadError as e:
+        logger.error(str(e))
+        return -1
+    finally:
+        db.close()
+        common.write_metrics(args)
@@ -7,6 +7,7 @@ __all__ = ['GetNetworkId']
 import struct
 import logging
 import datetime
+import collections
 
 
 logger = logging.getLogger('root')
@@ -46,12 +47,146 @@ table = [0x0000, 0xd401, 0xa902, 0x7d03, 0x5304, 0x8705, 0xfa06, 0x2e07,
 	 0x2ef8, 0xfaf9, 0x87fa, 0x53fb, 0x7dfc, 0xa9fd, 0xd4fe, 0x00ff]
 
 
+def _make_crc24_table(poly=0x01864cfb):
+    result = []
+    for i in xrange(256):
+        crc = i << 16
+        for j in xrange(8):
+            crc <<= 1
+            if crc & 0x1000000: crc ^= poly
+        result.append(crc & 0xffffff)
+    return result
+
+crc24_table = _make_crc24_table()
+
+
+def crc24(octets, crc=0x00b704ce):
+    for octet in bytearray(octets):
+        crc = ((crc << 8) & 0xffffff) ^ crc24_table[(crc >> 16) ^ octet]
+    return crc
+
+
+def checksum(octets):
+    return (sum(bytearray(octets)) - 1) & 0xff
+
+
+def encode_frame(source, destination, code, data):
+    payload = chr(code) + data
+    header = struct.pack('<HHB', source, destination, len(payload))
+    return (struct.pack('<I', crc24(header))[:-1] + header + payload +
+            chr(checksum(payload)))
+
+
+# Cache of encoded request frames, key is (source, destination, code, data)
+_frames = {}
+_frames_limit = 8192
+
+# Priorities of commands on a shared bus, lower goes first
+PRIORITY_INTERACTIVE = 0
+PRIORITY_NORMAL = 1
+PRIORITY_BULK = 2
+
+
+# Reading record: type, base, increment, control code, level and date
+# stamp of minute, hour, day - 1, month - 1, year - 2000
+record = struct.Struct('<BHBBB5s')
+
+# Readings of all counters are stamped with few distinct dates, so decoded
+# dates are cached by raw stamp
+_dates = {}
+_dates_limit = 4096
+
+
+def _decode_date(stamp):
+    try:
+        return _dates[stamp]
+    except KeyError:
+        pass
+    m, h, d, month, year = bytearray(stamp)
+    try:
+        dt = datetime.datetime(2000 + year, month + 1, d + 1, h, m)
+    except ValueError:
+        dt = None
+    if len(_dates) >= _dates_limit:
+        _dates.clear()
+    _dates[stamp] = dt
+    return dt
+
+
+class Reading(collections.namedtuple('Reading', 'level type date value')):
+
+    __slots__ = ()
+
+    # Dict-like access, as readings were dicts before
+    def __getitem__(self, key):
+        if isinstance(key, basestring):
+            try:
+                return getattr(self, key)
+            except AttributeError:
+                raise KeyError(key)
+        return tuple.__getitem__(self, key)
+
+    def __contains__(self, key):
+        return key in self._fields
+
+    def get(self, key, default=None):
+        if key in self._fields:
+            return getattr(self, key)
+        return default
+
+    def keys(self):
+        return self._fields
+
+    def items(self):
+        return zip(self._fields, self)
+
+
+def decode_readings(octets, offset=0, skip_invalid=True):
+    unpack_from = record.unpack_from
+    new = tuple.__new__
+    dates = _dates
+    readings = []
+    for offset in xrange(offset, len(octets), record.size):
+        dtype, base, inc, cc, level, stamp = unpack_from(octets, offset)
+        dt = dates[stamp] if stamp in dates else _decode_date(stamp)
+        if dt is None and skip_invalid:
+            continue
+        if table[inc] == (cc << 8 | inc):
+            value = base + inc
+        else:
+            value = None
+        readings.append(new(Reading, (level, dtype, dt, value)))
+    return readings
+
+
+def decode_reading(octets, offset=0):
+    return decode_readings(octets[offset:offset + record.size],
+                           skip_invalid=False)[0]
+
+
 class CommandError(Exception):
     pass
 
 
+class HexDump(object):
+
+    # Formats octets only when message is really logged
+    __slots__ = ('octets',)
+
+    def __init__(self, octets):
+        self.octets = octets
+
+    def __str__(self):
+        if self.octets is None:
+            return 'None'
+        return ' '.join([hex(ord(x))[2:].zfill(2) for x in self.octets])
+
+
 class Command(object):
 
+    # Default priority on the bus, callers may override it
+    priority = PRIORITY_NORMAL
+
     def __init__(self):
         self._source = None
         self._destination = None
@@ -59,26 +194,10 @@ class Command(object):
         self._response_data = None
 
     def __crc24(self, octets):
-        poly = 0x01864cfb
-        crc = 0x00b704ce
-        for octet in octets:
-            crc ^= (ord(octet) << 16)
-            for i in xrange(8):
-                crc <<= 1
-                if crc & 0x1000000: crc ^= poly
-        return crc & 0xffffff
+        return crc24(octets)
 
     def __checksum(self, octets):
-        s = 0
-        for octet in octets:
-            s += ord(octet)
-        s -= 1
-        return s & 0xff
-
-    def _dump(self, data):
-        if data is None:
-            return 'None'
-        return ' '.join([hex(ord(x))[2:].zfill(2) for x in data])
+        return checksum(octets)
 
     @property
     def source(self):
@@ -106,34 +225,16 @@ class Command(object):
     def _request_data(self):
         raise NotImplementedError('inherit required')
 
-    @property
-    def _request_payload(self):
-        return struct.pack('<B{}s'.format(
-            len(self._request_data)), self._request_code, self._request_data)
-
-    @property
-    def _request_length(self):
-        return struct.pack('<B', len(self._request_payload))
-
-    @property
-    def _request_crc(self):
-        octets = struct.pack('<HHs', self.source, self.destination,
-                             self._request_length)
-        return struct.pack('<I', self.__crc24(octets))[:-1]
-
-    @property
-    def _request_checksum(self):
-        return struct.pack('<B', self.__checksum(self._request_payload))
-
     @property
     def request(self):
-        octets = struct.pack('<3sHHs{}ss'.format(len(self._request_payload)),
-                             self._request_crc,
-                             self.source,
-                             self.destination,
-                             self._request_length,
-                             self._request_payload,
-                             self._request_checksum)
+        code, data = self._request_code, self._request_data
+        key = (self.source, self.destination, code, data)
+        octets = _frames.get(key)
+        if octets is None:
+            octets = encode_frame(*key)
+            if len(_frames) >= _frames_limit:
+                _frames.clear()
+            _frames[key] = octets
         return octets
 
     # Parse response
@@ -215,6 +316,8 @@ class SetConfig(GetConfig):
 
     _request_code = 0x00
 
+    priority = PRIORITY_INTERACTIVE
+
     def __init__(self, config):
         assert set(config.keys()) == {'counters', 'config'}
         assert set(config['config'].keys()) == {'transparent_mode',
@@ -247,10 +350,6 @@ class GetLastPacket(Command):
         self._counter = counter
         super(GetLastPacket, self).__init__()
 
-    def _restore_value(self, base, inc, cc):
-        if table[inc] == (cc * 0x100 + inc):
-            return base + inc
-
     @property
     def _request_data(self):
         return struct.pack('<H', self._counter)
@@ -261,24 +360,9 @@ class GetLastPacket(Command):
                     'incorrect response code (%s)' % hex(self._response_code)
         if len(self._response_data) == 0:
             return
-        assert len(self._response_data) == 13, 'incorrect response length'
-
-        addr, dtype, base, inc, cc, level, m, h, d, month, year = \
-                            struct.unpack('<HBHBBBBBBBB', self._response_data)
-
-        result = {}
-        result['level'] = level
-        result['type']  = dtype
-
-        try:
-            dt = datetime.datetime(2000 + year, month + 1, d + 1, h, m)
-        except ValueError, e:
-            dt = None
-        result['date']  = dt
-
-        result['value'] = self._restore_value(base, inc, cc)
-
-        return result
+        assert len(self._response_data) == 2 + record.size, \
+                    'incorrect response length'
+        return decode_reading(self._response_data, 2)
 
 
 # ------------------------------------------------------------------------------
@@ -286,6 +370,8 @@ class GetHistory(Command):
 
     _request_code = 0x85
 
+    priority = PRIORITY_BULK
+
     def __init__(self, counter):
         self._counter = counter
         super(GetHistory, self).__init__()
@@ -294,38 +380,22 @@ class GetHistory(Command):
     def _request_data(self):
         return struct.pack('<H', self._counter)
 
-    def _restore_value(self, base, inc, cc):
-        if table[inc] == (cc * 0x100 + inc):
-            return base + inc
-
-    @property
-    def result(self):
+    def _check_response(self):
         assert self._response_code == 0x85, \
                     'incorrect response code (%s)' % hex(self._response_code)
         octets = self._response_data
         if len(octets) == 0:
-            return
+            return False
         assert len(octets) > 2, 'incorrect response length'
 
-        addr, = struct.unpack('<H', octets[0:2])
+        addr, = struct.unpack_from('<H', octets)
         assert addr == self._counter, ('response for another counter '
                                        '%s' % self._counter)
+        assert (len(octets) - 2) % record.size == 0, \
+                    'incorrect response length'
+        return True
 
-        octets = octets[2:]
-        assert len(octets) % 11 == 0, 'incorrect response length'
-
-        records = []
-        for i in range(0, len(octets) / 11):
-            dtype, base, inc, cc, level, m, h, d, month, year = \
-                                    struct.unpack('<BHBBBBBBBB', octets[0:11])
-            octets = octets[11:]
-            value = self._restore_value(base, inc, cc)
-            try:
-                dt = datetime.datetime(2000 + year, month + 1, d + 1, h, m)
-            except ValueError, e:
-                dt = None
-            else:
-                records.append({'level': level, 'type': dtype, 'date': dt,
-                                'value': value})
-
-        return records
+    @property
+    def result(self):
+        if self._check_response():
+            return decode_readings(self._response_data, 2)
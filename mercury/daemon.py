@@ -0,0 +1,495 @@
+__author__ = 'Gennady Kovalev <gik@bigur.ru>'
+__copyright__ = '(c) 2015-2016 Business group for development management'
+__licence__ = 'GPL'
+
+# Polling daemon. Ports and database stay open between jobs, hubs are
+# polled on their own intervals. Configuration is an ini file:
+#
+#     [daemon]
+#     dbase = /var/lib/mercury/mercury.db
+#     metrics = /var/lib/node_exporter/mercury.prom
+#     upload_interval = 3600
+#     upload_credentials = /etc/mercury/credentials.txt
+#
+# Upload job only packs new readings into outbox, a background worker
+# sends it, so an outage of the portal just grows the outbox.
+#
+#     [hub first]
+#     device = /dev/ttyUSB0
+#     address = 0x2f01
+#     interval = 900
+#     jitter = 60
+#
+# With api = 127.0.0.1:8180 in [daemon] the read API is served, polling
+# keeps its cache of latest readings up to date.
+#
+# With retention_months = 24 in [daemon] raw readings older than so many
+# months are deleted when exported, and archived to retention_archive
+# directory if it is given. Retention runs in chunks of retention_budget
+# seconds between other jobs until it is done.
+#
+# With discovered = yes in [daemon] hubs found by discovery during last
+# discovered_max_age days are polled too, section [discovered] holds
+# their options.
+#
+# SIGHUP reloads configuration, SIGTERM stops after current counter.
+
+import time
+import heapq
+import signal
+import sqlite3
+import random
+import logging
+import ConfigParser
+
+from . import hub as _hub
+from . import poll
+from . import device
+from . import command
+from . import storage
+from . import metrics
+from . import upload
+from . import outbox
+from . import api
+from . import retention
+
+
+logger = logging.getLogger('energo.daemon')
+
+
+DAEMON_DEFAULTS = {
+    'dbase': 'mercury.db',
+    'metrics': '',
+    'upload_interval': '3600',
+    'upload_jitter': '60',
+    'upload_url': 'https://bigur.com/',
+    'upload_credentials': 'credentials.txt',
+    'upload_page_size': '100',
+    'upload_gzip': 'no',
+    'upload_backoff': '30',
+    'upload_max_backoff': '3600',
+    'outbox_keep': '30',
+    'api': '',
+    'api_cache_size': '65536',
+    'retention_months': '0',
+    'retention_archive': '',
+    'retention_interval': '3600',
+    'retention_budget': '1',
+    'retention_chunk': '500',
+    'vacuum_pages': '256',
+    'discovered': 'no',
+    'discovered_max_age': '7',
+}
+
+HUB_DEFAULTS = {
+    'device': '/dev/ttyUSB0',
+    'address': '0x2fff',
+    'interval': '900',
+    'jitter': '60',
+    'config_interval': '86400',
+    'sweep': '32',
+    'timeout': '8',
+    'min_timeout': '0.5',
+    'retries': '1',
+    'backoff': '0.5',
+    'failures': '5',
+    'cooldown': '300',
+}
+
+
+class DaemonError(Exception):
+    pass
+
+
+def _options(parser, section, defaults, types):
+    options = dict(defaults)
+    if parser.has_section(section):
+        options.update(parser.items(section))
+    unknown = set(options) - set(defaults)
+    if unknown:
+        raise DaemonError('unknown options in [{}]: {}'.format(
+                                        section, ', '.join(sorted(unknown))))
+    try:
+        for name, convert in types.iteritems():
+            options[name] = convert(options[name])
+    except ValueError as e:
+        raise DaemonError('invalid option in [{}]: {}'.format(section, e))
+    return options
+
+
+def _boolean(value):
+    if value.lower() in ('1', 'yes', 'true', 'on'):
+        return True
+    if value.lower() in ('0', 'no', 'false', 'off'):
+        return False
+    raise ValueError('not a boolean: {}'.format(value))
+
+
+def _hub_options(parser, section):
+    hub = _options(parser, section, HUB_DEFAULTS, {
+                                'address': lambda x: int(x, 16),
+                                'interval': float,
+                                'jitter': float,
+                                'config_interval': float,
+                                'sweep': int,
+                                'timeout': float,
+                                'min_timeout': float,
+                                'retries': int,
+                                'backoff': float,
+                                'failures': int,
+                                'cooldown': float})
+    if hub['address'] < 0 or hub['address'] > 65535:
+        raise DaemonError('invalid address in [{}]'.format(section))
+    if hub['interval'] <= 0 or hub['timeout'] <= 0 or \
+            hub['min_timeout'] <= 0 or hub['failures'] < 1:
+        raise DaemonError('invalid options in [{}]'.format(section))
+    return hub
+
+
+def load_config(path):
+    # Returns daemon options and {section: hub options}. Option discovered
+    # is replaced with options of discovered hubs or None.
+    parser = ConfigParser.RawConfigParser()
+    try:
+        if not parser.read(path):
+            raise DaemonError('can\'t read config {}'.format(path))
+    except ConfigParser.Error as e:
+        raise DaemonError(e)
+
+    options = _options(parser, 'daemon', DAEMON_DEFAULTS, {
+                                'upload_interval': float,
+                                'upload_jitter': float,
+                                'upload_page_size': int,
+                                'upload_gzip': _boolean,
+                                'upload_backoff': float,
+                                'upload_max_backoff': float,
+                                'outbox_keep': float,
+                                'api_cache_size': int,
+                                'retention_months': int,
+                                'retention_interval': float,
+                                'retention_budget': float,
+                                'retention_chunk': int,
+                                'vacuum_pages': int,
+                                'discovered': _boolean,
+                                'discovered_max_age': float})
+    if options['upload_interval'] < 0 or options['upload_page_size'] < 1:
+        raise DaemonError('invalid upload options')
+
+    if options['retention_months'] < 0 or \
+            options['retention_interval'] <= 0 or \
+            options['retention_budget'] <= 0 or \
+            options['retention_chunk'] < 1 or options['vacuum_pages'] < 1:
+        raise DaemonError('invalid retention options')
+
+    if options['api']:
+        try:
+            options['api'] = api.parse_address(options['api'])
+        except api.ApiError as e:
+            raise DaemonError(e)
+
+    if options['discovered']:
+        options['discovered'] = _hub_options(parser, 'discovered')
+    else:
+        options['discovered'] = None
+
+    hubs = {}
+    for section in parser.sections():
+        if section.startswith('hub '):
+            hubs[section] = _hub_options(parser, section)
+    if not hubs and options['discovered'] is None:
+        raise DaemonError('no hubs in config {}'.format(path))
+    return options, hubs
+
+
+class HubJob(object):
+
+    def __init__(self, name, options, transport):
+        self.name = name
+        self.options = options
+        self.interval = options['interval']
+        self.jitter = options['jitter']
+        self.hub = _hub.Hub(options['device'], options['address'],
+                            timeout=options['timeout'],
+                            min_timeout=options['min_timeout'],
+                            retries=options['retries'],
+                            backoff=options['backoff'],
+                            failures=options['failures'],
+                            cooldown=options['cooldown'],
+                            transport=transport)
+
+        # Network id and config rarely change, they are asked again only
+        # after config_interval or a failure
+        self._address = None
+        self._config = None
+        self._refreshed = None
+
+    def _refresh(self):
+        now = time.time()
+        if self._refreshed is not None and \
+                now - self._refreshed < self.options['config_interval']:
+            return
+        logger.debug('Refresh network id and config of %s', self.name)
+        self._address = self.hub.execute(command.GetNetworkID())
+        self._config = self.hub.execute(command.GetConfig())
+        self._refreshed = now
+
+    def run(self, db, stop):
+        try:
+            self._refresh()
+            poll.download_readings(self.hub, db, self.options['sweep'],
+                                   address=self._address,
+                                   config=self._config, stop=stop)
+        except _hub.OperationalError as e:
+            logger.error('Hub %s: %s', self.name, e)
+            self._refreshed = None
+
+
+class UploadJob(object):
+
+    name = 'upload'
+
+    def __init__(self, options):
+        self.options = options
+        self.interval = options['upload_interval']
+        self.jitter = options['upload_jitter']
+        self.worker = outbox.Worker(options['dbase'], self._portal,
+                                    options['upload_interval'],
+                                    options['upload_backoff'],
+                                    options['upload_max_backoff'])
+        self.worker.start()
+
+    def _portal(self):
+        options = self.options
+        login, password = upload.load_credentials(
+                                            options['upload_credentials'])
+        return upload.Portal(options['upload_url'], login, password,
+                             options['upload_gzip'])
+
+    def run(self, db, stop):
+        batches = outbox.fill(db, self.options['upload_page_size'])
+        outbox.purge(db, self.options['outbox_keep'])
+        count, readings = outbox.backlog(db)
+        metrics.registry.inc('mercury_outbox_batches_total', batches)
+        logger.debug('Outbox: %s new batches, %s batches with %s readings '
+                     'to send', batches, count, readings)
+        if batches:
+            self.worker.wake()
+
+    def close(self):
+        self.worker.stop()
+        self.worker.join(self.__join_timeout__)
+
+    # Time to wait for worker finishing current request
+    __join_timeout__ = 30
+
+
+class RetentionJob(object):
+
+    name = 'retention'
+
+    # Delay between chunks of unfinished work
+    __busy_interval__ = 5
+
+    def __init__(self, options):
+        self.options = options
+        self.jitter = 0
+        self.interval = options['retention_interval']
+
+    def run(self, db, stop):
+        options = self.options
+        try:
+            done = retention.Retention(db, options['retention_months'],
+                                       options['retention_archive'],
+                                       options['retention_chunk'],
+                                       options['vacuum_pages']).run(
+                                            options['retention_budget'])
+        except (retention.RetentionError, IOError, OSError) as e:
+            logger.error('Retention: %s', e)
+            done = True
+        if done:
+            self.interval = options['retention_interval']
+        else:
+            self.interval = self.__busy_interval__
+
+
+class Daemon(object):
+
+    # Longest sleep between checks of signal flags
+    __tick__ = 1
+
+    def __init__(self, path):
+        self._path = path
+        self._options = None
+        self._db = None
+        self._ports = {}
+        self._jobs = {}
+        self._queue = []
+        self._sequence = 0
+        self._reload = False
+        self._stopping = False
+        self._api = None
+        self._cache = None
+
+    def _schedule(self, job, delay):
+        self._sequence += 1
+        due = time.time() + delay + random.uniform(0, job.jitter)
+        heapq.heappush(self._queue, (due, self._sequence, job))
+
+    def load(self):
+        options, hubs = load_config(self._path)
+
+        if self._options is None or self._options['dbase'] != options['dbase']:
+            if self._db is not None:
+                self._db.close()
+            self._db = storage.connect(options['dbase'])
+
+        if options['discovered'] is not None:
+            configured = set((x['device'], x['address'])
+                             for x in hubs.itervalues())
+            cache = storage.HubCache(self._db)
+            for path, address, _, _, _ in \
+                    cache.hubs(options['discovered_max_age']):
+                if (path, address) not in configured:
+                    hub = dict(options['discovered'], device=path,
+                               address=address)
+                    hubs['hub {} {}'.format(path, hex(address))] = hub
+
+        # Jobs of unchanged hubs keep their state: latency, breaker and
+        # cached config
+        jobs = {}
+        for name, hub in hubs.iteritems():
+            job = self._jobs.get(name)
+            if job is None or job.options != hub:
+                port = self._ports.get(hub['device'])
+                if port is None:
+                    port = self._ports[hub['device']] = device.get_device(
+                                                                hub['device'])
+                job = HubJob(name, hub, port)
+            jobs[name] = job
+        if options['upload_interval']:
+            job = self._jobs.get(UploadJob.name)
+            if job is None or job.options != options:
+                job = UploadJob(options)
+            jobs[job.name] = job
+        if options['retention_months']:
+            job = self._jobs.get(RetentionJob.name)
+            if job is None or job.options != options:
+                job = RetentionJob(options)
+            jobs[job.name] = job
+        replaced = self._jobs.get(UploadJob.name)
+        if replaced is not None and jobs.get(UploadJob.name) is not replaced:
+            replaced.close()
+
+        self._serve(options)
+
+        used = set(x['device'] for x in hubs.itervalues())
+        for path in list(self._ports):
+            if path not in used:
+                self._ports.pop(path).close()
+
+        # Kept jobs stay on their schedule, new ones run at once
+        queue = [x for x in self._queue if jobs.get(x[2].name) is x[2]]
+        heapq.heapify(queue)
+        self._queue = queue
+        queued = set(x[2].name for x in queue)
+        for job in jobs.itervalues():
+            if job.name not in queued:
+                self._schedule(job, 0)
+
+        self._options = options
+        self._jobs = jobs
+        logger.info('Loaded %s hubs from %s', len(hubs), self._path)
+
+    def _serve(self, options):
+        # API is restarted when its options change, cache is fed by
+        # History of this process
+        keys = ('dbase', 'api', 'api_cache_size')
+        if self._options is not None and \
+                all(self._options[x] == options[x] for x in keys):
+            return
+        self._stop_api()
+        if not options['api']:
+            return
+        self._cache = api.LatestReadings(options['api_cache_size'])
+        storage.subscribe(self._cache.update)
+        try:
+            self._api = api.Server(options['dbase'], options['api'],
+                                   self._cache)
+        except IOError as e:
+            self._stop_api()
+            raise DaemonError('can\'t serve API: {}'.format(e))
+        self._api.start()
+
+    def _stop_api(self):
+        if self._api is not None:
+            self._api.stop()
+            self._api = None
+        if self._cache is not None:
+            storage.unsubscribe(self._cache.update)
+            self._cache = None
+
+    def _on_reload(self, signum, frame):
+        self._reload = True
+
+    def _on_stop(self, signum, frame):
+        self._stopping = True
+
+    def stop(self):
+        return self._stopping
+
+    def run(self):
+        self.load()
+        signal.signal(signal.SIGHUP, self._on_reload)
+        signal.signal(signal.SIGTERM, self._on_stop)
+        signal.signal(signal.SIGINT, self._on_stop)
+        try:
+            while not self._stopping:
+                if self._reload:
+                    self._reload = False
+                    try:
+                        self.load()
+                    except DaemonError as e:
+                        logger.error('Keep old config: %s', e)
+
+                if not self._queue:
+                    time.sleep(self.__tick__)
+                    continue
+                due, _, job = self._queue[0]
+                delay = due - time.time()
+                if delay > 0:
+                    time.sleep(min(delay, self.__tick__))
+                    continue
+
+                heapq.heappop(self._queue)
+                self._run_job(job)
+                self._schedule(job, job.interval)
+                if self._options['metrics']:
+                    metrics.write_prometheus(metrics.registry,
+                                             self._options['metrics'])
+        finally:
+            self.close()
+        logger.info('Stopped')
+
+    def _run_job(self, job):
+        # Database may be locked by cli or api longer than busy timeout,
+        # the job just runs again on its next turn
+        with metrics.registry.timer('mercury_job_seconds', job=job.name):
+            try:
+                job.run(self._db, self.stop)
+            except sqlite3.Error as e:
+                self._db.rollback()
+                metrics.registry.inc('mercury_job_errors_total',
+                                     job=job.name)
+                logger.error('Job %s: database error: %s', job.name, e)
+
+    def close(self):
+        self._stop_api()
+        job = self._jobs.get(UploadJob.name)
+        if job is not None:
+            job.close()
+        for port in self._ports.itervalues():
+            port.close()
+        self._ports = {}
+        if self._db is not None:
+            self._db.close()
+            self._db = None
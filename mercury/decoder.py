@@ -0,0 +1,138 @@
+__author__ = 'Gennady Kovalev <gik@bigur.ru>'
+__copyright__ = '(c) 2015-2016 Business group for development management'
+__licence__ = 'GPL'
+
+import struct
+import logging
+import collections
+
+from . import command
+
+
+logger = logging.getLogger('energo.decoder')
+
+
+Frame = collections.namedtuple('Frame',
+                        'crc src dst length code data checksum octets')
+
+
+class FrameDecoder(object):
+
+    # Frame is 3 bytes crc, 2 bytes source, 2 bytes destination, 1 byte
+    # length, length bytes payload and 1 byte checksum.
+    __header__ = 8
+
+    # Data lives in a preallocated buffer between start and end, port
+    # reads go straight into its free tail
+    __capacity__ = 4096
+    __reserve__ = 512
+
+    def __init__(self, on_error=None):
+        self._buffer = bytearray(self.__capacity__)
+        self._view = memoryview(self._buffer)
+        self._start = 0
+        self._end = 0
+        self.dropped = 0
+        self.checksum_errors = 0
+
+        # on_error(reason, count) is called for skipped garbage and frames
+        # with wrong checksum
+        self._on_error = on_error
+
+    def __len__(self):
+        return self._end - self._start
+
+    def __iter__(self):
+        while True:
+            frame = self.decode()
+            if frame is None:
+                break
+            yield frame
+
+    def _reserve(self, size):
+        # Makes room for size bytes after end
+        if self._end + size <= len(self._buffer):
+            return
+        pending = self._end - self._start
+        if pending + size > len(self._buffer):
+            # Buffer can't be resized while view is exported
+            self._view = None
+            self._buffer.extend(bytearray(pending + size -
+                                          len(self._buffer)))
+            self._view = memoryview(self._buffer)
+        self._buffer[0:pending] = self._buffer[self._start:self._end]
+        self._start = 0
+        self._end = pending
+
+    def feed(self, octets):
+        size = len(octets)
+        self._reserve(size)
+        self._buffer[self._end:self._end + size] = octets
+        self._end += size
+
+    def readinto(self, port, timeout=None):
+        # Reads port into free tail of buffer, returns number of bytes
+        self._reserve(self.__reserve__)
+        n = port.readinto(self._view[self._end:], timeout)
+        self._end += n
+        return n
+
+    def pending(self):
+        return bytes(self._buffer[self._start:self._end])
+
+    def clear(self):
+        self._start = self._end = 0
+
+    def decode(self, final=False):
+        buf = self._buffer
+        table = command.crc24_table
+        size = self._end
+        start = pos = self._start
+        frame = None
+        while size - pos > self.__header__:
+            length = buf[pos + 7]
+            if length:
+                crc = 0x00b704ce
+                for i in xrange(pos + 3, pos + self.__header__):
+                    crc = ((crc << 8) & 0xffffff) ^ table[(crc >> 16) ^ buf[i]]
+            if not length or crc != \
+                    buf[pos] | (buf[pos + 1] << 8) | (buf[pos + 2] << 16):
+                pos += 1
+                continue
+
+            end = pos + self.__header__ + length + 1
+            if end > size:
+                # Wait for the rest of frame, or treat header as noise if
+                # no more data is expected
+                if final:
+                    pos += 1
+                    continue
+                break
+
+            payload = buf[pos + self.__header__:end - 1]
+            if buf[end - 1] != (sum(payload) - 1) & 0xff:
+                self.checksum_errors += 1
+                if self._on_error is not None:
+                    self._on_error('checksum', 1)
+                pos += 1
+                continue
+
+            src, dst = struct.unpack_from('<HH', buf, pos + 3)
+            octets = bytes(buf[pos:end])
+            frame = Frame(octets[:3], src, dst, length, payload[0],
+                          bytes(payload[1:]), buf[end - 1], octets)
+            break
+
+        skipped = pos - start
+        if skipped:
+            logger.debug('Skip %s bytes of garbage', skipped)
+            self.dropped += skipped
+            if self._on_error is not None:
+                self._on_error('garbage', skipped)
+        if frame is not None:
+            pos = end
+        if pos >= size:
+            self._start = self._end = 0
+        else:
+            self._start = pos
+        return frame
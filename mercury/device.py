@@ -0,0 +1,306 @@
+__author__ = 'Gennady Kovalev <gik@bigur.ru>'
+__copyright__ = '(c) 2015-2016 Business group for development management'
+__licence__ = 'GPL'
+
+# One configured port per device path shared by all hubs on the bus.
+# Request and response are one transaction: hubs wait for the bus by
+# priority of the command and in order of arrival within one priority,
+# so an interactive command gets the bus at the next frame boundary of a
+# bulk download. Other processes are kept out with flock. Frames read
+# from the port are routed to hubs by source address.
+
+import time
+import heapq
+import errno
+import fcntl
+import logging
+import threading
+import collections
+
+from . import serial
+from . import capture
+from . import command
+from . import decoder
+from . import metrics
+
+
+logger = logging.getLogger('energo.device')
+
+
+class PriorityLock(object):
+
+    # Lock granted to the lowest priority value, in order of requests
+    # within one priority. A ticket may be taken and polled instead of
+    # waited for.
+    def __init__(self):
+        self._condition = threading.Condition()
+        self._waiting = []
+        self._next = 0
+        self._locked = False
+
+    def request(self, priority=command.PRIORITY_NORMAL):
+        with self._condition:
+            ticket = (priority, self._next)
+            self._next += 1
+            heapq.heappush(self._waiting, ticket)
+            return ticket
+
+    def take(self, ticket):
+        # Locks if the ticket is the first one and the lock is free
+        with self._condition:
+            return self._take(ticket)
+
+    def _take(self, ticket):
+        if self._locked or self._waiting[0] != ticket:
+            return False
+        heapq.heappop(self._waiting)
+        self._locked = True
+        return True
+
+    def cancel(self, ticket):
+        with self._condition:
+            if ticket in self._waiting:
+                self._waiting.remove(ticket)
+                heapq.heapify(self._waiting)
+                self._condition.notify_all()
+
+    def acquire(self, priority=command.PRIORITY_NORMAL):
+        ticket = self.request(priority)
+        with self._condition:
+            while not self._take(ticket):
+                self._condition.wait()
+
+    def release(self, ticket=None):
+        # The ticket taken keeps its turn if returned back
+        with self._condition:
+            self._locked = False
+            if ticket is not None:
+                heapq.heappush(self._waiting, ticket)
+            self._condition.notify_all()
+
+
+class Device(object):
+
+    # Frames nobody asked for are kept so long for late readers
+    __mailbox__ = 64
+
+    def __init__(self, path, timeout=None):
+        self.path = path
+        self._port = serial.Serial(path, timeout)
+        self._serial = self._port
+        self.__timeout__ = self._serial.__timeout__
+        self._bus = PriorityLock()
+        self._io = threading.Lock()
+        self._reading = threading.Lock()
+        self._decoder = decoder.FrameDecoder(self._decoder_error)
+        self._frames = collections.deque(maxlen=self.__mailbox__)
+        self._arrived = 0
+        self._owner = None
+
+    def _decoder_error(self, reason, count):
+        metrics.registry.inc('mercury_frame_errors_total', count,
+                             device=self.path, reason=reason)
+
+    def channel(self, hub, timeout=None):
+        return Channel(self, hub, timeout)
+
+    def capture(self, path):
+        # Records traffic of all hubs on the bus to file until close
+        with self._reading:
+            self._serial = capture.CaptureSerial(self._port, path)
+
+    def open(self):
+        with self._reading:
+            if not self._serial.is_open():
+                self._serial.open()
+                try:
+                    self._serial.configure()
+                except serial.SerialError:
+                    self._serial.close()
+                    raise
+
+    def is_open(self):
+        return self._serial.is_open()
+
+    def fileno(self):
+        return self._serial.fileno()
+
+    def close(self):
+        with self._reading:
+            self._serial.close()
+            self._serial = self._port
+            self._decoder.clear()
+        with self._io:
+            self._frames.clear()
+
+    def _lock(self, owner, ticket=None):
+        # Port lock of other processes, the bus is held already
+        try:
+            fcntl.flock(self._serial.fileno(),
+                        fcntl.LOCK_EX if ticket is None else
+                        fcntl.LOCK_EX | fcntl.LOCK_NB)
+        except (IOError, serial.SerialError) as e:
+            if ticket is not None and getattr(e, 'errno', None) in \
+                    (errno.EAGAIN, errno.EWOULDBLOCK):
+                self._bus.release(ticket)
+                return False
+            self._bus.release()
+            raise serial.SerialError('can\'t lock {}'.format(self.path))
+        with self._io:
+            self._owner = owner
+        return True
+
+    def acquire(self, owner, priority=command.PRIORITY_NORMAL):
+        started = time.time()
+        self._bus.acquire(priority)
+        metrics.registry.observe('mercury_bus_wait_seconds',
+                                 time.time() - started, device=self.path,
+                                 priority=str(priority))
+        self._lock(owner)
+
+    def request(self, priority=command.PRIORITY_NORMAL):
+        # Ticket for try_acquire, it must be cancelled if not used
+        return self._bus.request(priority)
+
+    def try_acquire(self, owner, ticket):
+        # Acquires the bus if the ticket's turn came and no other process
+        # holds the port
+        if not self._bus.take(ticket):
+            return False
+        return self._lock(owner, ticket)
+
+    def cancel(self, ticket):
+        self._bus.cancel(ticket)
+
+    def release(self):
+        with self._io:
+            self._owner = None
+        try:
+            fcntl.flock(self._serial.fileno(), fcntl.LOCK_UN)
+        except (IOError, serial.SerialError):
+            pass
+        self._bus.release()
+
+    def write(self, octets, timeout=None):
+        return self._serial.write(octets, timeout)
+
+    def _pump(self, timeout, seen=None):
+        # Reads port once and routes complete frames. Doesn't wait if frames
+        # arrived since the seen count, another reader got them meanwhile.
+        with self._reading:
+            if seen is not None and seen != self._arrived:
+                return True
+            if not self._decoder.readinto(self._serial, timeout):
+                return False
+            frames = list(self._decoder)
+            with self._io:
+                self._frames.extend(frames)
+                self._arrived += len(frames)
+        return True
+
+    def take(self, source, owner=None):
+        # Oldest frame from source, any source for broadcast address. While
+        # bus is held, frames belong to its owner only.
+        with self._io:
+            if self._owner is not None and self._owner is not owner:
+                return None
+            for frame in self._frames:
+                if source == 0x2fff or frame.src == source:
+                    self._frames.remove(frame)
+                    return frame
+        return None
+
+    def receive(self, source, timeout, owner=None):
+        deadline = time.time() + timeout
+        while True:
+            seen = self._arrived
+            frame = self.take(source, owner)
+            if frame is not None:
+                return frame
+            timeleft = deadline - time.time()
+            if timeleft <= 0:
+                return None
+            self._pump(timeleft, seen)
+
+
+class Channel(object):
+
+    # Serial-like view of device for one hub. Bus is held from write
+    # until response or timeout. Hubs on one device may have different
+    # timeouts, the port's one is the default.
+    def __init__(self, device, hub, timeout=None):
+        self._device = device
+        self._hub = hub
+        self._holding = False
+        self.__timeout__ = device.__timeout__ if timeout is None else timeout
+
+    @property
+    def device(self):
+        return self._device
+
+    def open(self):
+        self._device.open()
+
+    def is_open(self):
+        return self._device.is_open()
+
+    def configure(self):
+        pass
+
+    def close(self):
+        self._finish()
+
+    def flush(self):
+        while self._device.take(self._hub.address) is not None:
+            pass
+
+    def _finish(self):
+        if self._holding:
+            self._holding = False
+            self._device.release()
+
+    def write(self, octets):
+        self._finish()
+        self._device.acquire(self, self._hub.priority)
+        self._holding = True
+        try:
+            return self._device.write(octets, self.__timeout__)
+        except serial.SerialError:
+            self._finish()
+            raise
+
+    def read_some(self, size=256, timeout=None):
+        if timeout is None:
+            timeout = self.__timeout__
+        if not self._holding:
+            # Frames already routed to the hub only. Port isn't read
+            # without the bus and lock, another process may be receiving.
+            frame = self._device.take(self._hub.address)
+            return frame.octets if frame is not None else ''
+
+        try:
+            frame = self._device.receive(self._hub.address, max(timeout, 0),
+                                         self)
+        except serial.SerialError:
+            self._finish()
+            raise
+        self._finish()
+        return frame.octets if frame is not None else ''
+
+    def readinto(self, buffer, timeout=None):
+        octets = self.read_some(len(buffer), timeout)
+        buffer[:len(octets)] = octets
+        return len(octets)
+
+
+_devices = {}
+_devices_lock = threading.Lock()
+
+
+def get_device(path):
+    # Timeouts are given to channels, one device serves all of them
+    with _devices_lock:
+        device = _devices.get(path)
+        if device is None:
+            device = _devices[path] = Device(path)
+        return device
@@ -0,0 +1,105 @@
+__author__ = 'Gennady Kovalev <gik@bigur.ru>'
+__copyright__ = '(c) 2015-2016 Business group for development management'
+__licence__ = 'GPL'
+
+# Hub discovery. Every address of range is asked for network id with a
+# short timeout. Requests go out in windows: a window of requests is sent
+# at once and answers are collected together, window=1 is a plain
+# request-response sweep for buses which can't take it. Devices are swept
+# in parallel, one thread per device.
+
+import time
+import logging
+import threading
+
+from . import serial
+from . import device as _device
+from . import command
+from . import storage
+
+
+logger = logging.getLogger('energo.discovery')
+
+
+FIRST_ADDRESS = 0x2f01
+LAST_ADDRESS = 0x2ffe
+
+
+class DiscoveryError(Exception):
+    pass
+
+
+def probe(bus, addresses, timeout=0.2, window=8):
+    # Yields (address, network id) of answered hubs on one device
+    owner = object()
+    bus.open()
+    addresses = list(addresses)
+    for i in xrange(0, len(addresses), window):
+        pending = {}
+        for address in addresses[i:i + window]:
+            cmd = command.GetNetworkID()
+            cmd.source = 0xffff
+            cmd.destination = address
+            pending[address] = cmd
+
+        bus.acquire(owner)
+        try:
+            for cmd in pending.itervalues():
+                bus.write(cmd.request)
+            deadline = time.time() + timeout
+            while pending:
+                frame = bus.receive(0x2fff, deadline - time.time(), owner)
+                if frame is None:
+                    break
+                cmd = pending.pop(frame.src, None)
+                if cmd is None:
+                    logger.debug('Unexpected frame from %s', hex(frame.src))
+                    continue
+                try:
+                    cmd.parse_response(frame.crc, frame.src, frame.dst,
+                                       frame.length, frame.code, frame.data,
+                                       frame.checksum)
+                    network_id = cmd.result
+                except (command.CommandError, AssertionError) as e:
+                    logger.warning('Hub %s: %s', hex(frame.src), e)
+                    continue
+                logger.debug('Hub %s answered', hex(frame.src))
+                yield frame.src, network_id
+        finally:
+            bus.release()
+
+
+def discover(devices, addresses, timeout=0.2, window=8):
+    # Sweeps devices in parallel, returns {device: [(address, network id)]}
+    addresses = list(addresses)
+    results = dict((x, []) for x in devices)
+    errors = {}
+
+    def sweep(path):
+        try:
+            for found in probe(_device.get_device(path), addresses, timeout,
+                               window):
+                results[path].append(found)
+        except serial.SerialError as e:
+            errors[path] = e
+
+    threads = [threading.Thread(target=sweep, args=(x,)) for x in devices]
+    for thread in threads:
+        thread.daemon = True
+        thread.start()
+    for thread in threads:
+        thread.join()
+
+    for path, e in sorted(errors.iteritems()):
+        logger.error('Device %s: %s', path, e)
+    if errors and len(errors) == len(devices):
+        raise DiscoveryError('no device to discover')
+    return results
+
+
+def store(db, results, now=None):
+    cache = storage.HubCache(db)
+    for path, found in results.iteritems():
+        for address, network_id in found:
+            cache.seen(path, address, network_id, now)
+    db.commit()
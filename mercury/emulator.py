@@ -0,0 +1,249 @@
+__author__ = 'Gennady Kovalev <gik@bigur.ru>'
+__copyright__ = '(c) 2015-2016 Business group for development management'
+__licence__ = 'GPL'
+
+# Hub emulator on a pseudo-terminal. Unmodified Hub talks to it by path:
+#
+#     emulator = Emulator(0x2f01, capacity=1024, meters=200)
+#     hub = mercury.Hub(emulator.start(), 0x2f01)
+#
+# or from shell: python -m mercury.emulator --address 0x2f01
+
+import os
+import sys
+import pty
+import tty
+import time
+import errno
+import struct
+import random
+import select
+import logging
+import argparse
+import datetime
+import threading
+
+from . import command
+from . import decoder
+
+
+logger = logging.getLogger('energo.emulator')
+
+
+class Emulator(object):
+
+    # Longest history fitting into one frame: 255 bytes of payload are
+    # code, 2 bytes of counter address and 11 bytes per record
+    __max_history__ = 22
+
+    def __init__(self, address=0x2f01, capacity=1024, meters=None,
+                 history=12, byte_delay=0, noise=0, drop=0, seed=None,
+                 now=None, stream=False):
+        # Several addresses are hubs sharing one line, they have the same
+        # meters. Stream replies are written byte by byte.
+        if isinstance(address, (list, tuple)):
+            self.addresses = list(address)
+        else:
+            self.addresses = [address]
+        self.address = self.addresses[0]
+        self.capacity = capacity
+        self.history = min(history, self.__max_history__)
+        self.byte_delay = byte_delay
+        self.noise = noise
+        self.drop = drop
+        self.stream = stream
+
+        self.config = 0
+        self.commands = 0
+        self.sent = 0
+        self.recieved = 0
+
+        self._random = random.Random(seed)
+        self._master = None
+        self._slave = None
+        self._thread = None
+        self._running = False
+        self._decoder = decoder.FrameDecoder()
+
+        if meters is None:
+            meters = capacity
+        slots = self._random.sample(xrange(capacity), min(meters, capacity))
+        self.meters = {}
+        now = (now or datetime.datetime.now()).replace(second=0,
+                                                       microsecond=0)
+        for counter in slots:
+            self.meters[counter] = self._make_history(now)
+
+    def _make_history(self, now):
+        # Monthly readings at end of month and the current one
+        value = self._random.randrange(0, 30000)
+        level = self._random.randrange(0, 16)
+        dates = []
+        month = now.replace(day=1, hour=0, minute=0)
+        for i in xrange(self.history - 1):
+            dates.insert(0, month - datetime.timedelta(minutes=1))
+            month = (month - datetime.timedelta(days=1)).replace(day=1)
+        dates.append(now)
+
+        readings = []
+        for date in dates:
+            value += self._random.randrange(0, 500)
+            readings.append((1, value % 65536, level, date))
+        return readings
+
+    def advance(self, minutes=60):
+        # New reading for every meter
+        for readings in self.meters.itervalues():
+            dtype, value, level, date = readings[-1]
+            value = (value + self._random.randrange(0, 10)) % 65536
+            readings.append((dtype, value, level,
+                             date + datetime.timedelta(minutes=minutes)))
+            del readings[:-self.history]
+
+    def _encode_reading(self, reading):
+        dtype, value, level, date = reading
+        inc = value & 0xff
+        stamp = struct.pack('<BBBBB', date.minute, date.hour, date.day - 1,
+                            date.month - 1, date.year - 2000)
+        return command.record.pack(dtype, value - inc, inc,
+                                   command.table[inc] >> 8, level, stamp)
+
+    def handle(self, code, data, address=None):
+        # Returns response code and data of the hub at address
+        if code == 0x86:
+            return 0x86, struct.pack('<H', address or self.address)
+
+        elif code in (0x80, 0x00):
+            if code == 0x00:
+                self.capacity, self.config = struct.unpack('<HB', data)
+            return 0x80, struct.pack('<HB', self.capacity, self.config)
+
+        elif code in (0x82, 0x85):
+            counter, = struct.unpack('<H', data)
+            readings = self.meters.get(counter)
+            if not readings or counter >= self.capacity:
+                return code, ''
+            if code == 0x82:
+                readings = readings[-1:]
+            return code, struct.pack('<H', counter) + ''.join(
+                                self._encode_reading(x) for x in readings)
+
+        raise ValueError('unknown command {}'.format(hex(code)))
+
+    def _reply(self, frame):
+        self.commands += 1
+        if frame.dst != 0x2fff and frame.dst not in self.addresses:
+            return
+        if self.drop and self._random.random() < self.drop:
+            logger.debug('Drop reply')
+            return
+        address = self.address if frame.dst == 0x2fff else frame.dst
+        try:
+            code, data = self.handle(frame.code, frame.data, address)
+        except (ValueError, struct.error) as e:
+            logger.debug('Bad request: {}'.format(e))
+            return
+
+        octets = command.encode_frame(address, frame.src, code, data)
+        if self.noise and self._random.random() < self.noise:
+            garbage = self._random.randrange(1, 9)
+            octets = os.urandom(garbage) + octets
+        if self.stream:
+            for octet in octets:
+                time.sleep(self.byte_delay)
+                self._write(octet)
+            return
+        if self.byte_delay:
+            time.sleep(len(octets) * self.byte_delay)
+        self._write(octets)
+
+    def _write(self, octets):
+        while octets:
+            try:
+                n = os.write(self._master, octets)
+            except OSError as e:
+                if e.errno != errno.EAGAIN:
+                    raise
+                select.select([], [self._master], [], 1)
+                continue
+            self.sent += n
+            octets = octets[n:]
+
+    def _run(self):
+        while self._running:
+            ready, _, _ = select.select([self._master], [], [], 0.1)
+            if not ready:
+                continue
+            try:
+                octets = os.read(self._master, 4096)
+            except OSError as e:
+                if e.errno in (errno.EAGAIN, errno.EINTR):
+                    continue
+                break
+            self.recieved += len(octets)
+            self._decoder.feed(octets)
+            for frame in self._decoder:
+                self._reply(frame)
+
+    def start(self):
+        self._master, self._slave = pty.openpty()
+        tty.setraw(self._master)
+        self._running = True
+        self._thread = threading.Thread(target=self._run)
+        self._thread.daemon = True
+        self._thread.start()
+        return os.ttyname(self._slave)
+
+    def stop(self):
+        self._running = False
+        if self._thread is not None:
+            self._thread.join()
+            self._thread = None
+        for fd in (self._master, self._slave):
+            if fd is not None:
+                os.close(fd)
+        self._master = self._slave = None
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Hub emulator')
+    parser.add_argument('-v', dest='verbose', action='store_true',
+                        help='output debug information')
+    parser.add_argument('--address', default='0x2f01', metavar='ADDR',
+                        help='hub address in hex, default 0x2f01')
+    parser.add_argument('--capacity', type=int, default=1024,
+                        metavar='NUMBER',
+                        help='number of counter slots, default 1024')
+    parser.add_argument('--meters', type=int, metavar='NUMBER',
+                        help='number of installed meters, default all slots')
+    parser.add_argument('--history', type=int, default=12, metavar='NUMBER',
+                        help='history records per meter, default 12')
+    parser.add_argument('--byte-delay', type=float, default=0,
+                        metavar='SECONDS', help='line delay per byte')
+    parser.add_argument('--noise', type=float, default=0,
+                        metavar='PROBABILITY',
+                        help='probability of garbage before reply')
+    parser.add_argument('--drop', type=float, default=0,
+                        metavar='PROBABILITY',
+                        help='probability of dropped reply')
+    parser.add_argument('--seed', type=int, help='random seed')
+    args = parser.parse_args()
+
+    logging.basicConfig(level=args.verbose and logging.DEBUG or logging.INFO,
+                        format='%(message)s')
+
+    emulator = Emulator(int(args.address, 16), args.capacity, args.meters,
+                        args.history, args.byte_delay, args.noise, args.drop,
+                        args.seed)
+    print(emulator.start())
+    sys.stdout.flush()
+    try:
+        while True:
+            time.sleep(1)
+    except KeyboardInterrupt:
+        pass
+    emulator.stop()
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,220 @@
+__author__ = 'Gennady Kovalev <gik@bigur.ru>'
+__copyright__ = '(c) 2015-2016 Business group for development management'
+__licence__ = 'GPL'
+
+# Bulk export of readings. Rows are read with fetchmany and written batch
+# by batch, so memory doesn't depend on the number of rows. Formats:
+#
+#     csv     header and one reading per line
+#     ndjson  one JSON object per line
+#     npz     NumPy archive of column arrays, written without NumPy
+#     arrow   Arrow IPC file of record batches, needs pyarrow
+
+import os
+import csv
+import struct
+import shutil
+import logging
+import calendar
+import datetime
+import tempfile
+import zipfile
+
+from . import storage
+
+
+logger = logging.getLogger('energo.export')
+
+
+# Order of the counter index, no sorting is needed
+SQL_EXPORT = '''\
+SELECT
+  id, hub, counter, type, level, date, value
+FROM data
+WHERE
+  {}
+  date >= ? AND
+  date < ?
+ORDER BY hub, counter, type, date'''
+
+# Name and NumPy type of columns, dates are seconds since epoch
+COLUMNS = [
+    ('id', '<i8'),
+    ('hub', '<i4'),
+    ('counter', '<i4'),
+    ('type', '<i4'),
+    ('level', '<i4'),
+    ('date', '<M8[s]'),
+    ('value', '<i8'),
+]
+
+STRUCT_TYPES = {'<i4': 'i', '<i8': 'q', '<M8[s]': 'q'}
+
+
+class ExportError(Exception):
+    pass
+
+
+def select(db, hub=None, counter=None, since=None, until=None, size=1000):
+    # Yields lists of at most size rows
+    conditions = []
+    params = []
+    if hub is not None:
+        conditions.append('hub = ? AND')
+        params.append(hub)
+    if counter is not None:
+        conditions.append('counter = ? AND')
+        params.append(counter)
+    params.append(since or datetime.datetime.min)
+    params.append(until or datetime.datetime.max)
+
+    c = db.cursor()
+    c.execute(SQL_EXPORT.format('\n  '.join(conditions)), params)
+    while True:
+        rows = c.fetchmany(size)
+        if not rows:
+            break
+        yield rows
+
+
+def _timestamp(date):
+    if len(date) != 19:
+        return calendar.timegm(storage.parse_date(date).timetuple())
+    # Stored format, strptime is several times slower
+    return calendar.timegm((int(date[0:4]), int(date[5:7]), int(date[8:10]),
+                            int(date[11:13]), int(date[14:16]),
+                            int(date[17:19])))
+
+
+class CsvWriter(object):
+
+    def __init__(self, fh):
+        self._writer = csv.writer(fh)
+        self._writer.writerow([x[0] for x in COLUMNS])
+
+    def write(self, rows):
+        self._writer.writerows(rows)
+
+    def close(self):
+        pass
+
+
+class NdjsonWriter(object):
+
+    # Columns are numbers and the date in stored format, which need no
+    # escaping, a template is several times faster than json.dumps
+    def __init__(self, fh):
+        self._fh = fh
+        self._template = '{{' + ', '.join(
+                    '"{}": {}'.format(name, '"{}"' if name == 'date' else '{}')
+                    for name, _ in COLUMNS) + '}}\n'
+
+    def write(self, rows):
+        template = self._template
+        self._fh.writelines(template.format(*x) for x in rows)
+
+    def close(self):
+        pass
+
+
+class NpzWriter(object):
+
+    # Every column goes to its own .npy file in a temporary directory,
+    # the header is written over reserved space when the row count is
+    # known, then files are packed into zip as numpy.savez_compressed does
+    __header__ = 128
+
+    def __init__(self, fh):
+        self._fh = fh
+        self._directory = tempfile.mkdtemp(prefix='mercury-export-')
+        self._files = []
+        for name, dtype in COLUMNS:
+            column = open(os.path.join(self._directory, name + '.npy'),
+                          'w+b')
+            column.write(' ' * self.__header__)
+            self._files.append(column)
+        self._count = 0
+
+    def write(self, rows):
+        for i, (column, (name, dtype)) in enumerate(zip(self._files,
+                                                        COLUMNS)):
+            values = [x[i] for x in rows]
+            if name == 'date':
+                values = [_timestamp(x) for x in values]
+            column.write(struct.pack('<{}{}'.format(len(values),
+                                                    STRUCT_TYPES[dtype]),
+                                     *values))
+        self._count += len(rows)
+
+    def _header(self, dtype):
+        header = "{{'descr': '{}', 'fortran_order': False, " \
+                 "'shape': ({},), }}".format(dtype, self._count)
+        # Magic, version 1.0, length of header, header padded with spaces
+        size = self.__header__ - 10
+        return '\x93NUMPY\x01\x00' + struct.pack('<H', size) + \
+               header.ljust(size - 1) + '\n'
+
+    def close(self):
+        try:
+            with zipfile.ZipFile(self._fh, 'w', zipfile.ZIP_DEFLATED,
+                                 allowZip64=True) as archive:
+                for column, (name, dtype) in zip(self._files, COLUMNS):
+                    column.seek(0)
+                    column.write(self._header(dtype))
+                    column.close()
+                    archive.write(column.name, name + '.npy')
+        finally:
+            shutil.rmtree(self._directory)
+
+
+class ArrowWriter(object):
+
+    def __init__(self, fh):
+        try:
+            import pyarrow
+        except ImportError:
+            raise ExportError('arrow format needs pyarrow')
+        self._pyarrow = pyarrow
+        self._types = {'<i4': pyarrow.int32(), '<i8': pyarrow.int64(),
+                       '<M8[s]': pyarrow.timestamp('s')}
+        schema = pyarrow.schema([pyarrow.field(name, self._types[dtype])
+                                 for name, dtype in COLUMNS])
+        self._writer = pyarrow.RecordBatchFileWriter(fh, schema)
+
+    def write(self, rows):
+        arrays = []
+        for i, (name, dtype) in enumerate(COLUMNS):
+            values = [x[i] for x in rows]
+            if name == 'date':
+                values = [_timestamp(x) for x in values]
+            arrays.append(self._pyarrow.array(values, self._types[dtype]))
+        self._writer.write_batch(self._pyarrow.RecordBatch.from_arrays(
+                                        arrays, [x[0] for x in COLUMNS]))
+
+    def close(self):
+        self._writer.close()
+
+
+FORMATS = {
+    'csv': CsvWriter,
+    'ndjson': NdjsonWriter,
+    'npz': NpzWriter,
+    'arrow': ArrowWriter,
+}
+
+
+def export(db, fh, frmt, hub=None, counter=None, since=None, until=None,
+           size=1000):
+    # Writes selected readings to open file, returns their number
+    if frmt not in FORMATS:
+        raise ExportError('unknown format {}'.format(frmt))
+    writer = FORMATS[frmt](fh)
+    count = 0
+    try:
+        for rows in select(db, hub, counter, since, until, size):
+            writer.write(rows)
+            count += len(rows)
+    finally:
+        writer.close()
+    logger.debug('Exported %s readings as %s', count, frmt)
+    return count
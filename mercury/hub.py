@@ -2,11 +2,14 @@ __author__ = 'Gennady Kovalev <gik@bigur.ru>'
 __copyright__ = '(c) 2015-2016 Business group of development management'
 __licence__ = 'GPL'
 
-import struct
+import time
 import logging
 
 from . import serial
 from . import command
+from . import decoder
+from . import device as _device
+from . import metrics as _metrics
 
 
 logger = logging.getLogger('energo.hub')
@@ -16,89 +19,292 @@ class OperationalError(Exception):
     pass
 
 
+class NoResponseError(OperationalError):
+    pass
+
+
+class UnavailableError(OperationalError):
+    pass
+
+
+class Latency(object):
+
+    # Smoothed round trip time and its deviation, the same way as TCP
+    # estimates retransmission timeout (RFC 6298)
+    __alpha__ = 0.125
+    __beta__ = 0.25
+
+    def __init__(self):
+        self.mean = None
+        self.deviation = None
+        self.samples = 0
+
+    def update(self, value):
+        if self.mean is None:
+            self.mean = value
+            self.deviation = value / 2.0
+        else:
+            self.deviation += self.__beta__ * \
+                                    (abs(self.mean - value) - self.deviation)
+            self.mean += self.__alpha__ * (value - self.mean)
+        self.samples += 1
+
+    def timeout(self, minimum, maximum):
+        if self.mean is None:
+            return maximum
+        return min(max(self.mean + 4 * self.deviation, minimum), maximum)
+
+
 class Hub(object):
 
-    def __init__(self, device, address):
+    def __init__(self, device, address, timeout=None, min_timeout=0.5,
+                 retries=1, backoff=0.5, failures=5, cooldown=300,
+                 transport=None, metrics=None):
         self._device = device
 
         self._source = 0xffff
         self._destination = address
 
-        self._serial = serial.Serial(device)
-
-    def execute(self, cmd):
+        # Hubs share one port per device. Transport may be given to capture
+        # or replay the traffic, it must behave as serial.Serial.
+        if transport is None:
+            transport = _device.get_device(device)
+        if isinstance(transport, _device.Device):
+            transport = transport.channel(self, timeout)
+        self._serial = transport
+        self._decoder = decoder.FrameDecoder(self._decoder_error)
+
+        # Counters and timings go to the module registry by default
+        if metrics is None:
+            metrics = _metrics.registry
+        self._metrics = metrics
+
+        # Timeouts are derived from measured latency of each command type
+        if timeout is None:
+            timeout = self._serial.__timeout__
+        self._timeout = timeout
+        self._min_timeout = min(min_timeout, self._timeout)
+        self._latency = {}
+
+        # Request is sent again after timeout with exponential backoff
+        self._retries = retries
+        self._backoff = backoff
+
+        # Hub is skipped for cooldown seconds after so many failures in row
+        self._failures_limit = failures
+        self._cooldown = cooldown
+        self._failures = 0
+        self._unavailable_until = None
+
+        # Set from the command being executed
+        self._priority = command.PRIORITY_NORMAL
+
+    @property
+    def address(self):
+        return self._destination
+
+    def latency(self, code):
+        if code not in self._latency:
+            self._latency[code] = Latency()
+        return self._latency[code]
+
+    @property
+    def priority(self):
+        # Priority of the command on the bus, read by device channel
+        return self._priority
+
+    def execute(self, cmd, priority=None):
+        return self._run(cmd, priority, False)
+
+    def execute_many(self, commands, priority=None, errors=False):
+        # Yields results in order of commands. Port is opened and drained
+        # before the first command and again only after a timeout, when a
+        # late answer may be pending. With errors NoResponseError is
+        # yielded instead of the result and the rest is executed. Bus is
+        # released between commands, so more urgent ones get in.
+        clean = False
+        for cmd in commands:
+            try:
+                result = self._run(cmd, priority, clean)
+            except NoResponseError as e:
+                if not errors:
+                    raise
+                clean = False
+                yield e
+            else:
+                clean = True
+                yield result
+
+    def _run(self, cmd, priority, clean):
+        self._check_available()
+        self._priority = cmd.priority if priority is None else priority
+        attempt = 0
+        while True:
+            timeout = self._read_timeout(cmd, attempt)
+            started = time.time()
+            try:
+                result = self._execute_once(cmd, timeout, clean)
+            except NoResponseError as e:
+                clean = False
+                if attempt >= self._retries:
+                    self._failure()
+                    raise
+                delay = self._backoff * 2 ** attempt
+                attempt += 1
+                logger.debug('%s, retry %s in %.2fs', e, attempt, delay)
+                time.sleep(delay)
+            except OperationalError:
+                self._failure()
+                raise
+            else:
+                self._success(cmd, time.time() - started)
+                return result
+
+    def _execute_once(self, cmd, timeout, clean=False):
         cmd.source = self._source
         cmd.destination = self._destination
-        if not self._serial.is_open():
-            try:
-                self._serial.open()
-                self._serial.configure()
-            except serial.SerialError as e:
-                raise OperationalError(e)
-
-        self._serial.flush()
+        if not clean:
+            self._connect()
 
         try:
+            self._drain(cmd, clean)
             octets = cmd.request
-            logger.debug('Send: {}'.format(cmd._dump(octets)))
+            logger.debug('Send: %s', command.HexDump(octets))
             self._serial.write(octets)
+            self._sent(octets)
         except serial.SerialError as e:
             raise OperationalError(e)
 
         try:
             tries = 5
-            recieved = False
-            while not recieved and tries:
+            deadline = time.time() + timeout
+            while True:
+                frame = self._decoder.decode()
+                if frame is None:
+                    if self._receive(deadline - time.time()):
+                        continue
+                    frame = self._decoder.decode(final=True)
+                    if frame is None:
+                        raise self._no_response(cmd)
+
+                if self._accept(cmd, frame):
+                    break
+
                 tries -= 1
-                octets = self._serial.read(8)
-                if len(octets) == 0:
-                    raise OperationalError('no response from device '
-                                           '%s' % hex(self._destination))
-                elif len(octets) < 8:
-                    logger.debug('Recv: {}'.format(cmd._dump(octets)))
-                    raise OperationalError('response too short in stage 1')
-                elif len(octets) > 8:
-                    raise OperationalError('response too long in stage 1')
-                crc, src, dst, length = struct.unpack('<3sHHB', octets[:8])
-                response = octets
-
-                octets = self._serial.read(length + 1)
-                if len(octets) < (length + 1):
-                    raise OperationalError('response too short in stage 2')
-                elif len(octets) > (length + 1):
-                    raise OperationalError('response too long in stage 2')
-                data = ''
-                if length == 1:
-                    code, checksum = struct.unpack('<BB', octets)
-                elif length > 1:
-                    code, data, checksum = struct.unpack(
-                            '<B{}sB'.format(length - 1), octets)
-                else:
-                    raise OperationalError('incorrect response length')
-                response += octets
-
-                logger.debug('Recv: {}'.format(cmd._dump(response)))
-                if (cmd.destination == 0x2fff and  \
-                    src > 0x2f00 and src < 0x2fff):
-                        self._destination = src
-
-                if src == self._destination:
-                    cmd.parse_response(crc, src, dst, length, code, data,
-                                       checksum)
-                    recieved = True
-
-                else:
-                    logger.debug('Recieve from another source '
-                                 '({}), next try'.format(hex(src)))
-
-            if not recieved and not tries:
-                raise OperationalError('Recieve tries limit reached')
+                if not tries:
+                    raise OperationalError('Recieve tries limit reached')
+                deadline = time.time() + timeout
 
         except (serial.SerialError, command.CommandError) as e:
             raise OperationalError(e)
 
         return cmd.result
 
+    def _check_available(self):
+        if self._unavailable_until is None:
+            return
+        timeleft = self._unavailable_until - time.time()
+        if timeleft > 0:
+            raise UnavailableError('device %s is unavailable, next try in '
+                                   '%ds' % (hex(self._destination), timeleft))
+
+    def _read_timeout(self, cmd, attempt):
+        timeout = self.latency(cmd._request_code).timeout(self._min_timeout,
+                                                          self._timeout)
+        return min(timeout * 2 ** attempt, self._timeout)
+
+    def _labels(self, cmd=None):
+        if cmd is None:
+            return {'hub': hex(self._destination)}
+        return {'hub': hex(self._destination),
+                'command': cmd.__class__.__name__}
+
+    def _decoder_error(self, reason, count):
+        self._metrics.inc('mercury_frame_errors_total', count, reason=reason,
+                          **self._labels())
+
+    def _sent(self, octets):
+        self._metrics.inc('mercury_bytes_sent_total', len(octets),
+                          **self._labels())
+
+    def _feed(self, octets):
+        self._metrics.inc('mercury_bytes_received_total', len(octets),
+                          **self._labels())
+        self._decoder.feed(octets)
+
+    def _receive(self, timeout):
+        # Reads port straight into decoder's buffer
+        n = self._decoder.readinto(self._serial, timeout)
+        if n:
+            self._metrics.inc('mercury_bytes_received_total', n,
+                              **self._labels())
+        return n
+
+    def _no_response(self, cmd):
+        self._metrics.inc('mercury_timeouts_total', **self._labels(cmd))
+        return NoResponseError(self._timeout_message(cmd))
+
+    def _success(self, cmd, elapsed):
+        self.latency(cmd._request_code).update(elapsed)
+        self._metrics.observe('mercury_command_seconds', elapsed,
+                              **self._labels(cmd))
+        self._failures = 0
+        self._unavailable_until = None
+
+    def _failure(self):
+        self._failures += 1
+        if self._failures >= self._failures_limit:
+            logger.warning('Device {} failed {} times, skip it for '
+                           '{}s'.format(hex(self._destination),
+                                        self._failures, self._cooldown))
+            self._unavailable_until = time.time() + self._cooldown
+
+    def _connect(self):
+        if not self._serial.is_open():
+            try:
+                self._serial.open()
+                self._serial.configure()
+            except serial.SerialError as e:
+                raise OperationalError(e)
+
+    def _drain(self, cmd, clean=False):
+        # Anything recieved before the request is sent can't be the answer,
+        # so drop it without flushing pending output. Clean port isn't read.
+        while not clean and self._receive(0):
+            pass
+        for frame in self._decoder:
+            logger.debug('Drop stale frame: %s', command.HexDump(frame.octets))
+        self._decoder.clear()
+
+    def _timeout_message(self, cmd):
+        if len(self._decoder):
+            logger.debug('Recv: %s', command.HexDump(self._decoder.pending()))
+            return 'incomplete response from device ' \
+                   '%s' % hex(self._destination)
+        return 'no response from device %s' % hex(self._destination)
+
+    def _accept(self, cmd, frame):
+        logger.debug('Recv: %s', command.HexDump(frame.octets))
+        if (cmd.destination == 0x2fff and  \
+            frame.src > 0x2f00 and frame.src < 0x2fff):
+                self._destination = frame.src
+
+        if frame.src == self._destination:
+            try:
+                cmd.parse_response(frame.crc, frame.src, frame.dst,
+                                   frame.length, frame.code, frame.data,
+                                   frame.checksum)
+            except command.CommandError:
+                self._metrics.inc('mercury_response_errors_total',
+                                  **self._labels(cmd))
+                raise
+            return True
+
+        logger.debug('Recieve from another source (%s), next try',
+                     hex(frame.src))
+        self._metrics.inc('mercury_foreign_frames_total', **self._labels())
+        return False
+
 
 
 '''
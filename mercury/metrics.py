@@ -0,0 +1,165 @@
+__author__ = 'Gennady Kovalev <gik@bigur.ru>'
+__copyright__ = '(c) 2015-2016 Business group for development management'
+__licence__ = 'GPL'
+
+# Counters and histograms of polling. Hubs and storage report to the
+# module registry, subscribers get every event as it happens:
+#
+#     registry.subscribe(lambda kind, name, labels, value: ...)
+#     write_prometheus(registry, '/var/lib/node_exporter/mercury.prom')
+
+import os
+import time
+import logging
+import threading
+import contextlib
+
+
+logger = logging.getLogger('energo.metrics')
+
+
+COUNTER = 'counter'
+HISTOGRAM = 'histogram'
+
+BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10)
+
+
+class Histogram(object):
+
+    def __init__(self, buckets=BUCKETS):
+        self.buckets = buckets
+        self.counts = [0] * len(buckets)
+        self.sum = 0
+        self.count = 0
+
+    def observe(self, value):
+        for i, bound in enumerate(self.buckets):
+            if value <= bound:
+                self.counts[i] += 1
+                break
+        self.sum += value
+        self.count += 1
+
+    def cumulative(self):
+        # (bound, count) pairs as Prometheus expects them
+        total = 0
+        for bound, count in zip(self.buckets, self.counts):
+            total += count
+            yield bound, total
+
+
+class Metrics(object):
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._counters = {}
+        self._histograms = {}
+        self._subscribers = []
+
+    def subscribe(self, callback):
+        # callback(kind, name, labels, value) is called on every event
+        self._subscribers.append(callback)
+
+    def unsubscribe(self, callback):
+        self._subscribers.remove(callback)
+
+    def _notify(self, kind, name, labels, value):
+        for callback in self._subscribers:
+            try:
+                callback(kind, name, labels, value)
+            except Exception:
+                logger.exception('Metrics subscriber failed')
+
+    def inc(self, name, value=1, **labels):
+        key = (name, tuple(sorted(labels.iteritems())))
+        with self._lock:
+            self._counters[key] = self._counters.get(key, 0) + value
+        if self._subscribers:
+            self._notify(COUNTER, name, labels, value)
+
+    def observe(self, name, value, **labels):
+        key = (name, tuple(sorted(labels.iteritems())))
+        with self._lock:
+            histogram = self._histograms.get(key)
+            if histogram is None:
+                histogram = self._histograms[key] = Histogram()
+            histogram.observe(value)
+        if self._subscribers:
+            self._notify(HISTOGRAM, name, labels, value)
+
+    @contextlib.contextmanager
+    def timer(self, name, **labels):
+        started = time.time()
+        try:
+            yield
+        finally:
+            self.observe(name, time.time() - started, **labels)
+
+    def counters(self):
+        with self._lock:
+            return sorted(self._counters.iteritems())
+
+    def histograms(self):
+        with self._lock:
+            return sorted(self._histograms.iteritems())
+
+    def clear(self):
+        with self._lock:
+            self._counters.clear()
+            self._histograms.clear()
+
+
+registry = Metrics()
+
+
+def _format_labels(labels, extra=()):
+    labels = list(labels) + list(extra)
+    if not labels:
+        return ''
+    return '{' + ','.join('{}="{}"'.format(k, str(v).replace('\\', '\\\\')
+                                                     .replace('"', '\\"'))
+                          for k, v in labels) + '}'
+
+
+def _format_value(value):
+    if value == float('inf'):
+        return '+Inf'
+    return repr(float(value)) if isinstance(value, float) else str(value)
+
+
+def render_prometheus(metrics):
+    out = []
+    last = None
+    for (name, labels), value in metrics.counters():
+        if name != last:
+            out.append('# TYPE {} counter\n'.format(name))
+            last = name
+        out.append('{}{} {}\n'.format(name, _format_labels(labels),
+                                      _format_value(value)))
+
+    last = None
+    for (name, labels), histogram in metrics.histograms():
+        if name != last:
+            out.append('# TYPE {} histogram\n'.format(name))
+            last = name
+        for bound, count in histogram.cumulative():
+            out.append('{}_bucket{} {}\n'.format(
+                    name, _format_labels(labels, [('le', _format_value(bound))]),
+                    count))
+        out.append('{}_bucket{} {}\n'.format(
+                    name, _format_labels(labels, [('le', '+Inf')]),
+                    histogram.count))
+        out.append('{}_sum{} {}\n'.format(name, _format_labels(labels),
+                                          _format_value(histogram.sum)))
+        out.append('{}_count{} {}\n'.format(name, _format_labels(labels),
+                                            histogram.count))
+    return ''.join(out)
+
+
+def write_prometheus(metrics, path):
+    # Textfile collector may read the file at any moment, so it is
+    # replaced at once
+    tmp = '{}.{}.tmp'.format(path, os.getpid())
+    with open(tmp, 'w') as fh:
+        fh.write(render_prometheus(metrics))
+    os.rename(tmp, path)
@@ -0,0 +1,221 @@
+__author__ = 'Gennady Kovalev <gik@bigur.ru>'
+__copyright__ = '(c) 2015-2016 Business group for development management'
+__licence__ = 'GPL'
+
+# Durable upload queue. Unexported readings are packed into numbered
+# gzipped documents in the same transaction which marks them exported,
+# so exported now means queued. Documents are never changed, a sender
+# posts them oldest first and acknowledges each one in its own commit.
+# Lost reply is sent again as the same document. Acknowledgement which
+# can't be written, e.g. while a poll holds the database, is kept and
+# written before anything else is sent.
+
+import sqlite3
+import logging
+import datetime
+import threading
+
+from . import upload
+from . import storage
+
+
+logger = logging.getLogger('energo.outbox')
+
+
+SQL_INSERT_BATCH = '''\
+INSERT INTO
+  outbox (created, readings, document, next_attempt)
+VALUES
+  (?, ?, ?, ?)'''
+
+SQL_SELECT_DUE = '''\
+SELECT
+  id, document, attempts
+FROM outbox
+WHERE
+  acknowledged IS NULL AND
+  next_attempt <= ?
+ORDER BY next_attempt, id
+LIMIT 1'''
+
+SQL_ACKNOWLEDGE = '''\
+UPDATE outbox
+SET acknowledged = ?
+WHERE id = ?'''
+
+SQL_DEFER = '''\
+UPDATE outbox
+SET
+  attempts = ?,
+  next_attempt = ?
+WHERE id = ?'''
+
+SQL_SELECT_BACKLOG = '''\
+SELECT
+  COUNT(*), TOTAL(readings)
+FROM outbox
+WHERE acknowledged IS NULL'''
+
+SQL_PURGE = '''\
+DELETE FROM outbox
+WHERE
+  acknowledged IS NOT NULL AND
+  acknowledged < ?'''
+
+
+def fill(db, size=100, limit=None):
+    # Packs unexported readings into batches of size, returns number of
+    # new batches
+    c = db.cursor()
+    batches = 0
+    while limit is None or batches < limit:
+        c.execute(upload.SQL_UPLOAD_SELECT, (size,))
+        rows = c.fetchall()
+        if not rows:
+            break
+        document = ''.join(upload.gzip_chunks(
+                                    upload.render_xml(x[1:] for x in rows)))
+        now = datetime.datetime.now()
+        c.execute(SQL_INSERT_BATCH, (now, len(rows), sqlite3.Binary(document),
+                                     now))
+        upload.mark_exported(db, [x[0] for x in rows])
+        db.commit()
+        logger.debug('Batch %s: %s readings, %s bytes', c.lastrowid,
+                     len(rows), len(document))
+        batches += 1
+        if len(rows) < size:
+            break
+    return batches
+
+
+def backlog(db):
+    # Number of unacknowledged batches and readings in them
+    count, readings = db.execute(SQL_SELECT_BACKLOG).fetchone()
+    return count, int(readings)
+
+
+def purge(db, days):
+    edge = datetime.datetime.now() - datetime.timedelta(days=days)
+    db.execute(SQL_PURGE, (edge,))
+    db.commit()
+
+
+def acknowledge(db, batches):
+    # Writes acknowledgements of sent batches and empties the list
+    if batches:
+        now = datetime.datetime.now()
+        db.executemany(SQL_ACKNOWLEDGE, ((now, x) for x in batches))
+        db.commit()
+        logger.debug('Batches %s are acknowledged', batches)
+        del batches[:]
+
+
+def send(db, portal, limit=None, backoff=30, max_backoff=3600, sent=None):
+    # Sends due batches, stops on the first failure: the batch is put off
+    # for exponentially growing time and UploadError is raised. Sent but
+    # not yet acknowledged batches are kept in sent list.
+    if sent is None:
+        sent = []
+    acknowledge(db, sent)
+    count = 0
+    c = db.cursor()
+    while limit is None or count < limit:
+        now = datetime.datetime.now()
+        c.execute(SQL_SELECT_DUE, (now,))
+        row = c.fetchone()
+        if row is None:
+            break
+        batch, document, attempts = row
+        try:
+            portal.send_document(str(document))
+        except upload.UploadError as e:
+            delay = min(backoff * 2 ** attempts, max_backoff)
+            c.execute(SQL_DEFER, (attempts + 1,
+                                  now + datetime.timedelta(seconds=delay),
+                                  batch))
+            db.commit()
+            logger.warning('Batch %s: %s, next try in %ss', batch, e, delay)
+            raise
+        sent.append(batch)
+        try:
+            acknowledge(db, sent)
+        except sqlite3.Error:
+            db.rollback()
+            raise
+        count += 1
+    return count
+
+
+class Worker(threading.Thread):
+
+    # Sends outbox in background with its own database connection.
+    # portal() returns a new upload.Portal for every round. Polls hold
+    # the database for a whole hub, database waits up to timeout.
+    def __init__(self, path, portal, interval=60, backoff=30,
+                 max_backoff=3600, timeout=60):
+        super(Worker, self).__init__()
+        self.daemon = True
+        self._path = path
+        self._portal = portal
+        self._interval = interval
+        self._backoff = backoff
+        self._max_backoff = max_backoff
+        self._timeout = timeout
+        self._sent = []
+        self._wakeup = threading.Event()
+        self._stopping = False
+        self.sent = 0
+        self.failures = 0
+
+    def wake(self):
+        # New batches don't cut short backoff after failure
+        if not self.failures:
+            self._wakeup.set()
+
+    def stop(self):
+        self._stopping = True
+        self._wakeup.set()
+
+    def _delay(self):
+        # Exponential backoff after failures in row
+        self.failures += 1
+        return min(self._backoff * 2 ** (self.failures - 1),
+                   self._max_backoff)
+
+    def round(self, db):
+        # One pass over due batches, returns delay before next one
+        try:
+            with self._portal() as portal:
+                self.sent += send(db, portal, None, self._backoff,
+                                  self._max_backoff, self._sent)
+        except upload.UploadError as e:
+            delay = self._delay()
+            logger.error('Upload failed %s times in row: %s', self.failures,
+                         e)
+            return delay
+        except sqlite3.Error as e:
+            db.rollback()
+            delay = self._delay()
+            logger.error('Outbox is not available, next try in %ss: %s',
+                         delay, e)
+            return delay
+        self.failures = 0
+        return self._interval
+
+    def run(self):
+        db = None
+        try:
+            while not self._stopping:
+                try:
+                    if db is None:
+                        db = storage.connect(self._path, self._timeout)
+                    delay = self.round(db)
+                except Exception:
+                    # The thread must not die, batches would stay unsent
+                    logger.exception('Upload worker failed')
+                    delay = self._delay()
+                self._wakeup.wait(delay)
+                self._wakeup.clear()
+        finally:
+            if db is not None:
+                db.close()
@@ -0,0 +1,91 @@
+__author__ = 'Gennady Kovalev <gik@bigur.ru>'
+__copyright__ = '(c) 2015-2016 Business group for development management'
+__licence__ = 'GPL'
+
+import logging
+import itertools
+
+from . import hub as _hub
+from . import command
+from . import storage
+from . import metrics
+
+
+logger = logging.getLogger('energo.poll')
+
+
+def _commands(factory, counters, address, stop):
+    # Commands for counters while stop() is false
+    for counter in counters:
+        if stop is not None and stop():
+            logger.debug('Stop polling of hub %s', address)
+            break
+        logger.debug('Process counter %s.%s', address, counter)
+        yield factory(counter)
+
+
+def _failed(address, counter, result):
+    if isinstance(result, _hub.NoResponseError):
+        logger.warning('Counter %s.%s: %s' % (address, counter, result))
+        return True
+    return False
+
+
+def download_readings(hub, db, sweep=32, full_sweep=False, full_resync=False,
+                      address=None, config=None, stop=None):
+    # Downloads new readings of hub counters, whole hub is written in one
+    # transaction. Known network id and config may be given to save
+    # requests, stop() is checked between counters.
+    try:
+        if address is None:
+            address = hub.execute(command.GetNetworkID())
+        if config is None:
+            config = hub.execute(command.GetConfig())
+        presence = storage.PresenceMap(db, address)
+        watermarks = storage.Watermarks(db, address)
+        records = storage.History(db, address)
+        if full_sweep:
+            counters = range(0, config['counters'])
+        else:
+            counters = presence.schedule(config['counters'], sweep)
+
+        # Last packets of all counters first, then histories of changed
+        # ones, both as batches of bulk priority
+        try:
+            lasts = {}
+            if not full_resync:
+                results = hub.execute_many(_commands(command.GetLastPacket,
+                                                     counters, address, stop),
+                                           command.PRIORITY_BULK, errors=True)
+                for counter, last in itertools.izip(counters, results):
+                    if _failed(address, counter, last):
+                        continue
+                    presence.mark(counter, last is not None)
+                    if not watermarks.moved(counter, last):
+                        logger.debug('No new readings of %s.%s', address,
+                                     counter)
+                        continue
+                    lasts[counter] = last
+                counters = [x for x in counters if x in lasts]
+
+            results = hub.execute_many(_commands(command.GetHistory, counters,
+                                                 address, stop),
+                                       command.PRIORITY_BULK, errors=True)
+            for counter, history in itertools.izip(counters, results):
+                if _failed(address, counter, history):
+                    continue
+                if full_resync:
+                    presence.mark(counter, bool(history))
+
+                if history:
+                    records.store(counter, history)
+                last = lasts.get(counter)
+                if last is not None:
+                    watermarks.update(counter, last)
+        except _hub.UnavailableError as e:
+            logger.error(str(e))
+
+    finally:
+        with metrics.registry.timer('mercury_ingest_seconds',
+                                    operation='commit'):
+            db.commit()
@@ -0,0 +1,162 @@
+# -*- coding: utf-8 -*-
+__author__ = 'Gennady Kovalev <gik@bigur.ru>'
+__copyright__ = '(c) 2015-2016 Business group for development management'
+__licence__ = 'GPL'
+
+import logging
+import datetime
+
+
+logger = logging.getLogger('energo.report')
+
+
+# Last reading of every counter in every month of the window and its
+# consumption from the rollup. Value and delta are taken from the row with
+# max date (sqlite's bare column rule), which keeps it one grouped pass,
+# rows with zero type take part only in the list of counters. Rollup delta
+# is counted from the month before, so the oldest month of the window
+# shows consumption too, reports computed from raw data left it blank.
+SQL_MONTHLY_VALUES = '''\
+SELECT
+  counter,
+  month,
+  MAX(CASE WHEN type > 0 THEN date END),
+  value,
+  delta
+FROM rollup
+WHERE
+  month >= ? AND
+  month <= ?
+GROUP BY counter, month'''
+
+MONTH_NAMES = ['янв', 'фев', 'мар',
+               'апр', 'май', 'июн',
+               'июл', 'авг', 'сен',
+               'окт', 'ноя', 'дек']
+
+HTML_HEAD = '''\
+<html>
+<head>
+<title>Показания счётчиков</title>
+<meta http-equiv="Content-Type" content="text/html; charset=utf-8" />
+<meta http-equiv="cache-control" content="max-age=0" />
+<meta http-equiv="cache-control" content="no-cache" />
+<meta http-equiv="expires" content="0" />
+<meta http-equiv="expires" content="Tue, 01 Jan 1980 1:00:00 GMT" />
+<meta http-equiv="pragma" content="no-cache" />
+</head>
+<style>
+html, body { font-family: Helvetica, Arial, Sans-serif; background-color: #fff }
+table { width: 100%; border-collapse: collapse; }
+h1 { font-size: 1.5 em; font-weight: bold; }
+tr:nth-child(even) { background-color: #e2f2c3; }
+tr:nth-child(odd) { background-color: #edf2e3; }
+tr:first-child { background-color: #6a9418; color: #fff; }
+tr:hover { background-color: #b4de62; color: #000; }
+th.month { font-size: 1.5em; }
+td { padding: .5em; margin: 0; text-align: center; border: 1px solid #fff; }
+.counter { display: block; font-size: 1.5em; }
+.value-block { display: block; }
+.readings-block { display: block; }
+.delta { font-size: 1.5em; color: red;}
+.value { font-size: 1em; color: #333; }
+.date { font-size: .9em; color: #999; }
+.doc { margin: 1em; font-size: 1em; color: #333; }
+</style>
+<body>
+'''
+
+HTML_FOOT = '''\
+</table>
+<div class="doc">\
+<p><span style="font-weight: bold; color: red;">Красным</span> цветом \
+указано количество кВт*ч, потреблённых в соответствующем месяце.</p>\
+<p><span style="font-weight: bold;">Чёрным</span> указаны показания \
+счётчика, дата снятия показаний указана в скобках.\
+</div></body>
+</html>
+'''
+
+
+def report_months(count, today=None):
+    # First days of months, current month first
+    month = (today or datetime.date.today()).replace(day=1)
+    months = []
+    for i in xrange(0, count):
+        months.append(month)
+        month = (month - datetime.timedelta(days=1)).replace(day=1)
+    return months
+
+
+def monthly_values(db, months):
+    # {counter: {month: (date, value, delta)}} in one pass over the window,
+    # delta is consumption since the previous month. Counters are polled
+    # together, so few distinct dates are parsed once.
+    index = dict((x.strftime('%Y-%m'), x) for x in months)
+    empty = dict((x, (None, None, None)) for x in months)
+    values = {}
+    dates = {}
+    c = db.cursor()
+    c.execute(SQL_MONTHLY_VALUES, (min(index), max(index)))
+    for counter, month, date, value, delta in c:
+        if counter not in values:
+            values[counter] = dict(empty)
+        if date is not None:
+            if date not in dates:
+                dates[date] = datetime.datetime.strptime(
+                                                date, '%Y-%m-%d %H:%M:%S')
+            values[counter][index[month]] = (dates[date], value, delta)
+    return values
+
+
+def render_html(values, months, now=None):
+    now = now or datetime.datetime.now()
+    current_month = now.date().replace(day=1)
+
+    out = [HTML_HEAD]
+    out.append('<h1>Показания счётчиков (%s)</h1>\n' % \
+                                            now.strftime('%d.%m.%y %H:%M'))
+    out.append('<table>\n<tr>\n<th></th>\n')
+    for month in months:
+        out.append('<th class="month">%s \'%s</th>\n' % \
+                        (MONTH_NAMES[month.month - 1], month.strftime('%y')))
+
+    for counter in sorted(values):
+        out.append('<tr>\n<td><div class=counter>%s</div></td>\n' % counter)
+        date_frmt = '%d.%m %H:%M'
+        for i, month in enumerate(months):
+            out.append('<td>')
+            date, value, delta = values[counter][month]
+            if value is not None:
+                prev_value = None
+                if i + 1 < len(months):
+                    prev_value = values[counter][months[i + 1]][1]
+                if delta or prev_value is None or month == current_month:
+                    out.append('<div class="value-block">')
+                    if delta:
+                        out.append('<div class="delta">%s</div>' % delta)
+                    else:
+                        out.append('<div class="delta">&nbsp;</div>')
+                    if value > 0 or month == current_month:
+                        out.append('<div class="readings-block">'
+                                   '<span class="value">%s</span>'
+                                   '&nbsp;<span class="date">(%s)</span>'
+                                   '</div>' % (value,
+                                               date.strftime(date_frmt)))
+                    out.append('</div>')
+            out.append('</td>\n')
+            date_frmt = '%d.%m'
+        out.append('</tr>\n')
+    out.append('</tr>\n')
+    out.append(HTML_FOOT)
+    return ''.join(out)
+
+
+def create_html(db, path, count=6):
+    months = report_months(count)
+    values = monthly_values(db, months)
+    logger.debug('Report for {} counters, {} months'.format(len(values),
+                                                            len(months)))
+    html = render_html(values, months)
+    with open(path, 'w') as fh:
+        fh.write(html)
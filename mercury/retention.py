@@ -0,0 +1,197 @@
+__author__ = 'Gennady Kovalev <gik@bigur.ru>'
+__copyright__ = '(c) 2015-2016 Business group for development management'
+__licence__ = 'GPL'
+
+# Retention of raw readings. Rows older than the given number of whole
+# months are deleted once they are exported, monthly last values stay in
+# the rollup. Deleted rows may be archived first to gzipped CSV files, one
+# per month, appended chunk by chunk. Freed pages are given back to the
+# file system with incremental vacuum.
+#
+# Work is done in chunks, every chunk is a transaction, and a pass stops
+# when its time budget is spent, so the daemon keeps polling in between.
+# The cutoff is saved before the first row is deleted, ingestion doesn't
+# store older records again. Expired rows are found by a partial index,
+# a pass with nothing to delete costs one lookup.
+
+import os
+import csv
+import gzip
+import time
+import logging
+import datetime
+
+from . import storage
+from . import export
+from . import metrics
+
+
+logger = logging.getLogger('energo.retention')
+
+
+SQL_SELECT_EXPIRED = '''\
+SELECT
+  id, hub, counter, type, level, date, value
+FROM data
+WHERE
+  exported = 1 AND
+  date < ?
+LIMIT ?'''
+
+SQL_DELETE_ROW = '''\
+DELETE FROM data
+WHERE id = ?'''
+
+SQL_UPDATE_STATE = '''\
+INSERT OR REPLACE INTO
+  retention (id, cutoff, finished)
+VALUES
+  (1, ?, ?)'''
+
+
+class RetentionError(Exception):
+    pass
+
+
+def cutoff(months, now=None):
+    # Start of the oldest month which is kept whole
+    month = storage.month_start(now or datetime.datetime.now())
+    start = storage.shift_month(month.strftime('%Y-%m'), -months)
+    return datetime.datetime.strptime(start, '%Y-%m')
+
+
+def is_incremental(db):
+    return db.execute('PRAGMA auto_vacuum').fetchone()[0] == 2
+
+
+def convert(db):
+    # Switches old database to incremental auto vacuum, VACUUM rewrites
+    # the whole file and blocks everybody while it runs
+    db.commit()
+    isolation_level = db.isolation_level
+    db.isolation_level = None
+    try:
+        db.execute('PRAGMA auto_vacuum=INCREMENTAL')
+        db.execute('VACUUM')
+    finally:
+        db.isolation_level = isolation_level
+
+
+class Archive(object):
+
+    # Appends rows to data-YYYY-MM.csv.gz files of directory, every write
+    # is a gzip member of its own and is synced before rows are deleted
+    def __init__(self, directory):
+        self._directory = directory
+        if not os.path.isdir(directory):
+            try:
+                os.makedirs(directory)
+            except OSError as e:
+                raise RetentionError('can\'t create archive: {}'.format(e))
+
+    def path(self, month):
+        return os.path.join(self._directory, 'data-{}.csv.gz'.format(month))
+
+    def write(self, rows):
+        months = {}
+        for row in rows:
+            months.setdefault(row[5][:7], []).append(row)
+        for month, chunk in sorted(months.iteritems()):
+            path = self.path(month)
+            header = not os.path.exists(path)
+            with open(path, 'ab') as fh:
+                archive = gzip.GzipFile(fileobj=fh, mode='wb')
+                writer = csv.writer(archive)
+                if header:
+                    writer.writerow([x[0] for x in export.COLUMNS])
+                writer.writerows(chunk)
+                archive.close()
+                fh.flush()
+                os.fsync(fh.fileno())
+
+
+class Retention(object):
+
+    def __init__(self, db, months, archive=None, chunk=500,
+                 vacuum_pages=256):
+        if months < 1:
+            raise RetentionError('raw readings must be kept for at least '
+                                 'one month')
+        self._db = db
+        self._months = months
+        self._archive = Archive(archive) if archive else None
+        self._chunk = chunk
+        self._vacuum_pages = vacuum_pages
+        self.deleted = 0
+        self.vacuumed = 0
+
+    def _save(self, edge):
+        # Cutoff never goes back, rows before it may be deleted already
+        current = storage.retention_cutoff(self._db)
+        if current is not None and current > edge:
+            edge = current
+        self._db.execute(SQL_UPDATE_STATE, (edge, datetime.datetime.now()))
+        self._db.commit()
+
+    def _prune(self, edge):
+        # One chunk, returns number of deleted rows
+        c = self._db.cursor()
+        c.execute(SQL_SELECT_EXPIRED, (edge, self._chunk))
+        rows = c.fetchall()
+        if not rows:
+            return 0
+        if self._archive is not None:
+            self._archive.write(rows)
+        c.executemany(SQL_DELETE_ROW, ((x[0],) for x in rows))
+        self._db.commit()
+        metrics.registry.inc('mercury_retention_deleted_total', len(rows))
+        return len(rows)
+
+    def _vacuum(self):
+        # Gives back at most vacuum_pages free pages, returns their number
+        c = self._db.cursor()
+        free = c.execute('PRAGMA freelist_count').fetchone()[0]
+        if not free or not is_incremental(self._db):
+            return 0
+        pages = min(free, self._vacuum_pages)
+        # Pages are freed while the pragma is stepped
+        c.execute('PRAGMA incremental_vacuum({:d})'.format(pages)).fetchall()
+        self._db.commit()
+        metrics.registry.inc('mercury_retention_vacuumed_pages_total', pages)
+        return pages
+
+    def run(self, budget=None, now=None):
+        # One pass, returns True when nothing is left to do. A step isn't
+        # started when the last one wouldn't fit into the rest of budget.
+        deadline = None if budget is None else time.time() + budget
+        edge = cutoff(self._months, now)
+        self._save(edge)
+
+        def fits(started):
+            finished = time.time()
+            return deadline is None or \
+                finished + (finished - started) < deadline
+
+        done = False
+        while not done:
+            started = time.time()
+            deleted = self._prune(edge)
+            self.deleted += deleted
+            done = not deleted
+            if not done and not fits(started):
+                break
+
+        while done:
+            started = time.time()
+            pages = self._vacuum()
+            self.vacuumed += pages
+            if not pages:
+                break
+            if not fits(started):
+                done = False
+                break
+
+        logger.debug('Retention before %s: %s rows deleted, %s pages '
+                     'vacuumed%s', edge, self.deleted, self.vacuumed,
+                     '' if done else ', to be continued')
+        return done
@@ -2,6 +2,7 @@ __author__ = 'Gennady Kovalev <gik@bigur.ru>'
 __copyright__ = '(c) 2015-2016 Business group for development management'
 __licence__ = 'GPL'
 
+import io
 import os
 import time
 import errno
@@ -22,9 +23,12 @@ class Serial(object):
     __timeout__ = 8
     __baudrate__ = termios.B38400
 
-    def __init__(self, device):
+    def __init__(self, device, timeout=None):
         self._device = device
+        if timeout is not None:
+            self.__timeout__ = timeout
         self._fh = None
+        self._io = None
         self._is_open = False
 
     def __del__(self):
@@ -56,11 +60,17 @@ class Serial(object):
                                    os.O_RDWR | os.O_NOCTTY | os.O_NONBLOCK)
             except Exception as e:
                 raise SerialError('can\'t open port: {}'.format(e))
+            self._io = io.FileIO(self._fh, 'r+', closefd=False)
             self._is_open = True
 
     def is_open(self):
         return self._is_open
 
+    def fileno(self):
+        if not self._is_open:
+            raise SerialError('port is not open')
+        return self._fh
+
     def configure(self):
         logger.debug('Configure serial port')
         if not self._is_open:
@@ -112,50 +122,94 @@ class Serial(object):
 
         # Setup CC
         cc[termios.VMIN] = 1
-        cc[termios.VTIME] = self.__timeout__
+        # VTIME is in tenths of second and fits in a byte. Port is
+        # non-blocking and reads wait in select, so it is a fallback only.
+        cc[termios.VTIME] = max(0, min(int(round(self.__timeout__ * 10)),
+                                       255))
 
         if [iflag, oflag, cflag, lflag, ispeed, ospeed, cc] != orig_attrs:
             termios.tcsetattr(self._fh, termios.TCSANOW, \
                               [iflag, oflag, cflag, lflag, ispeed, ospeed, cc])
         logger.debug('......')
 
-    def write(self, octets):
+    def write(self, octets, timeout=None):
         if not self._is_open:
             raise SerialError('port is not open')
-
-        timeout = time.time() + self.__timeout__
-
-        l = len(octets)
-        remained = octets
-        while l > 0:
+        if timeout is None:
+            timeout = self.__timeout__
+
+        deadline = time.time() + timeout
+
+        # Wait until port can take data, then write as much as it takes
+        remained = memoryview(octets)
+        while len(remained):
+            timeleft = deadline - time.time()
+            if timeleft <= 0:
+                raise SerialError('write timeout')
+            _, ready, _ = select.select([], [self._fh], [], timeleft)
+            if not ready:
+                raise SerialError('write timeout')
             try:
                 n = os.write(self._fh, remained)
-                timeleft = timeout - time.time()
-                if timeleft < 0:
-                    raise SerialError('write timeout')
-                _, ready, _ = select.select([], [self._fh], [], timeleft)
-                if not ready:
-                    raise SerialError('write timeout')
-                remained = remained[n:]
-                l = l - n
             except OSError as e:
-                if e.errno != errno.EAGAIN:
-                    raise SerialError('write failed: {}'.format(e))
+                if e.errno == errno.EAGAIN:
+                    continue
+                raise SerialError('write failed: {}'.format(e))
+            remained = remained[n:]
         return len(octets)
 
+    def readinto(self, buffer, timeout=None):
+        # Reads what is available into writable buffer (bytearray or
+        # memoryview) without allocation, returns 0 on timeout
+        if not self._is_open:
+            raise SerialError('port is not open')
+        if timeout is None:
+            timeout = self.__timeout__
+        ready,_,_ = select.select([self._fh],[],[], max(timeout, 0))
+        if not ready:
+            return 0
+        try:
+            n = self._io.readinto(buffer)
+        except (IOError, OSError) as e:
+            if e.errno != errno.EAGAIN:
+                raise SerialError('read failed: {}'.format(e))
+            return 0
+        if n is None:
+            return 0
+        if not n:
+            raise SerialError('no data from port')
+        return n
+
     def read(self, size=1):
         if not self._is_open:
             raise SerialError('port is not open')
-        recieved = bytearray()
-        while len(recieved) < size:
-            ready,_,_ = select.select([self._fh],[],[], self.__timeout__)
-            if not ready:
+        recieved = bytearray(size)
+        view = memoryview(recieved)
+        got = 0
+        while got < size:
+            n = self.readinto(view[got:])
+            if not n:
                 break
-            buf = os.read(self._fh, size-len(recieved))
-            if not buf:
-                raise SerialError('no data from port')
-            recieved.extend(buf)
-        return bytes(recieved)
+            got += n
+        return bytes(recieved[:got])
+
+    def read_some(self, size=256, timeout=None):
+        if not self._is_open:
+            raise SerialError('port is not open')
+        if timeout is None:
+            timeout = self.__timeout__
+        ready,_,_ = select.select([self._fh],[],[], max(timeout, 0))
+        if not ready:
+            return b''
+        try:
+            buf = os.read(self._fh, size)
+        except OSError as e:
+            if e.errno != errno.EAGAIN:
+                raise SerialError('read failed: {}'.format(e))
+            return b''
+        if not buf:
+            raise SerialError('no data from port')
+        return buf
 
     def flush(self):
         if not self._is_open:
@@ -168,4 +222,5 @@ class Serial(object):
                 os.close(self._fh)
             except:
                 pass
+        self._io = None
         self._is_open = False
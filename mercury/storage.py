@@ -0,0 +1,731 @@
+__author__ = 'Gennady Kovalev <gik@bigur.ru>'
+__copyright__ = '(c) 2015-2016 Business group for development management'
+__licence__ = 'GPL'
+
+import sqlite3
+import logging
+import datetime
+
+from . import metrics
+
+
+logger = logging.getLogger('energo.storage')
+
+
+class StorageError(Exception):
+    pass
+
+
+# SQL query templates
+SQL_CREATE_TABLE = '''\
+CREATE TABLE IF NOT EXISTS data (
+  hub INTEGER NOT NULL,
+  counter INTEGER NOT NULL,
+  level INTEGER NOT NULL,
+  type INTEGER NOT NULL,
+  date DATETIME NOT NULL,
+  value INTEGER NOT NULL,
+  exported BOOL NOT NULL DEFAULT 0);'''
+
+# One record per value in a month, the latest date the value was seen
+SQL_MONTH_KEY = "hub, counter, type, strftime('%Y-%m', date), value"
+
+SQL_DELETE_DUPLICATES = '''\
+DELETE FROM data
+WHERE rowid NOT IN (
+  SELECT rowid FROM (
+    SELECT rowid, MAX(date)
+    FROM data
+    GROUP BY {}))'''.format(SQL_MONTH_KEY)
+
+SQL_CREATE_UNIQUE_INDEX = '''\
+CREATE UNIQUE INDEX IF NOT EXISTS
+  data_month_value
+ON data ({})'''.format(SQL_MONTH_KEY)
+
+# Explicit integer key keeps row ids stable after VACUUM, so rows can be
+# referenced by id (e.g. to mark them exported)
+SQL_CREATE_TABLE_V3 = '''\
+CREATE TABLE data_v3 (
+  id INTEGER PRIMARY KEY,
+  hub INTEGER NOT NULL,
+  counter INTEGER NOT NULL,
+  level INTEGER NOT NULL,
+  type INTEGER NOT NULL,
+  date DATETIME NOT NULL,
+  value INTEGER NOT NULL,
+  exported BOOL NOT NULL DEFAULT 0);'''
+
+SQL_COPY_TABLE_V3 = '''\
+INSERT INTO
+  data_v3 (id, hub, counter, level, type, date, value, exported)
+SELECT
+  rowid, hub, counter, level, type, date, value, exported
+FROM data'''
+
+SQL_CREATE_COUNTER_INDEX = '''\
+CREATE INDEX IF NOT EXISTS
+  data_counter
+ON data (hub, counter, type, date)'''
+
+SQL_CREATE_UNEXPORTED_INDEX = '''\
+CREATE INDEX IF NOT EXISTS
+  data_unexported
+ON data (date)
+WHERE exported = 0'''
+
+SQL_SELECT_COUNTER_RECORDS = '''\
+SELECT
+  type, date, value
+FROM data
+WHERE
+  hub = ? AND
+  counter = ? AND
+  date >= ?'''
+
+SQL_UPSERT_RECORD = '''\
+INSERT INTO
+  data (hub, counter, level, type, date, value, exported)
+VALUES
+  (?, ?, ?, ?, ?, ?, 0)
+ON CONFLICT ({})
+DO UPDATE SET
+  date=excluded.date,
+  level=excluded.level
+WHERE
+  excluded.date > data.date'''.format(SQL_MONTH_KEY)
+
+SQL_CREATE_PRESENCE = '''\
+CREATE TABLE IF NOT EXISTS presence (
+  hub INTEGER NOT NULL,
+  counter INTEGER NOT NULL,
+  seen DATETIME,
+  checked DATETIME NOT NULL,
+  PRIMARY KEY (hub, counter));'''
+
+SQL_CREATE_SWEEP = '''\
+CREATE TABLE IF NOT EXISTS sweep (
+  hub INTEGER NOT NULL PRIMARY KEY,
+  position INTEGER NOT NULL);'''
+
+SQL_CREATE_WATERMARK = '''\
+CREATE TABLE IF NOT EXISTS watermark (
+  hub INTEGER NOT NULL,
+  counter INTEGER NOT NULL,
+  date DATETIME,
+  type INTEGER NOT NULL,
+  value INTEGER,
+  PRIMARY KEY (hub, counter));'''
+
+SQL_SELECT_PRESENCE = '''\
+SELECT
+  counter, seen
+FROM presence
+WHERE
+  hub = ?'''
+
+SQL_MARK_SEEN = '''\
+INSERT OR REPLACE INTO
+  presence (hub, counter, seen, checked)
+VALUES
+  (?, ?, ?, ?)'''
+
+SQL_MARK_CHECKED = '''\
+INSERT OR REPLACE INTO
+  presence (hub, counter, seen, checked)
+VALUES
+  (?, ?, (SELECT seen FROM presence WHERE hub = ? AND counter = ?), ?)'''
+
+SQL_SELECT_SWEEP = '''\
+SELECT
+  position
+FROM sweep
+WHERE
+  hub = ?'''
+
+SQL_UPDATE_SWEEP = '''\
+INSERT OR REPLACE INTO
+  sweep (hub, position)
+VALUES
+  (?, ?)'''
+
+SQL_SELECT_WATERMARKS = '''\
+SELECT
+  counter, date, type, value
+FROM watermark
+WHERE
+  hub = ?'''
+
+SQL_UPDATE_WATERMARK = '''\
+INSERT OR REPLACE INTO
+  watermark (hub, counter, date, type, value)
+VALUES
+  (?, ?, ?, ?, ?)'''
+
+SQL_CREATE_HUBS = '''\
+CREATE TABLE IF NOT EXISTS hubs (
+  device TEXT NOT NULL,
+  address INTEGER NOT NULL,
+  network_id INTEGER,
+  first_seen DATETIME NOT NULL,
+  last_seen DATETIME NOT NULL,
+  PRIMARY KEY (device, address));'''
+
+SQL_UPSERT_HUB = '''\
+INSERT INTO
+  hubs (device, address, network_id, first_seen, last_seen)
+VALUES
+  (?, ?, ?, ?, ?)
+ON CONFLICT (device, address) DO UPDATE SET
+  network_id = excluded.network_id,
+  last_seen = excluded.last_seen'''
+
+SQL_SELECT_HUBS = '''\
+SELECT
+  device, address, network_id, first_seen, last_seen
+FROM hubs
+WHERE
+  last_seen >= ?
+ORDER BY device, address'''
+
+SQL_CREATE_OUTBOX = '''\
+CREATE TABLE IF NOT EXISTS outbox (
+  id INTEGER PRIMARY KEY,
+  created DATETIME NOT NULL,
+  readings INTEGER NOT NULL,
+  document BLOB NOT NULL,
+  attempts INTEGER NOT NULL DEFAULT 0,
+  next_attempt DATETIME NOT NULL,
+  acknowledged DATETIME);'''
+
+SQL_CREATE_OUTBOX_INDEX = '''\
+CREATE INDEX IF NOT EXISTS
+  outbox_pending
+ON outbox (next_attempt, id)
+WHERE acknowledged IS NULL'''
+
+# Last value of every counter in every month and consumption since the
+# last value of previous month, reports read it instead of data
+SQL_CREATE_ROLLUP = '''\
+CREATE TABLE IF NOT EXISTS rollup (
+  hub INTEGER NOT NULL,
+  counter INTEGER NOT NULL,
+  type INTEGER NOT NULL,
+  month TEXT NOT NULL,
+  date DATETIME NOT NULL,
+  value INTEGER NOT NULL,
+  delta INTEGER,
+  PRIMARY KEY (hub, counter, type, month));'''
+
+SQL_CREATE_ROLLUP_INDEX = '''\
+CREATE INDEX IF NOT EXISTS
+  rollup_month
+ON rollup (month)'''
+
+# Value is taken from the row with max date (sqlite's bare column rule).
+# A month never goes back to an older reading: retention deletes old raw
+# rows, months keep their last values here.
+SQL_FILL_ROLLUP = '''\
+INSERT INTO
+  rollup (hub, counter, type, month, date, value)
+SELECT
+  hub, counter, type, strftime('%Y-%m', date) AS month, MAX(date), value
+FROM data
+WHERE {}
+GROUP BY hub, counter, type, month
+ON CONFLICT (hub, counter, type, month) DO UPDATE SET
+  date = excluded.date,
+  value = excluded.value
+WHERE
+  excluded.date >= rollup.date'''
+
+SQL_REFRESH_ROLLUP = SQL_FILL_ROLLUP.format('''\
+  hub = ? AND
+  counter = ? AND
+  type = ? AND
+  date >= ? AND
+  date < ?''')
+
+# Record older than retention cutoff goes to rollup only
+SQL_UPSERT_ROLLUP = '''\
+INSERT INTO
+  rollup (hub, counter, type, month, date, value)
+VALUES
+  (?, ?, ?, ?, ?, ?)
+ON CONFLICT (hub, counter, type, month) DO UPDATE SET
+  date = excluded.date,
+  value = excluded.value
+WHERE
+  excluded.date > rollup.date'''
+
+SQL_SELECT_ROLLUP_SERIES = '''\
+SELECT
+  hub, counter, type, month, value, delta
+FROM rollup
+WHERE
+  hub = ? AND
+  counter = ? AND
+  type = ? AND
+  month >= ? AND
+  month <= ?
+ORDER BY month'''
+
+SQL_SELECT_ROLLUP_ALL = '''\
+SELECT
+  hub, counter, type, month, value, delta
+FROM rollup
+ORDER BY hub, counter, type, month'''
+
+SQL_UPDATE_ROLLUP_DELTA = '''\
+UPDATE rollup
+SET delta = ?
+WHERE
+  hub = ? AND
+  counter = ? AND
+  type = ? AND
+  month = ?'''
+
+
+def consumption(value, prev_value):
+    if value is None or prev_value is None:
+        return None
+    delta = value - prev_value
+    if value < prev_value:
+        # Counter rolled over its maximum value
+        max_value = 10 ** len(str(prev_value))
+        change = max_value - prev_value + value
+        if float(change) / max_value < 0.6:
+            delta = change
+    return delta
+
+
+def shift_month(month, count):
+    # Month 'YYYY-MM' moved by count months
+    index = int(month[:4]) * 12 + int(month[5:7]) - 1 + count
+    return '{:04d}-{:02d}'.format(index // 12, index % 12 + 1)
+
+
+def update_deltas(c, rows):
+    # Sets delta of rollup rows ordered by series and month, the first
+    # month of a series keeps its delta when previous month is not given
+    updates = []
+    prev = None
+    for hub, counter, dtype, month, value, delta in rows:
+        if prev is not None and prev[:3] == (hub, counter, dtype):
+            new = None
+            if prev[3] == shift_month(month, -1):
+                new = consumption(value, prev[4])
+            if new != delta:
+                updates.append((new, hub, counter, dtype, month))
+        prev = (hub, counter, dtype, month, value)
+    c.executemany(SQL_UPDATE_ROLLUP_DELTA, updates)
+    return len(updates)
+
+
+def fill_rollups(c):
+    c.execute(SQL_FILL_ROLLUP.format('1'))
+    update_deltas(c, c.execute(SQL_SELECT_ROLLUP_ALL).fetchall())
+
+# Retention cutoff, it is saved before rows are deleted and ingestion
+# drops older records, so deleted rows don't come back from hub history
+SQL_CREATE_RETENTION = '''\
+CREATE TABLE IF NOT EXISTS retention (
+  id INTEGER PRIMARY KEY CHECK (id = 1),
+  cutoff DATETIME NOT NULL,
+  finished DATETIME NOT NULL);'''
+
+SQL_SELECT_RETENTION_CUTOFF = '''\
+SELECT
+  cutoff
+FROM retention
+WHERE id = 1'''
+
+# Exported rows by date for retention
+SQL_CREATE_EXPORTED_INDEX = '''\
+CREATE INDEX IF NOT EXISTS
+  data_exported
+ON data (date)
+WHERE exported = 1'''
+
+# Report window is read from the index only, primary key starts with hub
+# and can't serve a range of months
+SQL_CREATE_ROLLUP_WINDOW_INDEX = '''\
+CREATE INDEX IF NOT EXISTS
+  rollup_window
+ON rollup (month, counter, type, date, value, delta)'''
+
+
+# Schema migrations, n-th item upgrades database to user_version n + 1
+MIGRATIONS = [
+    # 1: initial schema
+    [SQL_CREATE_TABLE,
+     SQL_CREATE_PRESENCE,
+     SQL_CREATE_SWEEP,
+     SQL_CREATE_WATERMARK],
+
+    # 2: one record per value in a month
+    [SQL_DELETE_DUPLICATES,
+     SQL_CREATE_UNIQUE_INDEX],
+
+    # 3: integer key and indexes for lookups and export, statistics let
+    # queries without hub skip-scan the counter index
+    [SQL_CREATE_TABLE_V3,
+     SQL_COPY_TABLE_V3,
+     'DROP TABLE data',
+     'ALTER TABLE data_v3 RENAME TO data',
+     SQL_CREATE_UNIQUE_INDEX,
+     SQL_CREATE_COUNTER_INDEX,
+     SQL_CREATE_UNEXPORTED_INDEX,
+     'ANALYZE'],
+
+    # 4: hubs found by discovery
+    [SQL_CREATE_HUBS],
+
+    # 5: upload outbox
+    [SQL_CREATE_OUTBOX,
+     SQL_CREATE_OUTBOX_INDEX],
+
+    # 6: monthly rollups, callables are given a cursor
+    [SQL_CREATE_ROLLUP,
+     SQL_CREATE_ROLLUP_INDEX,
+     fill_rollups],
+
+    # 7: retention state
+    [SQL_CREATE_RETENTION],
+
+    # 8: expired rows are found without table scan
+    [SQL_CREATE_EXPORTED_INDEX],
+
+    # 9: covering index of months instead of plain one
+    ['DROP INDEX IF EXISTS rollup_month',
+     SQL_CREATE_ROLLUP_WINDOW_INDEX],
+]
+
+
+def schema_version(db):
+    return db.execute('PRAGMA user_version').fetchone()[0]
+
+
+def migrate(db):
+    version = schema_version(db)
+    if version > len(MIGRATIONS):
+        raise StorageError('database schema version {} is newer than '
+                           'supported {}'.format(version, len(MIGRATIONS)))
+
+    # DDL is not transactional in sqlite3 module's default mode, so every
+    # migration runs in explicit transaction
+    isolation_level = db.isolation_level
+    db.isolation_level = None
+    try:
+        for version in xrange(version, len(MIGRATIONS)):
+            logger.debug('Upgrade database schema to version '
+                         '{}'.format(version + 1))
+            c = db.cursor()
+            c.execute('BEGIN')
+            try:
+                for sql in MIGRATIONS[version]:
+                    if callable(sql):
+                        sql(c)
+                    else:
+                        c.execute(sql)
+                c.execute('PRAGMA user_version = {:d}'.format(version + 1))
+            except:
+                c.execute('ROLLBACK')
+                raise
+            c.execute('COMMIT')
+    finally:
+        db.isolation_level = isolation_level
+
+
+def connect(path, timeout=5.0):
+    # Timeout is how long to wait for a lock held by another connection
+    db = sqlite3.connect(path, timeout)
+    c = db.cursor()
+    if schema_version(db) == 0:
+        # Only a database without tables can change it without VACUUM,
+        # retention gives freed pages back in small steps
+        c.execute('PRAGMA auto_vacuum=INCREMENTAL')
+    c.execute('PRAGMA journal_mode=WAL')
+    c.execute('PRAGMA synchronous=NORMAL')
+    migrate(db)
+    return db
+
+
+DATE_FORMATS = ['%Y-%m-%d %H:%M:%S', '%Y-%m-%d %H:%M', '%Y-%m-%d']
+
+
+def parse_date(value):
+    # Date as stored or a part of it, ValueError otherwise
+    for frmt in DATE_FORMATS:
+        try:
+            return datetime.datetime.strptime(value, frmt)
+        except ValueError:
+            pass
+    raise ValueError('invalid date: {}'.format(value))
+
+
+def month_start(date):
+    return datetime.datetime(date.year, date.month, 1)
+
+
+# Callbacks called with (hub, counter, rows) of rows written by History,
+# rows are (hub, counter, level, type, date, value)
+_subscribers = []
+
+
+def subscribe(callback):
+    _subscribers.append(callback)
+
+
+def unsubscribe(callback):
+    _subscribers.remove(callback)
+
+
+def retention_cutoff(db):
+    # Records before it are not stored, None without retention
+    row = db.execute(SQL_SELECT_RETENTION_CUTOFF).fetchone()
+    return parse_date(row[0]) if row is not None else None
+
+
+def rebuild_rollups(db):
+    fill_rollups(db.cursor())
+    db.commit()
+
+
+class History(object):
+
+    # Stores history records of hub counters. Records are compared with
+    # existing ones in memory and only new or moved ones are written, the
+    # caller commits once per hub.
+    def __init__(self, db, hub, registry=None):
+        self._db = db
+        self._hub = hub
+        self._metrics = registry or metrics.registry
+        self._rollups = Rollups(db, hub)
+        self._cutoff = retention_cutoff(db)
+
+    def _records(self, history):
+        return [x for x in history
+                if x['value'] is not None and x['date'] is not None]
+
+    def expired(self, counter, history):
+        # Records before retention cutoff as rows
+        if self._cutoff is None:
+            return []
+        return [(self._hub, counter, x['level'], x['type'],
+                 x['date'].strftime('%Y-%m-%d %H:%M:%S'), x['value'])
+                for x in self._records(history) if x['date'] < self._cutoff]
+
+    def changes(self, counter, history):
+        records = self._records(history)
+        if self._cutoff is not None:
+            records = [x for x in records if x['date'] >= self._cutoff]
+        if not records:
+            return []
+
+        since = month_start(min(x['date'] for x in records))
+        c = self._db.cursor()
+        c.execute(SQL_SELECT_COUNTER_RECORDS, (self._hub, counter, since))
+        existing = {}
+        for dtype, date, value in c.fetchall():
+            key = (dtype, date[:7], value)
+            existing[key] = max(existing.get(key, date), date)
+
+        rows = []
+        for record in records:
+            date = record['date'].strftime('%Y-%m-%d %H:%M:%S')
+            key = (record['type'], date[:7], record['value'])
+            if key in existing and existing[key] >= date:
+                continue
+            if key in existing:
+                logger.debug('Update record: %s -> %s', existing[key], date)
+            else:
+                logger.debug('Add record: %s %s (level=%s, type=%s)', date,
+                             record['value'], record['level'], record['type'])
+            existing[key] = date
+            rows.append((self._hub, counter, record['level'], record['type'],
+                         date, record['value']))
+        return rows
+
+    def store(self, counter, history):
+        hub = hex(self._hub)
+        with self._metrics.timer('mercury_ingest_seconds', hub=hub,
+                                 operation='diff'):
+            rows = self.changes(counter, history)
+            expired = self.expired(counter, history)
+        if expired:
+            with self._metrics.timer('mercury_ingest_seconds', hub=hub,
+                                     operation='rollup'):
+                self._rollups.keep(counter, expired)
+        if rows:
+            with self._metrics.timer('mercury_ingest_seconds', hub=hub,
+                                     operation='write'):
+                self._db.cursor().executemany(SQL_UPSERT_RECORD, rows)
+            with self._metrics.timer('mercury_ingest_seconds', hub=hub,
+                                     operation='rollup'):
+                self._rollups.update(counter, rows)
+            for callback in _subscribers:
+                try:
+                    callback(self._hub, counter, rows)
+                except Exception:
+                    logger.exception('Storage subscriber failed')
+            self._metrics.inc('mercury_records_stored_total', len(rows),
+                              hub=hub)
+        return len(rows)
+
+
+class Rollups(object):
+
+    # Keeps rollup of a hub in step with rows written by History: months
+    # of written rows are refreshed from data, deltas of them and of next
+    # months are computed again
+    def __init__(self, db, hub):
+        self._db = db
+        self._hub = hub
+
+    def _months(self, rows):
+        months = {}
+        for row in rows:
+            months.setdefault(row[3], set()).add(row[4][:7])
+        return sorted(months.iteritems())
+
+    def _deltas(self, c, counter, dtype, series):
+        c.execute(SQL_SELECT_ROLLUP_SERIES,
+                  (self._hub, counter, dtype, shift_month(min(series), -1),
+                   shift_month(max(series), 1)))
+        update_deltas(c, c.fetchall())
+
+    def update(self, counter, rows):
+        c = self._db.cursor()
+        for dtype, series in self._months(rows):
+            for month in series:
+                start = datetime.datetime.strptime(month, '%Y-%m')
+                c.execute(SQL_REFRESH_ROLLUP,
+                          (self._hub, counter, dtype, start,
+                           month_start(start + datetime.timedelta(days=31))))
+            self._deltas(c, counter, dtype, series)
+
+    def keep(self, counter, rows):
+        # Rows which are not stored in data, rollup takes them directly
+        c = self._db.cursor()
+        c.executemany(SQL_UPSERT_ROLLUP,
+                      ((hub, counter, dtype, date[:7], date, value)
+                       for hub, counter, level, dtype, date, value in rows))
+        if not c.rowcount:
+            return
+        for dtype, series in self._months(rows):
+            self._deltas(c, counter, dtype, series)
+
+
+class PresenceMap(object):
+
+    # Counter slot is live if it answered with data during so many days
+    __expire__ = 31
+
+    def __init__(self, db, hub):
+        self._db = db
+        self._hub = hub
+
+    def live(self, now=None):
+        now = now or datetime.datetime.now()
+        edge = now - datetime.timedelta(days=self.__expire__)
+        c = self._db.cursor()
+        c.execute(SQL_SELECT_PRESENCE, (self._hub,))
+        rows = c.fetchall()
+        if not rows:
+            return None
+        return set(counter for counter, seen in rows
+                   if seen is not None and seen >= str(edge))
+
+    def schedule(self, capacity, sweep, now=None):
+        if not capacity:
+            return []
+        live = self.live(now)
+        if live is None:
+            logger.debug('Hub {} is not swept yet, poll all '
+                         'counters'.format(self._hub))
+            return range(0, capacity)
+
+        live = set(x for x in live if x < capacity)
+
+        # Walk over the rest of slots round robin, sweep slots per cycle
+        c = self._db.cursor()
+        c.execute(SQL_SELECT_SWEEP, (self._hub,))
+        row = c.fetchone()
+        position = row[0] if row else 0
+        unknown = capacity - len(live)
+        swept = set()
+        for i in xrange(0, capacity):
+            if len(swept) >= min(sweep, unknown):
+                break
+            counter = (position + i) % capacity
+            if counter not in live:
+                swept.add(counter)
+        else:
+            i = capacity
+        c.execute(SQL_UPDATE_SWEEP, (self._hub, (position + i) % capacity))
+
+        logger.debug('Hub {}: {} live counters, sweep {} of {} '
+                     'others'.format(self._hub, len(live), len(swept),
+                                     unknown))
+        return sorted(live | swept)
+
+    def mark(self, counter, has_data, now=None):
+        now = now or datetime.datetime.now()
+        c = self._db.cursor()
+        if has_data:
+            c.execute(SQL_MARK_SEEN, (self._hub, counter, now, now))
+        else:
+            c.execute(SQL_MARK_CHECKED, (self._hub, counter,
+                                         self._hub, counter, now))
+
+
+class Watermarks(object):
+
+    # Last packet of every counter of a hub, history is downloaded again
+    # only when the last packet has changed
+    def __init__(self, db, hub):
+        self._db = db
+        self._hub = hub
+        c = db.cursor()
+        c.execute(SQL_SELECT_WATERMARKS, (hub,))
+        self._marks = dict((row[0], tuple(row[1:])) for row in c.fetchall())
+
+    def _key(self, reading):
+        date = reading['date']
+        if date is not None:
+            date = date.strftime('%Y-%m-%d %H:%M:%S')
+        return (date, reading['type'], reading['value'])
+
+    def moved(self, counter, reading):
+        if reading is None:
+            return False
+        return self._marks.get(counter) != self._key(reading)
+
+    def update(self, counter, reading):
+        key = self._key(reading)
+        self._marks[counter] = key
+        c = self._db.cursor()
+        c.execute(SQL_UPDATE_WATERMARK, (self._hub, counter) + key)
+
+
+class HubCache(object):
+
+    # Hubs answered to discovery, with time of first and last answer
+    def __init__(self, db):
+        self._db = db
+
+    def seen(self, device, address, network_id, now=None):
+        now = now or datetime.datetime.now()
+        c = self._db.cursor()
+        c.execute(SQL_UPSERT_HUB, (device, address, network_id, now, now))
+
+    def hubs(self, max_age=None, now=None):
+        # (device, address, network_id, first_seen, last_seen) rows
+        edge = ''
+        if max_age is not None:
+            now = now or datetime.datetime.now()
+            edge = str(now - datetime.timedelta(days=max_age))
+        c = self._db.cursor()
+        c.execute(SQL_SELECT_HUBS, (edge,))
+        return c.fetchall()
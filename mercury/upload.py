@@ -0,0 +1,200 @@
+__author__ = 'Gennady Kovalev <gik@bigur.ru>'
+__copyright__ = '(c) 2015-2016 Business group for development management'
+__licence__ = 'GPL'
+
+import ssl
+import json
+import time
+import zlib
+import httplib
+import urllib2
+import logging
+import datetime
+import cookielib
+
+
+logger = logging.getLogger('energo.upload')
+
+
+# SQL query templates
+SQL_UPLOAD_SELECT = '''\
+SELECT
+  id, hub, counter, type, date, value, level
+FROM data
+WHERE exported=0
+ORDER BY date, id
+LIMIT ?'''
+
+SQL_UPLOAD_MARK_EXPORTED = '''\
+UPDATE data
+SET exported=1
+WHERE id IN ({})'''
+
+# Limit of host parameters in old sqlite builds
+SQL_MAX_VARIABLES = 999
+
+XML_HEAD = '<?xml version="1.0" encoding="utf-8"?>\n<ElectrometersReadings>\n'
+XML_READING = ' <Reading date="{date}" hub="{hub}" counter="{counter}" ' \
+              'zone="{zone}" level="{level}">{value}</Reading>\n'
+XML_TAIL = '</ElectrometersReadings>\n'
+
+ZONES = {
+    0: 1,
+    1: 2,
+    2: 3,
+    3: 4,
+    15: 0,
+}
+
+
+class UploadError(Exception):
+    pass
+
+
+# Local time zone
+class LocalTZ(datetime.tzinfo):
+
+    def utcoffset(self, dt):
+        return datetime.timedelta(seconds=-time.timezone)
+
+    # XXX: what about locale's DST detection?
+    def dst(self, dt):
+        return datetime.timedelta(0)
+
+local_timezone = LocalTZ()
+
+
+def load_credentials(path):
+    try:
+        with open(path, 'r') as fh:
+            login = fh.readline().strip()
+            password = fh.readline().strip()
+    except IOError as e:
+        raise UploadError(e)
+    if not login or not password:
+        raise UploadError('Can\'t find login or password in '
+                          'credentials file')
+    return login, password
+
+
+def render_xml(rows):
+    # Generates message chunk by chunk, rows are (hub, counter, type, date,
+    # value, level) tuples
+    yield XML_HEAD
+    for hub, counter, type_, date, value, level in rows:
+        date = datetime.datetime.strptime(date, '%Y-%m-%d %H:%M:%S')
+        date = date.replace(tzinfo=local_timezone)
+        yield XML_READING.format(date=date.strftime('%Y-%m-%dT%H:%M:%S%z'),
+                                 hub=hub,
+                                 counter=counter,
+                                 zone=ZONES[type_],
+                                 level=level,
+                                 value=value)
+    yield XML_TAIL
+
+
+def gzip_chunks(chunks):
+    compressor = zlib.compressobj(6, zlib.DEFLATED, 16 + zlib.MAX_WBITS)
+    for chunk in chunks:
+        data = compressor.compress(chunk)
+        if data:
+            yield data
+    yield compressor.flush()
+
+
+class Request(urllib2.Request):
+
+    def __init__(self, url, method, data, content_type=None):
+        self._method = method
+        urllib2.Request.__init__(self, url, data)
+        if content_type is not None:
+            self.add_header('Content-Type', content_type)
+
+    def get_method(self):
+        return self._method
+
+
+class Portal(object):
+
+    def __init__(self, url, login, password, compress=False):
+        self._url = url.strip().rstrip('/')
+        self._login = login
+        self._password = password
+        self._compress = compress
+        self._sid = None
+
+        cookie = cookielib.CookieJar()
+        context = ssl.SSLContext(ssl.PROTOCOL_TLSv1)
+        self._opener = urllib2.build_opener(
+                                urllib2.HTTPHandler(),
+                                urllib2.HTTPSHandler(context=context),
+                                urllib2.HTTPCookieProcessor(cookie))
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        # Failed close must not hide the error which ended the session
+        try:
+            self.close()
+        except UploadError as e:
+            if exc_type is None:
+                raise
+            logger.warning(str(e))
+
+    def _request(self, request, error):
+        try:
+            fh = self._opener.open(request)
+        except (urllib2.URLError, httplib.HTTPException, IOError) as e:
+            # Connection closed before reply is HTTPException
+            raise UploadError('{}, {}'.format(error, e))
+        if fh.getcode() != 200:
+            raise UploadError('{}, error {}'.format(error, fh.getcode()))
+        return fh
+
+    def open(self):
+        logger.debug('Connecting to {}'.format(self._url))
+        logger.debug('Creating session for user {}'.format(self._login))
+        request = Request(self._url + '/auth',
+                          'POST',
+                          json.dumps({'login': self._login,
+                                      'password': self._password}),
+                          'application/json')
+        fh = self._request(request, 'Can\'t create session')
+        self._sid = json.loads(fh.read())['sid']
+
+    def _post(self, body):
+        if self._sid is None:
+            self.open()
+        request = Request(self._url + '/documents',
+                          'POST',
+                          body,
+                          'application/xml')
+        if self._compress:
+            request.add_header('Content-Encoding', 'gzip')
+        self._request(request, 'Can\'t send data')
+
+    def send_document(self, document):
+        # Document is gzipped message as stored in outbox
+        if not self._compress:
+            document = zlib.decompress(document, 16 + zlib.MAX_WBITS)
+        self._post(document)
+
+    def close(self):
+        if self._sid is None:
+            return
+        logger.debug('Closing session')
+        request = Request(self._url + '/sessions/' + self._sid,
+                          'DELETE',
+                          None)
+        self._sid = None
+        self._request(request, 'Can\'t close session')
+
+
+def mark_exported(db, ids):
+    c = db.cursor()
+    for i in xrange(0, len(ids), SQL_MAX_VARIABLES):
+        chunk = ids[i:i + SQL_MAX_VARIABLES]
+        c.execute(SQL_UPLOAD_MARK_EXPORTED.format(
+                                        ', '.join('?' * len(chunk))), chunk)
+
@@ -0,0 +1,79 @@
+__author__ = 'Gennady Kovalev <gik@bigur.ru>'
+__copyright__ = '(c) 2015-2016 Business group for development management'
+__licence__ = 'GPL'
+
+import os
+import shutil
+import sqlite3
+import logging
+import tempfile
+import unittest
+
+import mercury.daemon as daemon
+import mercury.metrics as metrics
+import mercury.emulator as emulator
+
+
+CONFIG = '''\
+[daemon]
+dbase = {dbase}
+upload_interval = 0
+
+[hub first]
+device = {device}
+address = 0x2f01
+timeout = 1
+'''
+
+
+class LockedDatabaseTest(unittest.TestCase):
+
+    # Database held by another process fails the job, not the daemon
+    def setUp(self):
+        logging.getLogger('energo').addHandler(logging.NullHandler())
+        self.directory = tempfile.mkdtemp()
+        self.emulator = emulator.Emulator(0x2f01, capacity=8, seed=1)
+        self.dbase = os.path.join(self.directory, 'mercury.db')
+        config = os.path.join(self.directory, 'mercury.ini')
+        with open(config, 'w') as fh:
+            fh.write(CONFIG.format(dbase=self.dbase,
+                                   device=self.emulator.start()))
+        self.daemon = daemon.Daemon(config)
+        self.daemon.load()
+        self.daemon._db.execute('PRAGMA busy_timeout = 100')
+        self.job = self.daemon._jobs['hub first']
+
+    def tearDown(self):
+        self.daemon.close()
+        self.emulator.stop()
+        shutil.rmtree(self.directory)
+
+    def _rows(self):
+        db = sqlite3.connect(self.dbase)
+        try:
+            return db.execute('SELECT COUNT(*) FROM data').fetchone()[0]
+        finally:
+            db.close()
+
+    def test_locked(self):
+        errors = dict(metrics.registry.counters()).get(
+                        ('mercury_job_errors_total', (('job', 'hub first'),)),
+                        0)
+        other = sqlite3.connect(self.dbase)
+        other.execute('BEGIN EXCLUSIVE')
+        try:
+            self.daemon._run_job(self.job)
+        finally:
+            other.rollback()
+            other.close()
+        self.assertEqual(dict(metrics.registry.counters())[
+                        ('mercury_job_errors_total', (('job', 'hub first'),))],
+                         errors + 1)
+        self.assertEqual(self._rows(), 0)
+
+        self.daemon._run_job(self.job)
+        self.assertTrue(self._rows() > 0)
+
+
+if __name__ == '__main__':
+    unittest.main()
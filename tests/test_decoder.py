@@ -0,0 +1,98 @@
+__author__ = 'Gennady Kovalev <gik@bigur.ru>'
+__copyright__ = '(c) 2015-2016 Business group for development management'
+__licence__ = 'GPL'
+
+import struct
+import unittest
+
+import mercury.command as command
+import mercury.decoder as decoder
+
+
+def frame(code=0x80, data='\x00\x04\x00', src=0x2f01, dst=0xffff):
+    return command.encode_frame(src, dst, code, data)
+
+
+class FrameDecoderTest(unittest.TestCase):
+
+    def setUp(self):
+        self.errors = []
+        self.decoder = decoder.FrameDecoder(
+                                lambda *args: self.errors.append(args))
+
+    def test_frame(self):
+        octets = frame()
+        self.decoder.feed(octets)
+        result = self.decoder.decode()
+        self.assertEqual((result.src, result.dst, result.code, result.data,
+                          result.octets),
+                         (0x2f01, 0xffff, 0x80, '\x00\x04\x00', octets))
+        self.assertEqual(len(self.decoder), 0)
+        self.assertEqual(self.errors, [])
+
+    def test_split(self):
+        # Frame is decoded when its last byte arrives
+        octets = frame()
+        for octet in octets[:-1]:
+            self.decoder.feed(octet)
+            self.assertEqual(self.decoder.decode(), None)
+        self.decoder.feed(octets[-1])
+        self.assertEqual(self.decoder.decode().octets, octets)
+
+    def test_garbage(self):
+        self.decoder.feed('\x00\xff\x13' + frame() + '\x42' + frame(0x86))
+        self.assertEqual([x.code for x in self.decoder], [0x80, 0x86])
+        self.assertEqual(self.decoder.dropped, 4)
+        self.assertEqual(self.errors, [('garbage', 3), ('garbage', 1)])
+
+    def test_checksum(self):
+        # Frame with broken checksum is skipped, the next one is found
+        broken = frame()
+        broken = broken[:-1] + chr((ord(broken[-1]) + 1) & 0xff)
+        self.decoder.feed(broken + frame(0x86))
+        self.assertEqual([x.code for x in self.decoder], [0x86])
+        self.assertEqual(self.decoder.checksum_errors, 1)
+        self.assertEqual(self.errors[0], ('checksum', 1))
+
+    def test_truncated(self):
+        # Frame cut short waits for the rest, and is noise when nothing
+        # more is expected, the next frame is found then
+        octets = frame()
+        self.decoder.feed(octets[:-3])
+        self.assertEqual(self.decoder.decode(), None)
+        self.assertEqual(self.decoder.dropped, 0)
+        self.assertEqual(self.decoder.decode(final=True), None)
+        self.assertTrue(self.decoder.dropped > 0)
+        self.decoder.feed(frame(0x86))
+        self.assertEqual(self.decoder.decode().code, 0x86)
+
+    def test_truncated_before_frame(self):
+        # Frame cut short by the next one fails its checksum and the next
+        # frame is found
+        octets = frame()
+        self.decoder.feed(octets[:-3] + frame(0x86))
+        self.assertEqual([x.code for x in self.decoder], [0x86])
+        self.assertEqual(self.decoder.checksum_errors, 1)
+
+    def test_large(self):
+        # Buffer grows beyond its capacity for a long backlog
+        data = struct.pack('<H', 1) + '\x00' * 252
+        octets = frame(0x85, data) * 40
+        self.assertTrue(len(octets) > decoder.FrameDecoder.__capacity__)
+        self.decoder.feed(octets)
+        self.assertEqual(len(list(self.decoder)), 40)
+
+    def test_readinto(self):
+        octets = frame()
+
+        class Port(object):
+            def readinto(self, buffer, timeout=None):
+                buffer[:len(octets)] = octets
+                return len(octets)
+
+        self.assertEqual(self.decoder.readinto(Port(), 0), len(octets))
+        self.assertEqual(self.decoder.decode().octets, octets)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,245 @@
+__author__ = 'Gennady Kovalev <gik@bigur.ru>'
+__copyright__ = '(c) 2015-2016 Business group for development management'
+__licence__ = 'GPL'
+
+import time
+import struct
+import select
+import logging
+import unittest
+import threading
+import multiprocessing
+
+import mercury
+import mercury.aio as aio
+import mercury.command as command
+import mercury.device as device
+import mercury.emulator as emulator
+
+
+def poll(path, address, count, results):
+    # Runs in its own process with its own device, the port is shared
+    # through flock only. Pause between commands is the time to store
+    # readings, the other process is receiving meanwhile.
+    hub = mercury.Hub(path, address, timeout=1, retries=0, failures=count)
+    failures = 0
+    for i in xrange(count):
+        try:
+            hub.execute(command.GetHistory(i % 16))
+        except mercury.OperationalError:
+            failures += 1
+        time.sleep(0.005)
+    results.put((address, failures))
+
+
+def poll_async(path, address, count, results):
+    loop = aio.get_event_loop()
+    hub = aio.AsyncHub(path, address, loop=loop, timeout=1, retries=0,
+                       failures=count)
+
+    def run():
+        failures = 0
+        for i in xrange(count):
+            try:
+                yield hub.execute(command.GetHistory(i % 16))
+            except mercury.OperationalError:
+                failures += 1
+            yield aio.sleep(0.005, loop)
+        raise aio.Return(failures)
+
+    results.put((address, loop.run_until_complete(aio.Task(run(), loop))))
+
+
+class TwoProcessesTest(unittest.TestCase):
+
+    # Hubs on one line polled from two processes, replies come byte by
+    # byte, so a reply is often half read when the other process drains
+    # its hub
+    def setUp(self):
+        self.emulator = emulator.Emulator([0x2f01, 0x2f02], capacity=16,
+                                          byte_delay=0.0002, stream=True,
+                                          seed=1)
+        self.path = self.emulator.start()
+
+    def tearDown(self):
+        self.emulator.stop()
+
+    def _run(self, pollers):
+        results = multiprocessing.Queue()
+        workers = [multiprocessing.Process(target=poller,
+                                           args=(self.path, x, 50, results))
+                   for poller, x in zip(pollers, (0x2f01, 0x2f02))]
+        for worker in workers:
+            worker.start()
+        failures = dict(results.get(timeout=60) for x in workers)
+        for worker in workers:
+            worker.join()
+        self.assertEqual(failures, {0x2f01: 0, 0x2f02: 0})
+        self.assertEqual(self.emulator.commands, 100)
+
+    def test_no_stolen_replies(self):
+        self._run([poll, poll])
+
+    def test_async_no_stolen_replies(self):
+        self._run([poll_async, poll])
+
+
+class NotHoldingTest(unittest.TestCase):
+
+    # Channel without the bus returns routed frames only, a reply on the
+    # line belongs to whoever holds the bus and is left for it
+    def setUp(self):
+        self.emulator = emulator.Emulator(0x2f01)
+        self.device = device.Device(self.emulator.start())
+        self.device.open()
+        self.loop = aio.get_event_loop()
+        self.hub = mercury.Hub(None, 0x2f01, transport=self.device)
+
+    def tearDown(self):
+        self.device.close()
+        self.emulator.stop()
+
+    def _send_reply(self):
+        octets = command.encode_frame(0x2f01, 0xffff, 0x86, '\x01\x2f')
+        self.emulator._write(octets)
+        ready, _, _ = select.select([self.device.fileno()], [], [], 1)
+        self.assertTrue(ready)
+        return octets
+
+    def _assert_unread(self):
+        ready, _, _ = select.select([self.device.fileno()], [], [], 0)
+        self.assertTrue(ready)
+        self.assertEqual(len(self.device._decoder), 0)
+
+    def test_channel(self):
+        self._send_reply()
+        channel = self.device.channel(self.hub)
+        self.assertEqual(channel.read_some(timeout=0), '')
+        self._assert_unread()
+
+    def test_async_channel(self):
+        self._send_reply()
+        channel = aio.AsyncChannel(self.device, self.hub, loop=self.loop)
+        self.assertEqual(self.loop.run_until_complete(
+                                    channel.read_some_async(timeout=0)), '')
+        self._assert_unread()
+
+    def test_routed_frame(self):
+        self.device.acquire(self)
+        octets = self._send_reply()
+        self.device._pump(1)
+        self.device.release()
+        channel = self.device.channel(self.hub)
+        self.assertEqual(channel.read_some(timeout=0), octets)
+
+
+class PriorityLockTest(unittest.TestCase):
+
+    def _order(self, lock, tickets):
+        # Tickets in order they get the lock
+        order = []
+        while tickets:
+            ticket = next(x for x in tickets if lock.take(x))
+            tickets.remove(ticket)
+            order.append(ticket)
+            lock.release()
+        return order
+
+    def test_order(self):
+        # Lower priority value first, in order of requests within one
+        lock = device.PriorityLock()
+        lock.acquire()
+        tickets = [lock.request(x) for x in (command.PRIORITY_BULK,
+                                             command.PRIORITY_INTERACTIVE,
+                                             command.PRIORITY_BULK,
+                                             command.PRIORITY_NORMAL)]
+        self.assertFalse(lock.take(tickets[1]))
+        lock.release()
+        self.assertEqual(self._order(lock, list(tickets)),
+                         [tickets[1], tickets[3], tickets[0], tickets[2]])
+
+    def test_cancel(self):
+        lock = device.PriorityLock()
+        first = lock.request(command.PRIORITY_INTERACTIVE)
+        second = lock.request(command.PRIORITY_BULK)
+        self.assertFalse(lock.take(second))
+        lock.cancel(first)
+        self.assertTrue(lock.take(second))
+
+    def test_returned(self):
+        # Ticket given back on release keeps its turn
+        lock = device.PriorityLock()
+        first = lock.request(command.PRIORITY_BULK)
+        self.assertTrue(lock.take(first))
+        second = lock.request(command.PRIORITY_BULK)
+        lock.release(first)
+        self.assertFalse(lock.take(second))
+        self.assertTrue(lock.take(first))
+
+
+class MailboxTest(unittest.TestCase):
+
+    # Hubs on one line share a device, frames are routed by source
+    def setUp(self):
+        logging.getLogger('energo').addHandler(logging.NullHandler())
+        self.emulator = emulator.Emulator([0x2f01, 0x2f02], capacity=8,
+                                          seed=1)
+        self.path = self.emulator.start()
+        self.device = device.Device(self.path)
+        self.device.open()
+        self.first = mercury.Hub(None, 0x2f01, transport=self.device)
+        self.second = mercury.Hub(None, 0x2f02, transport=self.device)
+
+    def tearDown(self):
+        self.device.close()
+        self.emulator.stop()
+
+    def _reply(self, address):
+        octets = command.encode_frame(address, 0xffff, 0x86,
+                                      struct.pack('<H', address))
+        self.emulator._write(octets)
+        return octets
+
+    def test_routing(self):
+        # Frame of the other hub received meanwhile waits in its mailbox
+        other = self._reply(0x2f02)
+        first = self.device.channel(self.first)
+        cmd = command.GetNetworkID()
+        cmd.source, cmd.destination = 0xffff, 0x2f01
+        first.write(cmd.request)
+        self.assertEqual(first.read_some(timeout=1),
+                         command.encode_frame(0x2f01, 0xffff, 0x86,
+                                              struct.pack('<H', 0x2f01)))
+        second = self.device.channel(self.second)
+        self.assertEqual(second.read_some(timeout=0), other)
+
+    def test_owner(self):
+        # Frames belong to the owner of the bus while it is held
+        self.device.acquire(self)
+        octets = self._reply(0x2f02)
+        self.device._pump(1)
+        self.assertEqual(self.device.take(0x2f02, self.second), None)
+        self.device.release()
+        self.assertEqual(self.device.take(0x2f02, self.second).octets,
+                         octets)
+
+    def test_threads(self):
+        # Hubs polled from threads get their own replies only
+        results = {}
+
+        def poll(hub):
+            results[hub.address] = [hub.execute(command.GetNetworkID())
+                                    for x in xrange(100)]
+
+        workers = [threading.Thread(target=poll, args=(x,))
+                   for x in (self.first, self.second)]
+        for worker in workers:
+            worker.start()
+        for worker in workers:
+            worker.join()
+        self.assertEqual(results, {0x2f01: [0x2f01] * 100,
+                                   0x2f02: [0x2f02] * 100})
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,123 @@
+__author__ = 'Gennady Kovalev <gik@bigur.ru>'
+__copyright__ = '(c) 2015-2016 Business group for development management'
+__licence__ = 'GPL'
+
+import struct
+import logging
+import unittest
+
+import mercury
+import mercury.command as command
+import mercury.decoder as decoder
+import mercury.emulator as emulator
+
+
+class Port(object):
+
+    # Line to the emulated hub without a port. Replies of requests with
+    # numbers in late come after the hub stopped waiting for them. Number
+    # of drain reads before every request is kept in drains.
+    __timeout__ = 0.05
+
+    def __init__(self):
+        self.emulator = emulator.Emulator(0x2f01, capacity=8, seed=1)
+        self.late = set()
+        self.drains = []
+        self.line = ''
+        self._held = ''
+        self._drained = 0
+        self._decoder = decoder.FrameDecoder()
+
+    def open(self):
+        pass
+
+    def is_open(self):
+        return True
+
+    def configure(self):
+        pass
+
+    def close(self):
+        pass
+
+    def write(self, octets):
+        self.drains.append(self._drained)
+        self._drained = 0
+        self._decoder.feed(octets)
+        for frame in self._decoder:
+            code, data = self.emulator.handle(frame.code, frame.data)
+            reply = command.encode_frame(0x2f01, frame.src, code, data)
+            if len(self.drains) in self.late:
+                self._held += reply
+            else:
+                self.line += reply
+        return len(octets)
+
+    def readinto(self, buffer, timeout=None):
+        if not timeout:
+            self._drained += 1
+        elif not self.line and self._held:
+            # The hub gives up now, the reply comes right after
+            self.line, self._held = self._held, ''
+            return 0
+        octets = self.line[:len(buffer)]
+        self.line = self.line[len(octets):]
+        buffer[:len(octets)] = octets
+        return len(octets)
+
+
+def history(counter):
+    # Expected result, from a hub of its own
+    hub = mercury.Hub(None, 0x2f01, transport=Port())
+    return hub.execute(command.GetHistory(counter))
+
+
+class ExecuteManyTest(unittest.TestCase):
+
+    def setUp(self):
+        logging.getLogger('energo').addHandler(logging.NullHandler())
+        self.port = Port()
+        self.hub = mercury.Hub(None, 0x2f01, transport=self.port, retries=0)
+
+    def test_execute(self):
+        # Every single command drains the line first
+        self.hub.execute(command.GetConfig())
+        self.hub.execute(command.GetConfig())
+        self.assertEqual(self.port.drains, [1, 1])
+
+    def test_drain_once(self):
+        # Batch drains before the first command only
+        results = list(self.hub.execute_many(command.GetHistory(x)
+                                             for x in xrange(4)))
+        self.assertEqual(results, [history(x) for x in xrange(4)])
+        self.assertEqual(self.port.drains, [1, 0, 0, 0])
+
+    def test_stale(self):
+        # Reply left on the line is not taken for the answer
+        self.port.line = command.encode_frame(0x2f01, 0xffff, 0x80,
+                                              struct.pack('<HB', 999, 0))
+        result = self.hub.execute(command.GetConfig())
+        self.assertEqual(result['counters'], 8)
+        self.assertEqual(self.port.line, '')
+
+    def test_late(self):
+        # After a timeout the late reply is drained before the next command
+        self.port.late = set([2])
+        results = list(self.hub.execute_many(
+                        (command.GetHistory(x) for x in xrange(4)),
+                        errors=True))
+        self.assertTrue(isinstance(results[1], mercury.NoResponseError))
+        self.assertEqual([results[0]] + results[2:],
+                         [history(x) for x in (0, 2, 3)])
+        self.assertEqual(self.port.drains, [1, 0, 2, 0])
+
+    def test_late_raises(self):
+        self.port.late = set([2])
+        results = self.hub.execute_many(command.GetHistory(x)
+                                        for x in xrange(4))
+        self.assertEqual(next(results), history(0))
+        self.assertRaises(mercury.NoResponseError, next, results)
+
+
+if __name__ == '__main__':
+    unittest.main()
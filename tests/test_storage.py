@@ -0,0 +1,185 @@
+__author__ = 'Gennady Kovalev <gik@bigur.ru>'
+__copyright__ = '(c) 2015-2016 Business group for development management'
+__licence__ = 'GPL'
+
+import os
+import shutil
+import sqlite3
+import tempfile
+import datetime
+import unittest
+
+import mercury.command as command
+import mercury.storage as storage
+
+
+# Table as created by mercury_cli before schema versions
+SQL_CREATE_BASELINE = '''\
+CREATE TABLE IF NOT EXISTS data (
+  hub INTEGER NOT NULL,
+  counter INTEGER NOT NULL,
+  level INTEGER NOT NULL,
+  type INTEGER NOT NULL,
+  date DATETIME NOT NULL,
+  value INTEGER NOT NULL,
+  exported BOOL NOT NULL DEFAULT 0);'''
+
+SQL_INSERT_BASELINE = '''\
+INSERT INTO
+  data (hub, counter, level, type, date, value, exported)
+VALUES
+  (?, ?, ?, ?, ?, ?, ?)'''
+
+# Rows of the old tool: the same value seen twice in January is a
+# duplicate, only its latest date is kept
+BASELINE_ROWS = [
+    (0x2f01, 1, 3, 1, '2016-01-10 00:00:00', 100, 1),
+    (0x2f01, 1, 3, 1, '2016-01-31 23:59:00', 100, 0),
+    (0x2f01, 1, 3, 1, '2016-02-29 23:59:00', 150, 0),
+    (0x2f01, 1, 3, 1, '2016-03-31 23:59:00', 210, 1),
+    (0x2f01, 2, 0, 1, '2016-03-31 23:59:00', 7, 0),
+]
+
+
+def reading(date, value, dtype=1, level=3):
+    return command.Reading(level, dtype, date, value)
+
+
+class StorageTestCase(unittest.TestCase):
+
+    def setUp(self):
+        self.directory = tempfile.mkdtemp()
+        self.path = os.path.join(self.directory, 'mercury.db')
+
+    def tearDown(self):
+        shutil.rmtree(self.directory)
+
+
+class MigrationTest(StorageTestCase):
+
+    def setUp(self):
+        super(MigrationTest, self).setUp()
+        db = sqlite3.connect(self.path)
+        db.execute(SQL_CREATE_BASELINE)
+        db.executemany(SQL_INSERT_BASELINE, BASELINE_ROWS)
+        db.commit()
+        db.close()
+
+    def test_version(self):
+        db = storage.connect(self.path)
+        self.assertEqual(storage.schema_version(db),
+                         len(storage.MIGRATIONS))
+        db.close()
+
+        # Migrated database is opened without changes
+        db = storage.connect(self.path)
+        self.assertEqual(storage.schema_version(db),
+                         len(storage.MIGRATIONS))
+        self.assertEqual(db.execute('PRAGMA journal_mode').fetchone()[0],
+                         'wal')
+        db.close()
+
+    def test_rows(self):
+        db = storage.connect(self.path)
+        rows = db.execute('SELECT id, counter, date, value, exported '
+                          'FROM data ORDER BY id').fetchall()
+        self.assertEqual([x[1:] for x in rows],
+                         [(1, '2016-01-31 23:59:00', 100, 0),
+                          (1, '2016-02-29 23:59:00', 150, 0),
+                          (1, '2016-03-31 23:59:00', 210, 1),
+                          (2, '2016-03-31 23:59:00', 7, 0)])
+        self.assertTrue(all(x[0] is not None for x in rows))
+
+    def test_rollups(self):
+        db = storage.connect(self.path)
+        rows = db.execute('SELECT counter, month, value, delta FROM rollup '
+                          'ORDER BY counter, month').fetchall()
+        self.assertEqual(rows, [(1, '2016-01', 100, None),
+                                (1, '2016-02', 150, 50),
+                                (1, '2016-03', 210, 60),
+                                (2, '2016-03', 7, None)])
+
+    def test_newer(self):
+        db = sqlite3.connect(self.path)
+        db.execute('PRAGMA user_version = {}'.format(
+                                            len(storage.MIGRATIONS) + 1))
+        db.close()
+        self.assertRaises(storage.StorageError, storage.connect, self.path)
+
+
+class IngestionTest(StorageTestCase):
+
+    def setUp(self):
+        super(IngestionTest, self).setUp()
+        self.db = storage.connect(self.path)
+        self.history = storage.History(self.db, 0x2f01)
+
+    def tearDown(self):
+        self.db.close()
+        super(IngestionTest, self).tearDown()
+
+    def _rows(self):
+        return self.db.execute('SELECT type, date, value FROM data '
+                               'ORDER BY date').fetchall()
+
+    def test_store(self):
+        history = [reading(datetime.datetime(2016, 1, 31, 23, 59), 100),
+                   reading(datetime.datetime(2016, 2, 29, 23, 59), 150),
+                   reading(datetime.datetime(2016, 3, 1), None),
+                   reading(None, 170)]
+        self.assertEqual(self.history.store(1, history), 2)
+        self.db.commit()
+        self.assertEqual(self._rows(), [(1, '2016-01-31 23:59:00', 100),
+                                        (1, '2016-02-29 23:59:00', 150)])
+
+        # The same history writes nothing
+        self.assertEqual(self.history.store(1, history), 0)
+
+    def test_moved(self):
+        # The same value seen later in the month moves its record
+        self.history.store(1, [reading(datetime.datetime(2016, 3, 5), 200)])
+        self.assertEqual(self.history.store(
+                        1, [reading(datetime.datetime(2016, 3, 9), 200,
+                                    level=5)]), 1)
+        self.assertEqual(self.history.store(
+                        1, [reading(datetime.datetime(2016, 3, 7), 200)]), 0)
+        self.db.commit()
+        self.assertEqual(self._rows(), [(1, '2016-03-09 00:00:00', 200)])
+        self.assertEqual(self.db.execute('SELECT level FROM data').fetchone(),
+                         (5,))
+
+    def test_rollup(self):
+        self.history.store(1, [reading(datetime.datetime(2016, 1, 31), 100),
+                               reading(datetime.datetime(2016, 2, 10), 120)])
+        self.history.store(1, [reading(datetime.datetime(2016, 2, 20), 130)])
+        self.db.commit()
+        rows = self.db.execute('SELECT month, date, value, delta FROM rollup '
+                               'ORDER BY month').fetchall()
+        self.assertEqual(rows, [('2016-01', '2016-01-31 00:00:00', 100, None),
+                                ('2016-02', '2016-02-20 00:00:00', 130, 30)])
+
+    def test_snapshot(self):
+        # Ingestion commits while a reader is in the middle of its
+        # transaction, the reader keeps its snapshot
+        self.db.execute('PRAGMA busy_timeout = 100')
+        self.history.store(1, [reading(datetime.datetime(2016, 1, 31), 100)])
+        self.db.commit()
+
+        reader = storage.connect(self.path)
+        reader.isolation_level = None
+        try:
+            reader.execute('BEGIN')
+            count = 'SELECT COUNT(*) FROM data'
+            self.assertEqual(reader.execute(count).fetchone(), (1,))
+            self.history.store(1, [reading(datetime.datetime(2016, 2, 29),
+                                           150)])
+            self.db.commit()
+            self.assertEqual(reader.execute(count).fetchone(), (1,))
+            reader.execute('COMMIT')
+            self.assertEqual(reader.execute(count).fetchone(), (2,))
+        finally:
+            reader.close()
+
+
+if __name__ == '__main__':
+    unittest.main()